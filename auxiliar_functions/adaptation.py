@@ -0,0 +1,234 @@
+"""
+Persistent NUTS adaptation, reused when a model is refitted to updated
+data.
+
+The warmup of NUTS tunes a step size and a (diagonal) inverse metric,
+and brings the chains to the typical set. When the same model is
+refitted to a catalog which has only grown a little, all three are
+nearly the same as in the previous run. After each run, save() stores
+them, keyed by the model and by the names and number of dimensions of
+its data; reuse() then starts the next run from the last position of
+each chain, with the saved step size and metric and adaptation switched
+off, so the warmup is only a short burn-in.
+
+The saved state is stale, and the full warmup is run, when the number
+of parameters differs or when any data entry changed beyond TOLERANCE:
+its size by more than that fraction, or its mean by more than that many
+standard deviations, or its standard deviation by more than that
+fraction.
+
+Environment variables:
+
+    BMAD_ADAPT_CACHE      directory of the saved adaptations
+                          (default: ~/.cache/bmad/adaptation)
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stan_cache import _Lock, _read, _write, model_hash
+
+
+ADAPT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bmad', 'adaptation')
+
+TOLERANCE = 0.2                             # relative change of the data
+WARMUP = 100                                # burn-in when reusing
+
+
+def data_summary(data):
+    """
+    Shape, mean and standard deviation of every numeric data entry.
+
+    input: data -> dict, data for the model
+
+    output: dict, name -> (shape, mean, sd)
+    """
+
+    summary = {}
+    for name in sorted(data):
+        try:
+            values = np.asarray(data[name], dtype=float)
+        except (TypeError, ValueError):
+            continue
+        if values.size:
+            summary[name] = (values.shape, float(values.mean()), float(values.std()))
+        else:
+            summary[name] = (values.shape, 0.0, 0.0)
+
+    return summary
+
+
+def signature(model, data):
+    """Key of a model and of the structure (names, dimensions) of its data."""
+
+    structure = ['%s:%d' % (name, len(shape))
+                 for name, (shape, mean, sd) in sorted(data_summary(data).items())]
+
+    return hashlib.sha256('\n'.join([model_hash(model.model_code)] + structure)
+                          .encode('utf-8')).hexdigest()
+
+
+def is_stale(old, new, tolerance=TOLERANCE):
+    """
+    True if the data changed too much for a saved adaptation to apply.
+
+    input: old, new -> dict, data summaries (see data_summary)
+           tolerance -> float, largest accepted relative change
+
+    output: bool
+    """
+
+    if set(old) != set(new):
+        return True
+
+    for name in new:
+        shape0, mean0, sd0 = old[name]
+        shape1, mean1, sd1 = new[name]
+        if len(shape0) != len(shape1):
+            return True
+        if any(abs(n1 - n0) > tolerance * max(n0, 1) for n0, n1 in zip(shape0, shape1)):
+            return True
+        if abs(mean1 - mean0) > tolerance * (sd0 if sd0 > 0 else max(abs(mean0), 1.0)):
+            return True
+        if sd0 > 0 and abs(sd1 - sd0) > tolerance * sd0:
+            return True
+
+    return False
+
+
+def _path(model, data, cache_dir=None):
+    cache_dir = cache_dir or os.environ.get('BMAD_ADAPT_CACHE', ADAPT_DIR)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+
+    return os.path.join(cache_dir, signature(model, data) + '.pkl')
+
+
+def last_position(fit):
+    """
+    Last draw of every chain, as initial values. Unlike
+    fit.get_last_position(), only the parameters stored in the fit are
+    used, so it also works with fits sampled with pars.
+
+    output: list of dict, parameter name -> value, one per chain
+    """
+
+    sim = fit.sim
+    positions = []
+    for sample in sim['samples']:
+        position, i = {}, 0
+        for name, dims in zip(sim['pars_oi'], sim['dims_oi']):
+            n = int(np.prod(dims))
+            values = [sample['chains'][flat][-1] for flat in sim['fnames_oi'][i:i + n]]
+            if name != 'lp__':
+                position[name] = (np.array(values).reshape(dims, order='F') if len(dims)
+                                  else values[0])
+            i += n
+        positions.append(position)
+
+    return positions
+
+
+def adapted(fit):
+    """
+    Adaptation of a fit: step size (median over chains), inverse metric
+    (averaged over chains) and last position of each chain.
+
+    input: fit -> pystan StanFit4Model, sampled with the NUTS diag_e metric
+
+    output: dict with keys 'stepsize', 'inv_metric', 'positions'
+    """
+
+    return {'stepsize': float(np.median(fit.get_stepsize())),
+            'inv_metric': np.mean([np.asarray(m) for m in fit.get_inv_metric()], axis=0),
+            'positions': last_position(fit)}
+
+
+def restart(state, kwargs, iter, warmup=0):
+    """
+    Sampling arguments which continue from an adaptation, with adaptation
+    switched off.
+
+    input: state -> dict, see adapted
+           kwargs -> dict, arguments for StanModel.sampling
+           iter, warmup -> int, iterations of the new run
+
+    output: dict, the new arguments
+    """
+
+    kwargs = dict(kwargs, iter=iter, warmup=warmup)
+    kwargs['init'] = [state['positions'][i % len(state['positions'])]
+                      for i in range(kwargs.get('chains', 4))]
+    kwargs['control'] = dict(kwargs.get('control') or {}, adapt_engaged=False,
+                             stepsize=state['stepsize'],
+                             inv_metric=state['inv_metric'])
+
+    return kwargs
+
+
+def save(fit, model, data, cache_dir=None):
+    """
+    Store the adaptation of a fit (see adapted).
+
+    input: fit -> pystan StanFit4Model, sampled with the NUTS diag_e metric
+           model -> pystan.StanModel
+           data -> dict, data of the fit
+           cache_dir -> str, directory of the saved adaptations
+    """
+
+    state = dict(adapted(fit), data=data_summary(data))
+
+    path = _path(model, data, cache_dir)
+    with _Lock(path[:-4] + '.lock'):
+        _write(state, path)
+
+
+def load(model, data, cache_dir=None, tolerance=TOLERANCE):
+    """
+    Saved adaptation of a model for this data, or None if there is none
+    or it is stale.
+
+    output: dict with keys 'stepsize', 'inv_metric', 'positions', 'data'
+    """
+
+    path = _path(model, data, cache_dir)
+    state = _read(path) if os.path.isfile(path) else None
+    if state is None or is_stale(state['data'], data_summary(data), tolerance):
+        return None
+
+    # the data may also change the number of parameters
+    fit = model.sampling(data=data, iter=1, chains=1, algorithm='Fixed_param')
+    if len(fit.unconstrained_param_names()) != len(state['inv_metric']):
+        return None
+
+    return state
+
+
+def reuse(model, data, kwargs, warmup=WARMUP, cache_dir=None, tolerance=TOLERANCE):
+    """
+    Sampling arguments which reuse a saved adaptation, keeping the number
+    of draws after warmup.
+
+    input: model -> pystan.StanModel
+           data -> dict, data for the model
+           kwargs -> dict, arguments for StanModel.sampling
+           warmup -> int, burn-in iterations, with adaptation switched off
+           cache_dir -> str, directory of the saved adaptations
+           tolerance -> float, see is_stale
+
+    output: tuple of dict (the new arguments, or kwargs unchanged if
+            there is no usable saved adaptation) and bool (reused)
+    """
+
+    state = load(model, data, cache_dir, tolerance)
+    if state is None:
+        return kwargs, False
+
+    iterations = kwargs.get('iter', 2000)
+    draws = iterations - kwargs.get('warmup', iterations // 2)
+
+    return restart(state, kwargs, draws + warmup, warmup), True
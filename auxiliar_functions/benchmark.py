@@ -0,0 +1,146 @@
+"""
+Tools for timing Stan programs.
+
+The speed of a program is measured as the number of evaluations of the
+gradient of its log-density per second, at a fixed point of the
+unconstrained parameter space. This isolates the cost of the model block
+from the behaviour of the sampler, and is what determines the wall time
+of NUTS for a fixed number of leapfrog steps.
+
+Changes of parameterization do not make a gradient cheaper, they make
+the posterior easier to explore; they are measured with ess_rate, which
+runs the sampler.
+"""
+
+import ast
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stan_cache import compile_model
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stan_program(script, name='stan_code'):
+    """
+    Read a Stan program from one of the book scripts without running it.
+
+    input: script -> str, path relative to the repository root
+                     (e.g. 'chapter_7/code_7.8.py')
+           name -> str, name of the variable holding the program
+
+    output: str, Stan program
+    """
+
+    with open(os.path.join(ROOT, script)) as f:
+        tree = ast.parse(f.read())
+
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id == name:
+                    return ast.literal_eval(node.value)
+
+    raise ValueError('%s not found in %s' % (name, script))
+
+
+def gradient_rate(model, data, min_time=2.0, seed=42):
+    """
+    Number of gradient evaluations per second.
+
+    input: model -> pystan.StanModel or str (Stan program)
+           data -> dict, data for the model
+           min_time -> float, minimum duration of the measurement, in seconds
+           seed -> int, seed of the evaluation point
+
+    output: float, gradient evaluations per second
+    """
+
+    if not hasattr(model, 'sampling'):
+        model = compile_model(model)
+
+    fit = model.sampling(data=data, iter=1, chains=1, seed=seed,
+                         algorithm='Fixed_param')
+
+    # same point as Stan's default initialization
+    npars = len(fit.unconstrained_param_names())
+    upars = np.random.RandomState(seed).uniform(-2, 2, size=npars)
+
+    fit.grad_log_prob(upars)                    # warm up
+
+    n, elapsed = 0, 0.0
+    start = time.time()
+    while elapsed < min_time:
+        for i in range(10):
+            fit.grad_log_prob(upars)
+        n += 10
+        elapsed = time.time() - start
+
+    return n / elapsed
+
+
+def ess_rate(model, data, pars, iter=2000, seed=42):
+    """
+    Smallest effective sample size of some parameters per second of
+    sampling (one chain, half of the iterations warmup, no compilation).
+
+    input: model -> pystan.StanModel or str (Stan program)
+           data -> dict, data for the model
+           pars -> list of str, parameters whose n_eff is considered
+           iter -> int, number of iterations
+           seed -> int, seed of the chain
+
+    output: tuple of (ESS/s, ESS, seconds, number of divergent transitions)
+    """
+
+    if not hasattr(model, 'sampling'):
+        model = compile_model(model)
+
+    start = time.time()
+    fit = model.sampling(data=data, iter=iter, chains=1, seed=seed)
+    elapsed = time.time() - start
+
+    summary = fit.summary(pars=pars)
+    n_eff = summary['summary'][:, list(summary['summary_colnames']).index('n_eff')]
+    divergent = int(sum(np.sum(chain['divergent__'])
+                        for chain in fit.get_sampler_params(inc_warmup=False)))
+
+    return np.min(n_eff) / elapsed, np.min(n_eff), elapsed, divergent
+
+
+def compare(programs, datasets, min_time=2.0):
+    """
+    Print the gradient evaluations per second of several programs over
+    several data sets, and the speedup of each program relative to the
+    first one.
+
+    input: programs -> list of (label, Stan program or StanModel, data function)
+                       the data function receives a data set and returns
+                       the data dictionary of that program
+           datasets -> list of (label, data set)
+           min_time -> float, minimum duration of each measurement
+
+    output: dict, rates[(program label, data set label)]
+    """
+
+    rates = {}
+    models = [(label, model if hasattr(model, 'sampling') else compile_model(model),
+               make_data) for label, model, make_data in programs]
+
+    print('%-12s' % 'data' + ''.join('%23s' % label for label, m, d in models))
+    for dlabel, dataset in datasets:
+        row = '%-12s' % dlabel
+        for label, model, make_data in models:
+            rate = gradient_rate(model, make_data(dataset), min_time)
+            rates[(label, dlabel)] = rate
+
+            base = rates[(models[0][0], dlabel)]
+            row += '%13.1f/s (x%4.1f)' % (rate, rate / base)
+        print(row)
+
+    return rates
@@ -0,0 +1,124 @@
+"""
+Compression of regression data into sufficient statistics.
+
+When the design matrix has few distinct rows, the likelihood of a
+regression depends on the data only through a summary per covariate
+pattern, and the model can be fitted to one row per pattern instead of
+one row per observation:
+
+    bernoulli     number of successes and of trials per pattern
+                  (fitted as a binomial)
+    binomial      summed successes and trials per pattern
+    poisson       summed counts per pattern, with the number of
+                  observations (or the summed exposures) as exposure
+    normal        number of observations and mean response per pattern,
+                  plus the total within-pattern sum of squares
+    lognormal     as normal, for the logarithm of the response
+
+The compressed likelihood equals the original one up to a constant, so
+the posterior is unchanged, while the cost of every log-density
+evaluation scales with the number of patterns instead of N. The matching
+Stan programs are generated by stan_models.glm_code(..., compressed=True).
+"""
+
+import numpy as np
+
+
+# family of the compressed data -> family of the program that fits it
+FAMILIES = {'bernoulli': 'binomial',
+            'binomial': 'binomial',
+            'poisson': 'poisson',
+            'normal': 'normal',
+            'lognormal': 'lognormal'}
+
+
+def patterns(X, group=None):
+    """
+    Distinct covariate patterns of a design matrix.
+
+    input: X -> array, design matrix (N x K)
+           group -> array, group labels; observations of different
+                    groups never share a pattern
+
+    output: tuple of
+            array, distinct rows of X (P x K)
+            array, group label of each pattern (None if group is None)
+            array, pattern of each observation (N), in 0..P-1
+            array, number of observations of each pattern (P)
+    """
+
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+
+    if group is None:
+        rows, index, counts = np.unique(X, axis=0, return_inverse=True,
+                                        return_counts=True)
+        return rows, None, index.ravel(), counts
+
+    labels, codes = np.unique(group, return_inverse=True)
+    keys = np.column_stack((codes, X))
+    rows, index, counts = np.unique(keys, axis=0, return_inverse=True,
+                                    return_counts=True)
+
+    return rows[:, 1:], labels[rows[:, 0].astype(int)], index.ravel(), counts
+
+
+def compress(X, Y, family, group=None, trials=None, exposure=None):
+    """
+    Aggregate observations sharing the same covariate pattern.
+
+    input: X -> array, design matrix (N x K)
+           Y -> array, response variable
+           family -> str, response distribution (see FAMILIES)
+           group -> array, group labels for the random intercept
+           trials -> array, number of trials (binomial family only)
+           exposure -> array, exposure of each observation
+                       (poisson family only, default 1)
+
+    output: dict with keys
+            'family' -> str, family of the program fitting the data
+            'X' -> array, distinct covariate patterns (P x K)
+            'group' -> array, group label of each pattern, or None
+            'Y' -> array, summed successes/counts or mean (log) response
+            'trials' -> array, summed trials (bernoulli, binomial)
+            'exposure' -> array, summed exposure (poisson)
+            'n' -> array, number of observations (normal, lognormal)
+            'ss' -> float, within-pattern sum of squares (normal, lognormal)
+    """
+
+    if family not in FAMILIES:
+        raise ValueError('family %s cannot be compressed' % family)
+
+    rows, labels, index, counts = patterns(X, group)
+    total = lambda values: np.bincount(index, weights=values,
+                                       minlength=len(counts))
+
+    out = {'family': FAMILIES[family], 'X': rows, 'group': labels}
+    Y = np.asarray(Y, dtype=float)
+
+    if family in ('bernoulli', 'binomial'):
+        m = np.ones(len(Y)) if family == 'bernoulli' else np.asarray(trials)
+        out['Y'] = np.rint(total(Y)).astype(int)
+        out['trials'] = np.rint(total(m)).astype(int)
+
+    elif family == 'poisson':
+        t = np.ones(len(Y)) if exposure is None else np.asarray(exposure)
+        out['Y'] = np.rint(total(Y)).astype(int)
+        out['exposure'] = total(t)
+
+    else:
+        if family == 'lognormal':
+            Y = np.log(Y)
+        mean = total(Y) / counts
+        out['Y'] = mean
+        out['n'] = counts
+        out['ss'] = float(np.sum((Y - mean[index]) ** 2))
+
+    return out
+
+
+def ratio(X, group=None):
+    """Number of observations per distinct covariate pattern."""
+
+    return float(len(X)) / len(patterns(X, group)[3])
@@ -0,0 +1,140 @@
+"""
+Convergence diagnostics of MCMC draws, vectorized over parameters.
+
+The functions follow Vehtari, Gelman, Simpson, Carpenter & Buerkner
+(2021, Bayesian Analysis 16, 667), as in Stan 2.26 and later:
+
+    rhat        split R-hat of the rank-normalized draws, and of the
+                rank-normalized draws folded around the median; the
+                largest of the two
+    ess_bulk    effective sample size of the rank-normalized split chains,
+                which measures the efficiency of the centre of the
+                distribution (means, medians)
+    ess_tail    smallest effective sample size of the indicators of the
+                5% and 95% quantiles, which measures the efficiency of
+                the tails (intervals)
+
+All functions take an array of draws of shape (iterations, chains) or
+(iterations, chains, parameters) and return one value per parameter.
+Autocovariances are computed for every chain and parameter at once with
+the FFT.
+"""
+
+import numpy as np
+from scipy.stats import norm
+
+
+def _as_3d(draws):
+    draws = np.asarray(draws, dtype=float)
+    return draws.reshape(draws.shape + (1,) * (3 - draws.ndim))
+
+
+def _squeeze(values, draws):
+    return values[0] if np.ndim(draws) < 3 else values
+
+
+def split_chains(draws):
+    """Split every chain in two halves (dropping the middle draw if odd)."""
+
+    draws = _as_3d(draws)
+    half = draws.shape[0] // 2
+    return np.concatenate((draws[:half], draws[-half:]), axis=1)
+
+
+def rank_normalize(draws):
+    """
+    Normal scores of the ranks of the draws, pooled over chains, with the
+    fractional offset of Blom (1958). Ties get distinct ranks.
+    """
+
+    draws = _as_3d(draws)
+    n, m, p = draws.shape
+    flat = draws.reshape(n * m, p)
+
+    ranks = np.empty_like(flat)
+    ranks[np.argsort(flat, axis=0), np.arange(p)] = np.arange(1, n * m + 1)[:, None]
+
+    return norm.ppf((ranks - 0.375) / (n * m + 0.25)).reshape(n, m, p)
+
+
+def autocovariance(draws):
+    """
+    Autocovariance of every chain and parameter at all lags.
+
+    input: draws -> array, (iterations, chains, parameters)
+
+    output: array of the same shape, lag along the first axis
+    """
+
+    draws = _as_3d(draws)
+    n = draws.shape[0]
+    size = 2 ** int(np.ceil(np.log2(2 * n)))
+
+    centred = draws - draws.mean(axis=0)
+    spectrum = np.fft.rfft(centred, n=size, axis=0)
+    return np.fft.irfft(spectrum * np.conj(spectrum), n=size, axis=0)[:n] / n
+
+
+def _rhat(draws):
+    n = draws.shape[0]
+    W = draws.var(axis=0, ddof=1).mean(axis=0)
+    B = n * draws.mean(axis=0).var(axis=0, ddof=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(((n - 1) / n * W + B / n) / W)
+
+
+def rhat(draws):
+    """Rank-normalized split R-hat: the largest of bulk and folded."""
+
+    split = split_chains(draws)
+    folded = np.abs(split - np.median(split.reshape(-1, split.shape[2]), axis=0))
+
+    values = np.maximum(_rhat(rank_normalize(split)), _rhat(rank_normalize(folded)))
+    return _squeeze(values, draws)
+
+
+def ess(draws):
+    """
+    Effective sample size of draws which are already split, with Geyer's
+    initial monotone sequence estimator of the autocorrelation time.
+    """
+
+    draws = _as_3d(draws)
+    n, m, p = draws.shape
+
+    acov = autocovariance(draws)
+    W = acov[0].mean(axis=0) * n / (n - 1)
+    var_plus = W * (n - 1) / n + (draws.mean(axis=0).var(axis=0, ddof=1) if m > 1 else 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = 1 - (W - acov.mean(axis=1)) / var_plus
+        rho[0] = 1
+
+        # sums of pairs of lags, truncated at the first negative sum and
+        # made monotone
+        pairs = rho[:2 * (n // 2)].reshape(n // 2, 2, p).sum(axis=1)
+        positive = np.cumprod(pairs > 0, axis=0).astype(bool)
+        pairs = np.minimum.accumulate(np.where(positive, pairs, np.inf), axis=0)
+        tau = -1 + 2 * np.where(positive, pairs, 0).sum(axis=0)
+
+        values = n * m / np.maximum(tau, 1 / np.log10(n * m))
+
+    return np.where(var_plus > 0, values, np.nan)
+
+
+def ess_bulk(draws):
+    """Bulk effective sample size."""
+
+    return _squeeze(ess(rank_normalize(split_chains(draws))), draws)
+
+
+def ess_tail(draws):
+    """Tail effective sample size: the smallest of the 5% and 95% quantiles."""
+
+    split = split_chains(draws)
+    flat = split.reshape(-1, split.shape[2])
+
+    values = [ess((split <= q).astype(float))
+              for q in np.percentile(flat, [5, 95], axis=0)]
+    return _squeeze(np.fmin(*values), draws)
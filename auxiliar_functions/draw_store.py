@@ -0,0 +1,226 @@
+"""
+Out-of-core storage of MCMC draws in memory-mapped column files.
+
+A store is a directory with one .npy file per variable (parameter,
+transformed parameter or generated quantity) and a small header:
+
+    header.json     number of chains, capacity (largest number of draws
+                    per chain), number of draws written to each chain,
+                    and the name, dimensions, components and file of
+                    every variable
+    <variable>.npy  array (chains, capacity, components), the components
+                    in Stan's column-major order
+
+The files are created at their full size (sparse on most file systems)
+and the draws of each chain are written in place as they arrive, so a
+run never holds its draws in memory. open_store() maps the files again
+with numpy.memmap: reading a variable, a chain or a range of draws only
+touches those pages of the disk.
+
+stan_cache.sampling(..., store=path) fills a store while the sampler
+runs (see streaming.Stream).
+"""
+
+import json
+import os
+import re
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import posterior
+
+
+HEADER = 'header.json'
+
+
+def _variables(names):
+    """Variables and dimensions of flat names (beta[1,1], beta[2,1], ...)."""
+
+    variables = OrderedDict()
+    for i, name in enumerate(names):
+        base, bracket, index = name.partition('[')
+        entry = variables.setdefault(base, {'columns': [], 'names': [], 'dims': []})
+        entry['columns'].append(i)
+        entry['names'].append(name)
+        if bracket:
+            index = [int(j) for j in index.rstrip(']').split(',')]
+            entry['dims'] = [max(a, b) for a, b in zip(entry['dims'] or index, index)]
+
+    return variables
+
+
+def _filename(variable):
+    return re.sub(r'\W', '_', variable) + '.npy'
+
+
+class DrawStore(object):
+    """
+    Draws of the chains of one run, in memory-mapped files.
+
+    input: path -> str, directory of the store
+           mode -> str, 'r' to read, 'r+' to append draws
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, HEADER)) as f:
+            self.header = json.load(f)
+        self._arrays = {}
+
+    @classmethod
+    def create(cls, path, names, chains, capacity, dtype='float64'):
+        """
+        Create an empty store.
+
+        input: path -> str, directory of the store (created if needed)
+               names -> list of str, flat names of the stored components
+               chains -> int, number of chains
+               capacity -> int, largest number of draws per chain
+               dtype -> str, type of the stored values
+
+        output: DrawStore, open for appending
+        """
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        header = {'chains': chains, 'capacity': capacity, 'dtype': dtype,
+                  'counts': [0] * chains, 'variables': []}
+        for variable, entry in _variables(names).items():
+            shape = (chains, capacity, len(entry['columns']))
+            np.lib.format.open_memmap(os.path.join(path, _filename(variable)),
+                                      mode='w+', dtype=dtype, shape=shape).flush()
+            header['variables'].append({'name': variable, 'dims': entry['dims'],
+                                        'components': entry['names'],
+                                        'file': _filename(variable)})
+
+        store = cls.__new__(cls)
+        store.path, store.mode, store.header, store._arrays = path, 'r+', header, {}
+        store.flush()
+        return store
+
+    @property
+    def names(self):
+        """Names of the stored variables."""
+
+        return [entry['name'] for entry in self.header['variables']]
+
+    @property
+    def counts(self):
+        """Number of draws written to each chain."""
+
+        return list(self.header['counts'])
+
+    def _entry(self, name):
+        for entry in self.header['variables']:
+            if entry['name'] == name:
+                return entry
+        raise KeyError('no variable %s in the store' % name)
+
+    def array(self, name):
+        """
+        Memory map of a variable: (chains, capacity, components). Only
+        the first counts[chain] draws of each chain are written.
+        """
+
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, self._entry(name)['file']),
+                                         mmap_mode=self.mode)
+        return self._arrays[name]
+
+    def append(self, chain, names, block):
+        """
+        Write draws of one chain.
+
+        input: chain -> int, index of the chain
+               names -> list of str, flat names of the columns of block
+               block -> array, draws x columns
+        """
+
+        block = np.atleast_2d(block)
+        start = self.header['counts'][chain]
+        stop = start + block.shape[0]
+        if stop > self.header['capacity']:
+            raise ValueError('more than %d draws for chain %d'
+                             % (self.header['capacity'], chain))
+
+        for variable, entry in _variables(names).items():
+            self.array(variable)[chain, start:stop] = block[:, entry['columns']]
+        self.header['counts'][chain] = stop
+
+    def flush(self):
+        """Write the mapped pages and the header to disk."""
+
+        for values in self._arrays.values():
+            values.flush()
+        temporary = os.path.join(self.path, HEADER + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(self.header, f)
+        os.replace(temporary, os.path.join(self.path, HEADER))
+
+    def draws(self, name, chains=None, start=0, stop=None, components=None):
+        """
+        Draws of a variable, without copying.
+
+        input: name -> str, variable
+               chains -> slice or list of int, chains (default: all)
+               start, stop -> int, range of draws of every chain (default:
+                              all the draws written to every chain)
+               components -> slice or list of int, flat components
+
+        output: array (chains, draws, components), a view of the file
+                (a copy if chains or components are lists)
+        """
+
+        if stop is None:
+            stop = min(self.header['counts'])
+        values = self.array(name)[:, start:stop]
+        if chains is not None:
+            values = values[chains]
+        if components is not None:
+            values = values[:, :, components]
+
+        return values
+
+    def extract(self, name):
+        """
+        Draws of a variable pooled over chains, shaped as its
+        dimensions: (draws, *dims), as fit.extract(permuted=False) joined
+        chain after chain. This copies the draws of that variable.
+        """
+
+        dims = self._entry(name)['dims']
+        values = self.draws(name)
+        values = values.reshape(-1, values.shape[2])
+        if not dims:
+            return values[:, 0]
+
+        # components are column-major: reverse the dimensions, then the axes
+        values = values.reshape((-1,) + tuple(reversed(dims)))
+        return values.transpose([0] + list(range(len(dims), 0, -1)))
+
+    def summary(self, pars=None, probs=posterior.PROBS):
+        """
+        Posterior summary of some variables (see posterior.summary).
+
+        input: pars -> list of str, variables (default: all)
+               probs -> tuple of float, quantiles
+
+        output: pandas DataFrame
+        """
+
+        pars = pars or self.names
+        names = sum((self._entry(name)['components'] for name in pars), [])
+        values = np.concatenate([self.draws(name) for name in pars], axis=2)
+
+        return posterior.table(names, values.transpose(1, 0, 2), probs)
+
+
+def open_store(path, mode='r'):
+    """Open a store written by DrawStore.create (see DrawStore)."""
+
+    return DrawStore(path, mode)
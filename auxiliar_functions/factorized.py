@@ -0,0 +1,190 @@
+"""
+Sampling of posteriors which factorize into independent parts.
+
+When the parameters of a model split into groups which share no term of
+the likelihood and have independent priors, the posterior is the product
+of the posteriors of each group, and each part can be sampled by its own,
+smaller Stan program. The hurdle models are the main case: the
+logistic part (gamma) uses the zero indicator of every observation, and
+the positive part (beta and the scale/shape) uses the positive values
+only.
+
+sample() runs the parts concurrently and returns a MergedFit, whose draw
+i joins draw i of every part. Since the parts are independent, these are
+draws from the joint posterior, and the result matches the joint fit up
+to Monte Carlo error.
+"""
+
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stan_cache import compile_model, sampling
+
+
+def _rename(name, names):
+    """Name of a parameter (or of one of its elements) after renaming."""
+
+    base, bracket, index = name.partition('[')
+    return names.get(base, base) + bracket + index
+
+
+class MergedFit(object):
+    """
+    Draws of several independent parts of one posterior.
+
+    The parts must be sampled with the same number of chains, iterations,
+    warmup and thinning. lp__ of the merged posterior is the sum of lp__
+    of the parts.
+
+    input: fits -> list of pystan StanFit4Model, one per part
+           names -> list of dict, renaming of the parameters of each part
+                    (e.g. {'beta': 'gamma'}), or None
+           order -> list of str, parameter names in the order of the
+                    joint model; parameters not listed come last
+    """
+
+    def __init__(self, fits, names=None, order=None):
+        self.fits = list(fits)
+        self.names = [n or {} for n in (names or [None] * len(self.fits))]
+        self.order = list(order or [])
+
+        sims = [fit.sim for fit in self.fits]
+        keys = ['chains', 'iter', 'warmup', 'thin']
+        if any([sim[key] for key in keys] != [sims[0][key] for key in keys]
+               for sim in sims):
+            raise ValueError('the parts were sampled with different settings')
+
+    def _rank(self, name):
+        base = name.partition('[')[0]
+        return self.order.index(base) if base in self.order else len(self.order)
+
+    @property
+    def model_name(self):
+        return ' + '.join(fit.model_name for fit in self.fits)
+
+    def extract(self, pars=None):
+        """
+        Permuted post-warmup draws, as pystan's extract(permuted=True).
+
+        input: pars -> list of str, parameters to extract (default: all,
+                       and lp__)
+
+        output: OrderedDict, parameter name -> array of draws
+        """
+
+        draws = {}
+        for fit, names in zip(self.fits, self.names):
+            for name, values in fit.extract().items():
+                name = _rename(name, names)
+                if name == 'lp__':
+                    draws[name] = draws.get(name, 0) + values
+                elif pars is None or name in pars:
+                    draws[name] = values
+        if pars is not None and 'lp__' not in pars:
+            draws.pop('lp__', None)
+
+        keys = sorted(draws, key=lambda name: (name == 'lp__', self._rank(name)))
+        return OrderedDict((name, draws[name]) for name in keys)
+
+    def summary(self, pars=None, probs=(0.025, 0.25, 0.5, 0.75, 0.975)):
+        """
+        Summary statistics of every part, as pystan's summary(). Rhat and
+        n_eff are those of each part; lp__ is not included.
+
+        input: pars -> list of str, parameters to summarize (default: all)
+               probs -> tuple of float, quantiles
+
+        output: dict with keys 'summary', 'summary_rownames' and
+                'summary_colnames'
+        """
+
+        rows, values, colnames = [], [], None
+        for fit, names in zip(self.fits, self.names):
+            part = fit.summary(probs=probs)
+            colnames = part['summary_colnames']
+            for name, row in zip(part['summary_rownames'], part['summary']):
+                name = _rename(name, names)
+                if name == 'lp__' or (pars is not None and
+                                      name.partition('[')[0] not in pars):
+                    continue
+                rows.append(name)
+                values.append(row)
+
+        index = sorted(range(len(rows)), key=lambda i: self._rank(rows[i]))
+        return {'summary': np.array([values[i] for i in index]),
+                'summary_rownames': np.array([rows[i] for i in index]),
+                'summary_colnames': colnames}
+
+    def __str__(self):
+        sim = self.fits[0].sim
+        per_chain = sim['n_save'][0] - sim['warmup2'][0]
+        summary = self.summary()
+        colnames = list(summary['summary_colnames'])
+
+        table = [[''] + colnames]
+        for name, row in zip(summary['summary_rownames'], summary['summary']):
+            table.append([name] + ['%d' % value if column == 'n_eff' and
+                                   np.isfinite(value) else '%.2f' % value
+                                   for column, value in zip(colnames, row)])
+        widths = [max(len(line[i]) for line in table) for i in range(len(table[0]))]
+
+        lines = ['Inference for Stan model: %s.' % self.model_name,
+                 '%d chains, each with iter=%d; warmup=%d; thin=%d; '
+                 % (sim['chains'], sim['iter'], sim['warmup'], sim['thin']),
+                 'post-warmup draws per chain=%d, total post-warmup draws=%d.'
+                 % (per_chain, per_chain * sim['chains']),
+                 '']
+        for line in table:
+            lines.append(line[0].ljust(widths[0]) + ''.join(
+                cell.rjust(width + 1) for cell, width in zip(line[1:], widths[1:])))
+        lines += ['', 'Samples were drawn in %d independent parts of the '
+                  'posterior, merged draw by draw.' % len(self.fits)]
+
+        return '\n'.join(lines)
+
+    __repr__ = __str__
+
+
+def sample(parts, order=None, **kwargs):
+    """
+    Sample the independent parts of a posterior concurrently.
+
+    Each part runs its chains in its own processes (n_jobs), and the parts
+    run at the same time. Under run_scripts.py, the BMAD_N_JOBS budget is
+    shared between the parts.
+
+    input: parts -> list of (model, data) or (model, data, names) where
+                    model is a Stan program or a pystan.StanModel, data
+                    its data and names a renaming of its parameters
+           order -> list of str, parameter names in the order of the
+                    joint model
+           kwargs -> arguments passed to StanModel.sampling, the same for
+                     every part (iter, chains, warmup, thin, n_jobs, seed...)
+                     except the seed, seed + k for the k-th part, so that
+                     the parts draw independent random numbers
+
+    output: MergedFit
+    """
+
+    if 'BMAD_N_JOBS' in os.environ:
+        share = max(1, int(os.environ['BMAD_N_JOBS']) // len(parts))
+        requested = kwargs.get('n_jobs', -1)
+        kwargs['n_jobs'] = share if requested < 1 else min(requested, share)
+
+    models = [part[0] if hasattr(part[0], 'sampling') else compile_model(part[0])
+              for part in parts]
+
+    with ThreadPoolExecutor(max_workers=len(parts)) as pool:
+        seed = kwargs.pop('seed', None)
+        futures = [pool.submit(sampling, model, part[1],
+                               seed=None if seed is None else seed + k, **kwargs)
+                   for k, (model, part) in enumerate(zip(models, parts))]
+        fits = [future.result() for future in futures]
+
+    names = [part[2] if len(part) > 2 else None for part in parts]
+    return MergedFit(fits, names, order)
@@ -0,0 +1,63 @@
+"""
+Choice between the centered and non-centered parameterizations of the
+group effects of hierarchical models.
+
+A hierarchical model draws one effect per group from a common
+distribution, e.g. a[j] ~ normal(mu, sigma). Sampled as they are
+(centered), the effects and their scale form a funnel whenever the data
+of each group say little about its effect: for small sigma the effects
+are squeezed together, NUTS needs tiny steps and diverges. Sampled as
+a[j] = mu + sigma * z[j] with z[j] ~ normal(0, 1) (non-centered), the
+funnel disappears; but when every group has plenty of data the roles are
+reversed, and the non-centered posterior is the awkward one.
+
+The Stan programs of the scripts and of stan_models.py declare their
+effects with an affine transform,
+
+    vector<multiplier=(noncentered ? sigma : 1.0)>[J] a;
+
+which samples z = a / sigma when the data flag noncentered is 1 and a
+itself otherwise. The model, and its output, are the same in both cases,
+and one compiled program covers both parameterizations. noncentered()
+chooses the flag from the number of observations of each group.
+"""
+
+import numpy as np
+
+
+# smallest typical number of observations per group for which the
+# centered parameterization is used
+MIN_SIZE = 20
+
+
+def group_sizes(groups, weights=None):
+    """
+    Number of observations of each group.
+
+    input: groups -> array, group label of each observation
+           weights -> array, number of observations in each row
+                      (e.g. binomial trials), default 1
+
+    output: array, size of each group, in the order of np.unique(groups)
+    """
+
+    codes = np.unique(groups, return_inverse=True)[1].ravel()
+    return np.bincount(codes, weights=weights)
+
+
+def noncentered(groups, weights=None, min_size=MIN_SIZE):
+    """
+    Data flag selecting the parameterization of the group effects.
+
+    The effects are non-centered when the median group has fewer than
+    min_size observations, i.e. when most effects are weakly identified
+    by their own data and the prior dominates their posterior.
+
+    input: groups -> array, group label of each observation
+           weights -> array, number of observations in each row
+           min_size -> float, threshold on the median group size
+
+    output: int, 1 for non-centered effects, 0 for centered ones
+    """
+
+    return int(np.median(group_sizes(groups, weights)) < min_size)
@@ -0,0 +1,156 @@
+"""
+Summaries of selected parameters of a fit.
+
+str(fit) and fit.summary() compute the mean, quantiles, n_eff and Rhat
+of every variable stored in the fit, including thousands of
+per-observation quantities, although the scripts print only the first
+few rows. The functions below compute the statistics of the selected
+variables only, or of the first rows of the table, all columns at once:
+quantiles with one call to numpy.percentile, autocorrelations with the
+FFT (see diagnostics.py).
+
+    summary       pandas DataFrame, one row per scalar component
+    stansummary   the same as text, laid out as str(fit), so that the
+                  scripts can keep printing its first nlines lines
+
+n_eff is the bulk effective sample size and Rhat the rank-normalized
+split R-hat (Vehtari et al. 2021), so both can differ slightly from the
+values printed by pystan 2.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from diagnostics import ess, ess_bulk, rhat, split_chains
+
+
+PROBS = (0.025, 0.25, 0.5, 0.75, 0.975)
+
+
+def components(fit, pars=None):
+    """
+    Scalar components of some variables, in the order of str(fit)
+    (lp__ last).
+
+    input: fit -> pystan StanFit4Model
+           pars -> list of str, variable names (default: all, and lp__)
+
+    output: list of str
+    """
+
+    return [name for name in fit.sim['fnames_oi']
+            if pars is None or name.partition('[')[0] in pars]
+
+
+def _stack(fit, names):
+    """Post-warmup draws of scalar components: (iterations, chains, names)."""
+
+    sim = fit.sim
+    return np.stack([np.column_stack([np.asarray(sample['chains'][name])[warmup:]
+                                      for name in names])
+                     for sample, warmup in zip(sim['samples'], sim['warmup2'])],
+                    axis=1)
+
+
+def draws(fit, pars=None):
+    """
+    Post-warmup draws of some variables, not permuted.
+
+    input: fit -> pystan StanFit4Model
+           pars -> list of str, variable names (default: all but lp__)
+
+    output: tuple of list of str (names of the scalar components) and
+            array (iterations, chains, components)
+    """
+
+    names = [name for name in components(fit, pars) if name != 'lp__' or pars]
+    return names, _stack(fit, names)
+
+
+def summary(fit, pars=None, probs=PROBS, max_rows=None):
+    """
+    Posterior summary of some variables.
+
+    input: fit -> pystan StanFit4Model
+           pars -> list of str, variable names (default: all, lp__ last)
+           probs -> tuple of float, quantiles
+           max_rows -> int, summarize only the first max_rows components
+
+    output: pandas DataFrame indexed by component, with columns mean,
+            se_mean, sd, the quantiles (2.5%, ...), n_eff and Rhat
+    """
+
+    names = components(fit, pars)[:max_rows]
+    return table(names, _stack(fit, names), probs)
+
+
+def table(names, values, probs=PROBS):
+    """
+    Posterior summary of draws.
+
+    input: names -> list of str, names of the components
+           values -> array, draws (iterations, chains, components)
+           probs -> tuple of float, quantiles
+
+    output: pandas DataFrame (see summary)
+    """
+
+    flat = values.reshape(-1, values.shape[2])
+    sd = flat.std(axis=0, ddof=1)
+    frame = pd.DataFrame({'mean': flat.mean(axis=0),
+                          'se_mean': sd / np.sqrt(ess(split_chains(values))),
+                          'sd': sd}, index=names)
+    for prob, quantile in zip(probs, np.percentile(flat, 100 * np.asarray(probs), axis=0)):
+        frame['%g%%' % (100 * prob)] = quantile
+    frame['n_eff'] = ess_bulk(values)
+    frame['Rhat'] = rhat(values)
+
+    return frame
+
+
+def stansummary(fit, pars=None, probs=PROBS, max_rows=None, digits=2):
+    """
+    Text of the summary of some variables, laid out as str(fit).
+
+    For a fit which is not a pystan fit (e.g. factorized.MergedFit),
+    str(fit) is returned.
+
+    input: fit -> pystan StanFit4Model
+           pars, probs, max_rows -> see summary
+           digits -> int, decimals of the statistics
+
+    output: str
+    """
+
+    if not hasattr(fit, 'sim'):
+        return str(fit)
+
+    sim = fit.sim
+    table = summary(fit, pars, probs, max_rows)
+    per_chain = sim['n_save'][0] - sim['warmup2'][0]
+
+    rows = [[''] + list(table.columns)]
+    for name, row in table.iterrows():
+        rows.append([name] + ['%d' % value if column == 'n_eff' and np.isfinite(value)
+                              else '%.*f' % (digits, value)
+                              for column, value in row.items()])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+    lines = ['Inference for Stan model: %s.' % fit.model_name,
+             '%d chains, each with iter=%d; warmup=%d; thin=%d; '
+             % (sim['chains'], sim['iter'], sim['warmup'], sim['thin']),
+             'post-warmup draws per chain=%d, total post-warmup draws=%d.'
+             % (per_chain, per_chain * sim['chains']),
+             '']
+    for row in rows:
+        lines.append(row[0].ljust(widths[0]) + ''.join(
+            cell.rjust(width + 1) for cell, width in zip(row[1:], widths[1:])))
+    lines += ['', 'For each parameter, n_eff is the bulk effective sample size '
+              'and Rhat the rank-normalized split R-hat',
+              '(at convergence, Rhat=1).']
+
+    return '\n'.join(lines)
@@ -0,0 +1,217 @@
+"""
+Adaptive run length: sample until the chains have converged.
+
+The scripts of the book fix the number of iterations in advance, large
+enough for the worst case. sample_until() treats iter as a maximum
+instead: after the warmup, the chains are run in segments of a few
+hundred or thousand iterations, and after each segment the split R-hat
+and the bulk and tail effective sample sizes (see diagnostics.py) of the
+monitored parameters are compared with the targets. Sampling stops as
+soon as all of them are met, or when iter is reached.
+
+Each segment continues the chains of the previous one from their last
+position, with the step size and inverse metric adapted during the
+warmup and adaptation switched off (see adaptation.restart), so the
+concatenated draws are one Markov chain per chain. The draws of each
+segment are appended to the fit of the first one, which is returned:
+printing, extract() and summary() work as for a single run. Why and
+when sampling stopped is recorded in fit.sim['run_length'] (see
+report).
+
+With a checkpoint directory, the fit and the state of the run (adapted
+step size and metric, position of each chain, diagnostics so far) are
+saved after every segment, and a run restarted with the same model, data
+and settings continues after the last saved segment instead of starting
+over. Stan does not expose the state of its random number generator, so
+every segment is seeded on its own (seed + segment number, and the chain
+id): a resumed run draws exactly the same values as one which was never
+interrupted. Without targets, the run goes on to iter in segments, so
+checkpoints also serve fixed-length runs. The checkpoint also records the
+number of draws of each chain in the saved fit, from which streamed
+statistics and stores continue (see saved and streaming.Stream). The
+checkpoint is removed once the run is complete.
+
+This relies on the layout of fit.sim in pystan 2.x.
+"""
+
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from adaptation import adapted, last_position, restart, signature
+from diagnostics import ess_bulk, ess_tail, rhat
+from posterior import draws
+from stan_cache import _read, _write
+from stan_lint import parameter_names
+
+
+# default targets
+TARGETS = {'pars': None,                   # parameters block
+           'rhat': 1.01,                   # largest split R-hat
+           'ess_bulk': 400,                # smallest bulk ESS
+           'ess_tail': 400,                # smallest tail ESS
+           'segment': 1000}                # iterations per segment
+
+
+def _append(fit, segment, seed=None):
+    """Append the draws and sampler parameters of a segment to a fit."""
+
+    sim, new = fit.sim, segment.sim
+
+    # join everything first, so that a failure leaves the fit as it was
+    joined = [(OrderedDict((name, np.concatenate((sample['chains'][name],
+                                                  extra['chains'][name])))
+                           for name in sample['chains']),
+               [np.concatenate((old, added)) for old, added
+                in zip(sample['sampler_params'], extra['sampler_params'])])
+              for sample, extra in zip(sim['samples'], new['samples'])]
+
+    for i, (sample, (chains, params)) in enumerate(zip(sim['samples'], joined)):
+        sample['chains'].update(chains)
+        sample.sampler_params = params      # PyStanHolder: no item assignment
+        sim['n_save'][i] += new['n_save'][i]
+
+    sim['iter'] += new['iter']
+    rng = np.random.RandomState(seed)
+    sim['permutation'] = [rng.permutation(n - warmup) for n, warmup
+                          in zip(sim['n_save'], sim['warmup2'])]
+
+
+def _key(model, data, targets, kwargs):
+    """Identity of a run: model, data and the settings of the sampler."""
+
+    settings = [(name, kwargs.get(name)) for name in
+                ('iter', 'warmup', 'thin', 'chains', 'seed', 'pars', 'chain_id',
+                 'algorithm')]
+    text = repr([signature(model, data), settings, sorted(targets.items())])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _path(model, data, targets, checkpoint, kwargs):
+    """File of the checkpoint of a run."""
+
+    if not os.path.isdir(checkpoint):
+        os.makedirs(checkpoint, exist_ok=True)
+    return os.path.join(checkpoint, _key(model, data, targets, kwargs) + '.pkl')
+
+
+def saved(model, data=None, targets=None, checkpoint=None, **kwargs):
+    """
+    Checkpoint from which sample_until would resume a run.
+
+    input: model, data, targets, checkpoint, kwargs -> see sample_until
+
+    output: dict with keys 'fit', 'state', 'done', 'seed', 'history' and
+            'draws' (post-warmup draws of each chain in the fit), or None
+            if there is no checkpoint of this run
+    """
+
+    if checkpoint is None:
+        return None
+
+    path = _path(model, data, dict(TARGETS, **(targets or {})), checkpoint, kwargs)
+    return _read(path) if os.path.isfile(path) else None
+
+
+def sample_until(model, data=None, targets=None, checkpoint=None, **kwargs):
+    """
+    Sample in segments until the targets of convergence are met.
+
+    input: model -> pystan.StanModel
+           data -> dict, data for the model
+           targets -> dict, updates of TARGETS: 'pars' (monitored
+                      parameters), 'rhat', 'ess_bulk', 'ess_tail' and
+                      'segment' (iterations per segment); None to run
+                      up to iter without checking convergence
+           checkpoint -> str, directory of the checkpoint of the run
+           kwargs -> arguments passed to StanModel.sampling; iter is the
+                     largest number of iterations
+
+    output: pystan StanFit4Model, with the record of the run in
+            fit.sim['run_length']
+    """
+
+    monitor = targets is not None
+    targets = dict(TARGETS, **(targets or {}))
+    pars = targets['pars'] or parameter_names(model.model_code)
+    if kwargs.get('pars') is not None:      # only the stored parameters
+        pars = [name for name in pars if name in kwargs['pars']]
+
+    iterations = kwargs.get('iter', 2000)
+    warmup = kwargs.get('warmup', iterations // 2)
+    seed = kwargs.get('seed')
+    length = min(targets['segment'], iterations - warmup)
+
+    path, resumed = None, None
+    if checkpoint is not None:
+        path = _path(model, data, targets, checkpoint, kwargs)
+        resumed = _read(path) if os.path.isfile(path) else None
+
+    if resumed is not None:                 # resume after the last saved segment
+        fit, state, done = resumed['fit'], resumed['state'], resumed['done']
+        seed, history = resumed['seed'], resumed['history']
+    else:
+        if seed is None:
+            seed = np.random.randint(2 ** 31 - 1)
+        fit = model.sampling(data=data, **dict(kwargs, iter=warmup + length, seed=seed))
+        state, done, history = adapted(fit), length, []
+
+    while True:
+        if path is not None:
+            sim = fit.sim
+            _write({'fit': fit, 'state': state, 'done': done, 'seed': seed,
+                    'history': history,
+                    'draws': [n - warmup2 for n, warmup2
+                              in zip(sim['n_save'], sim['warmup2'])]}, path)
+
+        history.append({'iterations': done})
+        if monitor:
+            values = draws(fit, pars)[1]
+            history[-1].update(rhat=float(np.nanmax(rhat(values))),
+                               ess_bulk=float(np.nanmin(ess_bulk(values))),
+                               ess_tail=float(np.nanmin(ess_tail(values))))
+
+        last = history[-1]
+        if monitor and (last['rhat'] <= targets['rhat'] and
+                        last['ess_bulk'] >= targets['ess_bulk'] and
+                        last['ess_tail'] >= targets['ess_tail']):
+            reason = 'targets met'
+            break
+        if done >= iterations - warmup:
+            reason = 'maximum number of iterations reached'
+            break
+
+        length = min(targets['segment'], iterations - warmup - done)
+        state['positions'] = last_position(fit)
+        options = dict(kwargs, seed=seed + len(history))
+        if 'sample_file' in kwargs:         # one set of CSV files per segment
+            root, ext = os.path.splitext(kwargs['sample_file'])
+            options['sample_file'] = '%s-segment%d%s' % (root, len(history), ext)
+        segment = model.sampling(data=data, **restart(state, options, length))
+        _append(fit, segment, seed)
+        done += length
+
+    if path is not None:
+        os.remove(path)
+
+    fit.sim['run_length'] = {'reason': reason, 'targets': targets if monitor else None,
+                             'pars': pars, 'history': history}
+    return fit
+
+
+def report(fit):
+    """One line saying why and when sampling stopped."""
+
+    record = fit.sim['run_length']
+    last = record['history'][-1]
+    line = ('Sampling stopped after %d post-warmup iterations (%d segments): %s'
+            % (last['iterations'], len(record['history']), record['reason']))
+    if 'rhat' not in last:
+        return line + '.'
+
+    return line + ('; R-hat %.3f, bulk ESS %.0f, tail ESS %.0f.'
+                   % (last['rhat'], last['ess_bulk'], last['ess_tail']))
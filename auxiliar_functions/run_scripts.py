@@ -0,0 +1,193 @@
+"""
+Run the Python scripts of the book concurrently.
+
+Every script is started in its own process as soon as enough cores are
+free for its chains, so that the whole set finishes in about the time of
+the slowest model instead of the sum of all of them. Scripts are started
+longest first, using the wall times recorded by a previous run when they
+are available.
+
+For each script the output directory receives a sub-directory holding
+its screen output (output.log) and any file it writes. A manifest with
+the exit status, wall time and output location of every script is
+written to manifest.json.
+
+Usage:
+
+    python run_scripts.py [-o OUTDIR] [-j MAX_CHAINS] [-t TIMEOUT] [pattern ...]
+
+    pattern       glob patterns of the scripts to run, relative to the
+                  repository root (default: chapter_*/code_*.py)
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def discover(patterns=None):
+    """
+    Find the scripts to run.
+
+    input: patterns -> list of str, glob patterns relative to the
+                       repository root
+
+    output: list of str, sorted paths relative to the repository root
+    """
+
+    scripts = set()
+    for pattern in patterns or ['chapter_*/code_*.py']:
+        for path in glob.glob(os.path.join(ROOT, pattern)):
+            scripts.add(os.path.relpath(path, ROOT))
+
+    return sorted(scripts)
+
+
+def chains(script):
+    """
+    Number of chains a script runs in parallel, read from its
+    'chains=' arguments (1 if it does not call Stan).
+    """
+
+    with open(os.path.join(ROOT, script)) as f:
+        found = [int(n) for n in re.findall(r'chains\s*=\s*(\d+)', f.read())]
+
+    return max(found) if found else 1
+
+
+def _outdir(outdir, script):
+    """Output directory of a script, e.g. OUTDIR/chapter_6/code_6.8."""
+
+    return os.path.join(outdir, os.path.splitext(script)[0])
+
+
+def _previous(outdir):
+    """Wall times recorded in a previous manifest, if any."""
+
+    try:
+        with open(os.path.join(outdir, 'manifest.json')) as f:
+            return dict((item['script'], item['wall_time'])
+                        for item in json.load(f))
+    except (IOError, OSError, ValueError, KeyError):
+        return {}
+
+
+def run(scripts, outdir='bmad_output', max_chains=None, timeout=None,
+        poll=0.5):
+    """
+    Run scripts concurrently, keeping the total number of running chains
+    below max_chains.
+
+    input: scripts -> list of str, paths relative to the repository root
+           outdir -> str, output directory
+           max_chains -> int, maximum number of chains running at once
+                         (default: number of cores)
+           timeout -> float, maximum wall time of a script, in seconds
+           poll -> float, interval between checks of running scripts
+
+    output: list of dict, one manifest entry per script
+    """
+
+    outdir = os.path.abspath(outdir)
+    cores = os.cpu_count() or 1
+    max_chains = min(max_chains or cores, cores)
+
+    # longest scripts first, unknown ones before the known short ones
+    previous = _previous(outdir)
+    queue = sorted(scripts, key=lambda s: -previous.get(s, float('inf')))
+
+    manifest = {}
+    running = {}                             # script -> (process, slots, start, log)
+    free = max_chains
+
+    while queue or running:
+        # start every queued script whose chains fit in the free slots
+        for script in list(queue):
+            slots = min(chains(script), max_chains)
+            if slots > free:
+                continue
+
+            path = _outdir(outdir, script)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+            env = dict(os.environ)
+            env['BMAD_N_JOBS'] = str(slots)
+            env.setdefault('MPLBACKEND', 'Agg')      # do not block on plots
+
+            log = open(os.path.join(path, 'output.log'), 'w')
+            process = subprocess.Popen([sys.executable, os.path.join(ROOT, script)],
+                                       cwd=path, env=env, stdout=log,
+                                       stderr=subprocess.STDOUT,
+                                       start_new_session=True)
+
+            running[script] = (process, slots, time.time(), log)
+            queue.remove(script)
+            free -= slots
+
+        time.sleep(poll)
+
+        for script, (process, slots, start, log) in list(running.items()):
+            status = process.poll()
+            wall_time = time.time() - start
+
+            if status is None and timeout and wall_time > timeout:
+                # the chains of pystan are child processes of the script
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                status = process.wait()
+
+            if status is None:
+                continue
+
+            log.close()
+            free += slots
+            del running[script]
+
+            manifest[script] = {'script': script,
+                                'status': status,
+                                'wall_time': round(wall_time, 2),
+                                'chains': slots,
+                                'output': _outdir(outdir, script)}
+            print('%-28s status %4d  %9.1f s' % (script, status, wall_time))
+
+    manifest = [manifest[script] for script in sorted(manifest)]
+    with open(os.path.join(outdir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Python scripts of '
+                                     'the book concurrently.')
+    parser.add_argument('patterns', nargs='*',
+                        help='glob patterns of the scripts to run')
+    parser.add_argument('-o', '--outdir', default='bmad_output',
+                        help='output directory (default: bmad_output)')
+    parser.add_argument('-j', '--max-chains', type=int, default=None,
+                        help='maximum number of chains running at once '
+                             '(default: number of cores)')
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help='maximum wall time of a script, in seconds')
+    args = parser.parse_args(argv)
+
+    manifest = run(discover(args.patterns), args.outdir, args.max_chains,
+                   args.timeout)
+
+    return int(any(item['status'] != 0 for item in manifest))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
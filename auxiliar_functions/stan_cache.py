@@ -0,0 +1,380 @@
+"""
+Persistent on-disk cache of compiled Stan models.
+
+pystan.stan() and pystan.StanModel() translate and compile the C++ code
+of a model every time a script runs. The functions below hash the
+normalized Stan program together with the compiler settings, pickle the
+compiled StanModel into a local cache directory and load it back on
+later runs, so only the first execution of a script pays for compilation.
+
+The cache is bounded in size (least recently used entries are removed
+first) and can be shared by several processes: a per-model lock ensures
+each program is compiled only once, and entries are written atomically.
+
+Environment variables:
+
+    BMAD_STAN_CACHE        cache directory
+                           (default: ~/.cache/bmad/stan)
+    BMAD_STAN_CACHE_SIZE   maximum size of the cache, in MB
+                           (default: 2048)
+    BMAD_N_JOBS            maximum number of chains run in parallel by
+                           one script (set by run_scripts.py)
+
+Programs which evaluate their likelihood with map_rect run it on several
+threads per chain when compiled with THREADS (e.g. compile_args=THREADS
+in stan()) and sampled with threads > 1.
+
+With warm_start=True, the chains start around the posterior mode, with
+an inverse metric estimated from the curvature there (see warm_start.py),
+so that a short warmup is enough.
+
+With reuse_adaptation=True, the step size and inverse metric adapted by
+the previous run of the same model on similar data are reused, with
+adaptation switched off and a short burn-in (see adaptation.py).
+
+With targets, iter is a maximum: the chains run in segments until the
+split R-hat and effective sample sizes reach the targets (see
+run_length.py).
+
+With online=True, summaries of the draws are accumulated while the
+sampler runs, in memory proportional to the number of parameters (see
+streaming.py), and with store=path the draws are written to
+memory-mapped files as they are produced (see draw_store.py).
+
+With checkpoint=path, long runs are sampled in segments and saved after
+each of them, so that a run which crashed or was preempted continues
+from the last segment when restarted (see run_length.py).
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import sys
+import tempfile
+
+try:
+    import fcntl
+except ImportError:                         # no file locks on Windows
+    fcntl = None
+
+import pystan
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bmad', 'stan')
+CACHE_SIZE = 2048                           # in MB
+
+# compiler settings enabling multi-threaded map_rect
+THREADS = {'extra_compile_args': ['-DSTAN_THREADS', '-pthread']}
+
+_loaded = {}                                # models already loaded by this process
+
+
+def normalize_code(model_code):
+    """
+    Remove comments and redundant white space from a Stan program,
+    so that cosmetic edits do not trigger a new compilation.
+
+    input: model_code -> str, Stan program
+
+    output: str, normalized Stan program
+    """
+
+    code = re.sub(r'/\*.*?\*/', ' ', model_code, flags=re.S)
+    code = re.sub(r'(//|#)[^\n]*', ' ', code)
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r' ?([{}()\[\];,=<>+\-*/~|]) ?', r'\1', code)
+
+    return code.strip()
+
+
+def model_hash(model_code, **kwargs):
+    """
+    Key identifying a compiled model.
+
+    input: model_code -> str, Stan program
+           kwargs -> compiler settings passed to pystan.StanModel
+
+    output: str, hexadecimal digest of the normalized program,
+            compiler settings, pystan and python versions
+    """
+
+    key = [normalize_code(model_code), pystan.__version__, sys.version]
+    key += ['%s=%r' % (name, kwargs[name]) for name in sorted(kwargs)]
+
+    return hashlib.sha256('\n'.join(key).encode('utf-8')).hexdigest()
+
+
+class _Lock(object):
+    """Exclusive advisory lock on a file, released on exit."""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        self.handle = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+        self.handle.close()
+
+
+def _read(path):
+    """Unpickle a cached model, or return None if it cannot be used."""
+
+    try:
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    os.utime(path, None)                    # mark as recently used
+
+    return model
+
+
+def _write(model, path):
+    """Pickle a model into the cache, atomically."""
+
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def evict(cache_dir=None, max_size=None, keep=()):
+    """
+    Remove the least recently used models until the cache fits
+    in max_size MB.
+
+    input: cache_dir -> str, cache directory
+           max_size -> float, maximum cache size in MB
+           keep -> list of str, files which must not be removed
+
+    output: list of str, removed files
+    """
+
+    cache_dir = cache_dir or os.environ.get('BMAD_STAN_CACHE', CACHE_DIR)
+    if max_size is None:
+        max_size = float(os.environ.get('BMAD_STAN_CACHE_SIZE', CACHE_SIZE))
+
+    removed = []
+    with _Lock(os.path.join(cache_dir, 'cache.lock')):
+        entries = []
+        for name in os.listdir(cache_dir):
+            if name.endswith('.pkl'):
+                path = os.path.join(cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(item[1] for item in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= max_size * 1024 ** 2:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(path)
+
+    return removed
+
+
+def compile_model(model_code, model_name='anon_model', cache_dir=None,
+                  max_size=None, verbose=False, **kwargs):
+    """
+    Cached replacement for pystan.StanModel.
+
+    input: model_code -> str, Stan program
+           model_name -> str, name of the model
+           cache_dir -> str, cache directory
+           max_size -> float, maximum cache size in MB
+           verbose -> bool, passed to pystan.StanModel
+           kwargs -> other compiler settings passed to pystan.StanModel
+                     (e.g. extra_compile_args)
+
+    output: pystan.StanModel
+    """
+
+    cache_dir = cache_dir or os.environ.get('BMAD_STAN_CACHE', CACHE_DIR)
+    key = model_hash(model_code, **kwargs)
+
+    if key in _loaded:
+        return _loaded[key]
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+
+    path = os.path.join(cache_dir, key + '.pkl')
+
+    # only one process compiles a given model, the others wait for it
+    with _Lock(os.path.join(cache_dir, key + '.lock')):
+        model = _read(path) if os.path.isfile(path) else None
+
+        if model is None:
+            model = pystan.StanModel(model_code=model_code,
+                                     model_name=model_name,
+                                     verbose=verbose, **kwargs)
+            _write(model, path)
+            evict(cache_dir, max_size, keep=[path])
+
+    _loaded[key] = model
+
+    return model
+
+
+def _draw(model, data, targets, checkpoint, kwargs):
+    """Run the sampler, in segments if there are targets or checkpoints."""
+
+    if targets is not None or checkpoint is not None:
+        from run_length import sample_until
+
+        return sample_until(model, data, targets, checkpoint, **kwargs)
+
+    return model.sampling(data=data, **kwargs)
+
+
+def sampling(model, data=None, threads=None, warm_start=False,
+             reuse_adaptation=False, targets=None, exclude=None, online=False,
+             store=None, store_pars=None, checkpoint=None, **kwargs):
+    """
+    Draw samples from a compiled model.
+
+    input: model -> pystan.StanModel
+           data -> dict, data for the model
+           threads -> int, threads per chain used by map_rect (-1 for
+                      all cores); needs a model compiled with THREADS
+           warm_start -> bool or dict, start the chains from the posterior
+                         mode with an estimated inverse metric; a dict
+                         gives starting values of the optimizer
+           reuse_adaptation -> bool, start from the adaptation saved by
+                               the previous run on similar data, if any,
+                               and save the adaptation of this run
+           targets -> dict, stop sampling once these targets of R-hat
+                      and ESS are met (see run_length.TARGETS); {} for
+                      the defaults
+           exclude -> list of str, variables which are not stored (the
+                      sampler does not write them); pars keeps only the
+                      listed variables instead
+           online -> bool or dict, accumulate means, standard deviations,
+                     quantiles and covariances of the draws while
+                     sampling, with progress reports on stderr, into
+                     fit.sim['online']; a dict gives the options of
+                     streaming.Stream (pars, probs, covariance, interval)
+           store -> str, directory where the post-warmup draws are
+                    written while sampling, in memory-mapped column files
+                    (see draw_store.py); by default the variables stored
+                    in the fit (see pars/exclude)
+           store_pars -> list of str, variables written to the store
+                         instead, e.g. excluded variables which are kept
+                         on disk only
+           checkpoint -> str, directory where the run is saved after
+                         every segment, and from which a restarted run
+                         continues (see run_length.py); online and store
+                         continue from the draws of the checkpoint
+           kwargs -> arguments passed to StanModel.sampling
+                     (iter, chains, warmup, thin, n_jobs, pars, ...)
+
+    output: pystan StanFit4Model
+    """
+
+    if threads is not None:
+        os.environ['STAN_NUM_THREADS'] = str(threads)
+
+    if exclude:                             # pystan 2 has no include argument
+        kwargs['pars'] = [name for name in model.model_pars if name not in exclude]
+
+    reused = False
+    if reuse_adaptation:
+        import adaptation
+
+        kwargs, reused = adaptation.reuse(model, data, kwargs)
+
+    if warm_start and not reused:
+        import warm_start as warm           # needs statsmodels
+
+        start = warm_start if isinstance(warm_start, dict) else None
+        guess = warm.warm_start(model, data, kwargs.get('chains', 4), start,
+                                seed=kwargs.get('seed'))
+        kwargs['init'] = guess['init']
+        kwargs['control'] = dict({'inv_metric': guess['inv_metric']},
+                                 **(kwargs.get('control') or {}))
+
+    if 'BMAD_N_JOBS' in os.environ:
+        n_jobs = int(os.environ['BMAD_N_JOBS'])
+        requested = kwargs.get('n_jobs', -1)
+        kwargs['n_jobs'] = n_jobs if requested < 1 else min(requested, n_jobs)
+
+    if online or store:
+        import streaming
+
+        options = dict(online) if isinstance(online, dict) else {}
+        if checkpoint is not None:          # continue from the saved draws
+            from run_length import saved
+
+            options['resume'] = saved(model, data, targets, checkpoint, **kwargs)
+        temporary = 'sample_file' not in kwargs
+        if temporary:
+            kwargs['sample_file'] = streaming.sample_file()
+        try:
+            with streaming.Stream(kwargs, summary=bool(online), store=store,
+                                  store_pars=store_pars, **options) as stream:
+                fit = _draw(model, data, targets, checkpoint, kwargs)
+        finally:
+            if temporary:
+                streaming.remove(kwargs['sample_file'])
+        if online:
+            fit.sim['online'] = stream.stats
+        if store:
+            fit.sim['store'] = store
+    else:
+        fit = _draw(model, data, targets, checkpoint, kwargs)
+
+    if reuse_adaptation and not reused and kwargs.get('algorithm', 'NUTS') == 'NUTS':
+        adaptation.save(fit, model, data)
+
+    return fit
+
+
+def stan(model_code, data=None, model_name='anon_model', cache_dir=None,
+         max_size=None, compile_args=None, threads=None, **kwargs):
+    """
+    Cached replacement for pystan.stan.
+
+    input: model_code -> str, Stan program
+           data -> dict, data for the model
+           model_name -> str, name of the model
+           cache_dir -> str, cache directory
+           max_size -> float, maximum cache size in MB
+           compile_args -> dict, compiler settings passed to
+                           pystan.StanModel
+           threads -> int, threads per chain used by map_rect
+           kwargs -> arguments passed to sampling (warm_start,
+                     reuse_adaptation, targets, exclude, online,
+                     store, store_pars, checkpoint) and
+                     StanModel.sampling
+                     (iter, chains, warmup, thin, n_jobs, ...)
+
+    output: pystan StanFit4Model
+    """
+
+    model = compile_model(model_code, model_name=model_name,
+                          cache_dir=cache_dir, max_size=max_size,
+                          **(compile_args or {}))
+
+    return sampling(model, data, threads, **kwargs)
@@ -0,0 +1,318 @@
+"""
+Find data-only work inside the log density of Stan programs.
+
+Everything in the model and transformed parameters blocks is evaluated,
+with automatic differentiation, at every leapfrog step. Expressions that
+depend on data alone give the same value every time and belong in the
+transformed data block, where they are computed once. This module reads
+the Stan programs stored as strings in the book scripts (or given
+directly) and reports:
+
+    data-call      a function call whose arguments are data only,
+                   e.g. log(Y), lgamma(Y + 1), fabs(errx[i])
+    data-density   a lognormal or beta density of a data variable,
+                   which recomputes log(Y) (and log1m(Y)) every time;
+                   sample log(Y) from a normal instead, or write the
+                   density in terms of precomputed logarithms
+    data-branch    an if statement inside a loop whose condition is
+                   data only; precompute an index instead
+    stored-vector  a container declared as transformed parameter,
+                   which is kept for every draw; use a local variable
+                   of the model block unless it is a quantity of interest
+
+The analysis is lexical: a name counts as data if it is declared in the
+data or transformed data blocks, or is a loop variable.
+
+Usage:
+
+    python stan_lint.py [pattern ...]
+
+    pattern       glob patterns of the scripts to check, relative to the
+                  repository root (default: chapter_*/code_*.py)
+"""
+
+import ast
+import os
+import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from run_scripts import ROOT, discover
+
+
+BLOCKS = ['functions', 'data', 'transformed data', 'parameters',
+          'transformed parameters', 'model', 'generated quantities']
+
+TYPES = ['int', 'real', 'vector', 'row_vector', 'matrix', 'simplex',
+         'unit_vector', 'ordered', 'positive_ordered', 'corr_matrix',
+         'cov_matrix', 'cholesky_factor_corr', 'cholesky_factor_cov']
+
+# functions worth hoisting when their arguments are data
+FUNCTIONS = ['log', 'log1m', 'log1p', 'log2', 'log10', 'exp', 'expm1',
+             'lgamma', 'tgamma', 'digamma', 'lbeta', 'lchoose',
+             'binomial_coefficient_log', 'fabs', 'abs', 'pow', 'sqrt',
+             'cbrt', 'square', 'inv', 'inv_sqrt', 'inv_square', 'logit',
+             'inv_logit', 'log_inv_logit', 'log1m_inv_logit', 'Phi',
+             'Phi_approx', 'inv_Phi', 'sin', 'cos', 'tan', 'erf', 'erfc',
+             'col', 'row', 'to_vector', 'to_row_vector', 'to_matrix',
+             'append_col', 'append_row', 'rep_vector', 'rep_matrix',
+             'diag_matrix', 'transpose', 'cholesky_decompose', 'inverse',
+             'inverse_spd', 'determinant', 'log_determinant', 'mean',
+             'sum', 'variance', 'sd']
+
+# densities which transform a data argument internally
+DENSITIES = {'lognormal': 'log(%s)', 'beta': 'log(%s) and log1m(%s)'}
+
+KEYWORDS = set(['for', 'in', 'while', 'if', 'else', 'return', 'target',
+                'print', 'reject', 'lower', 'upper', 'offset',
+                'multiplier'] + TYPES)
+
+
+def strip_comments(code):
+    """Blank out comments, keeping the position of every other character."""
+
+    blank = lambda match: re.sub(r'[^\n]', ' ', match.group(0))
+    code = re.sub(r'/\*.*?\*/', blank, code, flags=re.S)
+
+    return re.sub(r'(//|#)[^\n]*', blank, code)
+
+
+def _close(code, start, left='(', right=')'):
+    """Position right after the bracket matching the one at start."""
+
+    depth = 0
+    for i in range(start, len(code)):
+        if code[i] == left:
+            depth += 1
+        elif code[i] == right:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+
+    return len(code)
+
+
+def blocks(code):
+    """
+    Split a Stan program into its blocks.
+
+    input: code -> str, Stan program without comments
+
+    output: dict, block name -> (offset of the body, body)
+    """
+
+    found = {}
+    pattern = re.compile(r'\b(%s)\s*\{' % '|'.join(
+        name.replace(' ', r'\s+') for name in sorted(BLOCKS, key=len,
+                                                     reverse=True)))
+    position = 0
+    while True:
+        match = pattern.search(code, position)
+        if match is None:
+            return found
+        end = _close(code, match.end() - 1, '{', '}')
+        name = ' '.join(match.group(1).split())
+        found[name] = (match.end(), code[match.end():end - 1])
+        position = end
+
+
+def declarations(body):
+    """
+    Variables declared in the body of a block.
+
+    input: body -> str, body of a block
+
+    output: list of (name, is_container, offset)
+    """
+
+    found = []
+    pattern = re.compile(r'(^|[;{}])\s*(%s)\b' % '|'.join(TYPES))
+    for match in pattern.finditer(body):
+        i = match.end()
+        container = match.group(2) not in ('int', 'real')
+        while True:
+            while i < len(body) and body[i].isspace():
+                i += 1
+            if body[i:i + 1] == '<':
+                i = _close(body, i, '<', '>')
+            elif body[i:i + 1] == '[':
+                i = _close(body, i, '[', ']')
+            else:
+                break
+        name = re.match(r'[A-Za-z_]\w*', body[i:])
+        if name is None:
+            continue
+        tail = body[i + name.end():].lstrip()
+        container = container or tail.startswith('[')
+        found.append((name.group(0), container, i))
+
+    return found
+
+
+def parameter_names(model_code):
+    """Names of the parameters declared by a Stan program, in order."""
+
+    parts = blocks(strip_comments(model_code))
+    if 'parameters' not in parts:
+        return []
+
+    return [name for name, container, offset in declarations(parts['parameters'][1])]
+
+
+def _names(expression):
+    """Identifiers of an expression, excluding function names."""
+
+    names = set()
+    for match in re.finditer(r'(?<![\w.])([A-Za-z_]\w*)(\s*\()?',
+                             expression):
+        if not match.group(2) and match.group(1) not in KEYWORDS:
+            names.add(match.group(1))
+
+    return names
+
+
+def _is_data(expression, data):
+    """True if expression has at least one name and all of them are data."""
+
+    names = _names(expression)
+    return bool(names) and names <= data
+
+
+def check_program(code):
+    """
+    Look for data-only work in the log density of a Stan program.
+
+    input: code -> str, Stan program
+
+    output: list of (line, kind, message), line counted from 0 within code
+    """
+
+    code = strip_comments(code)
+    parts = blocks(code)
+    line = lambda offset: code.count('\n', 0, offset)
+
+    data = set()
+    for name in ('data', 'transformed data'):
+        if name in parts:
+            data.update(item[0] for item in declarations(parts[name][1]))
+
+    user = set()
+    if 'functions' in parts:
+        user = set(re.findall(r'\b(\w+)\s*\([^)]*\)\s*\{', parts['functions'][1]))
+
+    findings = []
+    for name in ('transformed parameters', 'model'):
+        if name not in parts:
+            continue
+        start, body = parts[name]
+        local = data | set(re.findall(r'\bfor\s*\(\s*(\w+)\s+in\b', body))
+
+        # calls with data-only arguments, outermost first
+        covered = 0
+        for match in re.finditer(r'(?<![\w.])([A-Za-z_]\w*)\s*\(', body):
+            function = match.group(1)
+            if match.start() < covered or (function not in FUNCTIONS and
+                                           function not in user):
+                continue
+            end = _close(body, match.end() - 1)
+            if _is_data(body[match.end():end - 1], local):
+                covered = end
+                findings.append((line(start + match.start()), 'data-call',
+                                 '%s is data only; compute it in transformed data'
+                                 % ' '.join(body[match.start():end].split())))
+
+        # densities which transform their data argument
+        for density, work in DENSITIES.items():
+            pattern = (r'([A-Za-z_][\w\[\], ]*?)\s*~\s*%s\s*\(|'
+                       r'%s_lpdf\s*\(\s*([A-Za-z_][\w\[\], ]*?)\s*\|'
+                       % (density, density))
+            for match in re.finditer(pattern, body):
+                y = (match.group(1) or match.group(2)).strip()
+                if _is_data(y, local):
+                    findings.append((line(start + match.start()), 'data-density',
+                                     '%s density of %s recomputes %s'
+                                     % (density, y, work.replace('%s', y))))
+
+        # branches on data inside loops
+        for match in re.finditer(r'\bfor\s*\(', body):
+            loop = body[match.start():]
+            header = _close(loop, loop.index('('))
+            rest = loop[header:].lstrip()
+            extent = (_close(loop, header + loop[header:].index('{'), '{', '}')
+                      if rest.startswith('{') else header + loop[header:].find(';'))
+            for condition in re.finditer(r'\bif\s*\(', loop[:extent]):
+                end = _close(loop, condition.end() - 1)
+                test = loop[condition.end():end - 1]
+                if _is_data(test, local):
+                    findings.append((line(start + match.start() + condition.start()),
+                                     'data-branch',
+                                     'condition (%s) depends on data only; '
+                                     'precompute an index' % ' '.join(test.split())))
+
+        if name == 'transformed parameters':
+            for variable, container, offset in declarations(body):
+                if container:
+                    findings.append((line(start + offset), 'stored-vector',
+                                     'transformed parameter %s is stored with '
+                                     'every draw' % variable))
+
+    return sorted(set(findings))
+
+
+def programs(script):
+    """
+    Stan programs stored as string literals in a script.
+
+    input: script -> str, path relative to the repository root
+
+    output: list of (variable name, line of the string in the file, program)
+    """
+
+    with open(os.path.join(ROOT, script)) as f:
+        tree = ast.parse(f.read())
+
+    found = []
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        try:
+            value = ast.literal_eval(node.value)
+        except ValueError:
+            continue
+        if (isinstance(target, ast.Name) and isinstance(value, str) and
+                'model' in blocks(strip_comments(value))):
+            found.append((target.id, node.value.lineno, value))
+
+    return found
+
+
+def check(scripts):
+    """
+    Check the Stan programs of several scripts.
+
+    input: scripts -> list of str, paths relative to the repository root
+
+    output: list of (script, line, program name, kind, message)
+    """
+
+    findings = []
+    for script in scripts:
+        for name, first, code in programs(script):
+            for line, kind, message in check_program(code):
+                findings.append((script, first + line, name, kind, message))
+
+    return findings
+
+
+def main(argv=None):
+    findings = check(discover(argv if argv is not None else sys.argv[1:]))
+
+    for script, line, name, kind, message in findings:
+        print('%s:%d: [%s] %s: %s' % (script, line, kind, name, message))
+
+    return int(bool(findings))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
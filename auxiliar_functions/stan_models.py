@@ -0,0 +1,619 @@
+"""
+Library of generic, parameterized Stan regression programs.
+
+Most of the Python scripts in the book fit the same handful of models,
+differing only in the number of observations, the number of covariates
+and the prior hyperparameters. The programs generated here take all of
+those as data, so each combination of
+
+    family x link x zero process x random intercept
+
+is compiled only once (see stan_cache.py) and reused by every script.
+
+Families and links:
+
+    normal        identity
+    lognormal     identity, log      (link on the log-scale location)
+    gamma         log
+    beta          logit
+    bernoulli     logit, probit
+    binomial      logit, probit
+    poisson       log
+    negbinomial   log                (NB2, size theta)
+
+Zero processes:
+
+    'inflated'    poisson, negbinomial
+    'hurdle'      poisson, negbinomial, lognormal, gamma
+    'truncated'   poisson, negbinomial       (positive counts only)
+
+In the first two cases the coefficients gamma model the probability of a
+zero. The random intercept, when present, enters the linear predictor of
+the count/continuous part. It is non-centered (sampled on the scale of
+sigma_re) when the groups are small, see hierarchical.py.
+
+The two parts of a hurdle model share no parameter, so its posterior
+factorizes: glm(..., zero='hurdle', split=True) fits a logistic
+regression of the zero indicator and the (zero-truncated) positive part
+as two concurrent programs, and merges their draws (see factorized.py).
+
+Without a zero process, the bernoulli, binomial, poisson, normal and
+lognormal families can also be fitted to data compressed to one row per
+distinct covariate pattern (see compression.py): glm(..., compress=True).
+
+With glm(..., qr=True) the coefficients are sampled on the orthogonal
+basis of the thin QR decomposition of the design matrix (beta_qr), which
+removes the posterior correlation induced by correlated predictors;
+beta is recovered in generated quantities. QR is not available with a
+zero process.
+
+Run this file to compile every program in advance:
+
+    python stan_models.py [family ...]
+"""
+
+import itertools
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import compression
+import factorized
+import hierarchical
+from stan_cache import compile_model, sampling
+
+
+LINKS = {'normal': ['identity'],
+         'lognormal': ['identity', 'log'],
+         'gamma': ['log'],
+         'beta': ['logit'],
+         'bernoulli': ['logit', 'probit'],
+         'binomial': ['logit', 'probit'],
+         'poisson': ['log'],
+         'negbinomial': ['log']}
+
+ZERO = {None: list(LINKS),
+        'inflated': ['poisson', 'negbinomial'],
+        'hurdle': ['poisson', 'negbinomial', 'lognormal', 'gamma'],
+        'truncated': ['poisson', 'negbinomial']}
+
+DISCRETE = ['bernoulli', 'binomial', 'poisson', 'negbinomial']
+
+AUX = {'normal': 'sigma',                  # name of the scale/shape parameter
+       'lognormal': 'sigma',
+       'gamma': 'phi',
+       'beta': 'theta',
+       'negbinomial': 'theta'}
+
+PRIORS = {'beta_mu': 0.0,                  # beta ~ normal(beta_mu, beta_sd)
+          'beta_sd': 100.0,
+          'gamma_mu': 0.0,                 # gamma ~ normal(gamma_mu, gamma_sd)
+          'gamma_sd': 100.0,
+          'aux_shape': 0.001,              # aux ~ gamma(aux_shape, aux_rate)
+          'aux_rate': 0.001,
+          'sigma_re_scale': 25.0}          # sigma_re ~ cauchy(0, sigma_re_scale)
+
+
+def _check(family, link, zero, compressed=False, qr=False):
+    """Validate a model specification and return its link function."""
+
+    if family not in LINKS:
+        raise ValueError('unknown family: %s' % family)
+
+    link = link or LINKS[family][0]
+    if link not in LINKS[family]:
+        raise ValueError('link %s not available for family %s' % (link, family))
+
+    if zero not in ZERO:
+        raise ValueError('unknown zero process: %s' % zero)
+    if family not in ZERO[zero]:
+        raise ValueError('zero process %s not available for family %s'
+                         % (zero, family))
+
+    if compressed and (zero or family not in compression.FAMILIES.values()):
+        raise ValueError('compressed data not available for family %s%s'
+                         % (family, ' with zero process %s' % zero if zero else ''))
+
+    if qr and zero:
+        raise ValueError('QR reparameterization not available with '
+                         'zero process %s' % zero)
+
+    return link
+
+
+def model_name(family, link=None, zero=None, random_intercept=False,
+               compressed=False, qr=False):
+    """Name of a generic program, e.g. 'poisson_log_hurdle_ri'."""
+
+    link = _check(family, link, zero, compressed, qr)
+    name = [family, link] + ([zero] if zero else [])
+    name += ['ri'] if random_intercept else []
+    name += ['compressed'] if compressed else []
+
+    return '_'.join(name + (['qr'] if qr else []))
+
+
+def _predictor(s, random_intercept, offset=False, qr=False):
+    """Linear predictor of the subset s ('' for all observations)."""
+
+    eta = 'Q%s * beta_qr' % s if qr else 'X%s * beta' % s
+    if random_intercept:
+        eta += ' + a[group%s]' % s
+    if offset:
+        eta += ' + log_exposure'
+
+    return eta
+
+
+def _likelihood(family, link, s, compressed=False):
+    """
+    Statements of the likelihood of the subset s, given its linear
+    predictor. The logarithms of a lognormal or beta response are taken
+    once in transformed data (logY, log1mY), and the shape1 of the beta
+    family is declared with the linear predictor.
+    """
+
+    y, eta = 'Y' + s, 'eta' + s
+
+    if compressed and family in ('normal', 'lognormal'):
+        loc = 'exp(%s)' % eta if link == 'log' else eta
+        return ['// normal likelihood of the original observations, from the',
+                '// mean of each pattern and the within-pattern sum of squares',
+                'target += -n_total * log(sigma)',
+                '          - (ss + dot_product(w, square(%s - %s))) / (2 * square(sigma));'
+                % (y, loc)]
+    if family == 'normal':
+        return ['%s ~ normal(%s, sigma);' % (y, eta)]
+    if family == 'lognormal':
+        loc = 'exp(%s)' % eta if link == 'log' else eta
+        return ['// lognormal, up to the constant -sum(log%s)' % y,
+                'log%s ~ normal(%s, sigma);' % (y, loc)]
+    if family == 'gamma':
+        return ['%s ~ gamma(phi, phi * exp(-%s));' % (y, eta)]
+    if family == 'beta':
+        return ['// beta(shape1, theta - shape1)',
+                'target += N * lgamma(theta) - sum(lgamma(shape1)) '
+                '- sum(lgamma(theta - shape1));',
+                'target += dot_product(shape1 - 1, logY) '
+                '+ dot_product(theta - shape1 - 1, log1mY);']
+    if family == 'bernoulli':
+        if link == 'probit':
+            return ['%s ~ bernoulli(Phi(%s));' % (y, eta)]
+        return ['%s ~ bernoulli_logit(%s);' % (y, eta)]
+    if family == 'binomial':
+        if link == 'probit':
+            return ['%s ~ binomial(m, Phi(%s));' % (y, eta)]
+        return ['%s ~ binomial_logit(m, %s);' % (y, eta)]
+    if family == 'poisson':
+        return ['%s ~ poisson_log(%s);' % (y, eta)]
+    if family == 'negbinomial':
+        return ['%s ~ neg_binomial_2_log(%s, theta);' % (y, eta)]
+
+
+def _log_p0(family, eta):
+    """Log-probability of a zero count, given the log mean eta."""
+
+    if family == 'poisson':
+        return '-exp(%s)' % eta
+    return '-theta * log1p_exp(%s - log(theta))' % eta
+
+
+def glm_code(family, link=None, zero=None, random_intercept=False,
+             compressed=False, qr=False):
+    """
+    Stan program of a generic regression model.
+
+    input: family -> str, response distribution (see LINKS)
+           link -> str, link function (default: first in LINKS[family])
+           zero -> str, zero process: None, 'inflated', 'hurdle' or
+                   'truncated'
+           random_intercept -> bool, add a normal random intercept
+           compressed -> bool, data compressed to one row per covariate
+                         pattern (see compression.py)
+           qr -> bool, sample the coefficients on the QR basis of X
+
+    output: str, Stan program
+    """
+
+    link = _check(family, link, zero, compressed, qr)
+    truncated = zero == 'truncated'
+    if truncated:
+        zero = None                         # a count model of Y > 0
+    aux = AUX.get(family)
+    discrete = family in DISCRETE
+    ri = random_intercept
+
+    # data
+    if family == 'bernoulli':
+        response = 'int<lower=0, upper=1> Y[N];'
+    elif discrete:
+        response = 'int<lower=%d> Y[N];' % truncated
+    elif family == 'normal' or compressed:
+        response = 'vector[N] Y;'
+    elif family == 'beta':
+        response = 'vector<lower=0, upper=1>[N] Y;'
+    else:
+        response = 'vector<lower=0>[N] Y;'
+
+    data = ['int<lower=0> N;                   // number of data points',
+            'int<lower=1> K;                   // number of coefficients',
+            'matrix[N, K] X;                   // design matrix',
+            '%-34s// response' % response]
+    if family == 'binomial':
+        data += ['int<lower=0> m[N];                // number of trials']
+    if compressed and family == 'poisson':
+        data += ['vector[N] log_exposure;           // log exposure of each pattern']
+    elif compressed and aux == 'sigma':
+        data += ['int<lower=1> n[N];                // observations of each pattern',
+                 'real<lower=0> ss;                 // within-pattern sum of squares']
+    if ri:
+        data += ['int<lower=1> J;                   // number of groups',
+                 'int<lower=1, upper=J> group[N];   // group of each observation']
+    data += ['real beta_mu;                     // prior on beta',
+             'real<lower=0> beta_sd;']
+    if zero:
+        data += ['real gamma_mu;                    // prior on gamma',
+                 'real<lower=0> gamma_sd;']
+    if aux:
+        data += ['real<lower=0> aux_shape;          // prior on %s' % aux,
+                 'real<lower=0> aux_rate;']
+    if ri:
+        data += ['real<lower=0> sigma_re_scale;     // prior on sigma_re',
+                 'int<lower=0, upper=1> noncentered; // sample a / sigma_re']
+
+    # split zeros from positive values once, so that each part of the
+    # likelihood is a single vectorized statement
+    functions, tdata = [], []
+    if zero:
+        ytype = 'int[]' if discrete else 'vector'
+        functions = ['int num_zeros(%s y) {' % ytype,
+                     '    int n = 0;',
+                     '    for (i in 1:num_elements(y)) n += (y[i] == 0);',
+                     '    return n;',
+                     '}']
+
+        y1 = 'int<lower=1> Y1[N1];' if discrete else 'vector<lower=0>[N1] Y1;'
+        tdata = ['int<lower=0> N0 = num_zeros(Y);   // number of zeros',
+                 'int<lower=0> N1 = N - N0;         // number of positive values',
+                 '%-34s// positive values' % y1,
+                 'matrix[N1, K] X1;']
+        if zero == 'inflated':
+            tdata += ['matrix[N0, K] X0;']
+        else:
+            tdata += ['int<lower=0, upper=1> Z[N];       // zero indicator']
+        if family == 'lognormal':
+            tdata += ['vector[N1] logY1;']
+        if ri:
+            tdata += ['int<lower=1, upper=J> group1[N1];']
+            if zero == 'inflated':
+                tdata += ['int<lower=1, upper=J> group0[N0];']
+
+        if zero == 'inflated':
+            loop = ['{',
+                    '    int j0 = 1;',
+                    '    int j1 = 1;',
+                    '',
+                    '    for (i in 1:N) {',
+                    '        if (Y[i] == 0) {',
+                    '            X0[j0] = X[i];']
+            if ri:
+                loop += ['            group0[j0] = group[i];']
+            loop += ['            j0 += 1;',
+                     '        } else {']
+        else:
+            loop = ['{',
+                    '    int j1 = 1;',
+                    '',
+                    '    for (i in 1:N) {',
+                    '        Z[i] = (Y[i] == 0);',
+                    '        if (Y[i] > 0) {']
+        loop += ['            Y1[j1] = Y[i];',
+                 '            X1[j1] = X[i];']
+        if ri:
+            loop += ['            group1[j1] = group[i];']
+        loop += ['            j1 += 1;',
+                 '        }',
+                 '    }',
+                 '}']
+        tdata += [''] + loop
+        if family == 'lognormal':
+            tdata += ['logY1 = log(Y1);']
+    elif compressed and aux == 'sigma':
+        tdata = ['int n_total = sum(n);',
+                 'vector[N] w = to_vector(n);']
+    elif family == 'lognormal':
+        tdata = ['vector[N] logY = log(Y);']
+    elif family == 'beta':
+        tdata = ['vector[N] logY = log(Y);',
+                 'vector[N] log1mY = log1m(Y);']
+
+    if qr:
+        tdata += ['// thin QR decomposition X = Q * R, scaled so that the',
+                  '// columns of Q have unit scale',
+                  'matrix[N, K] Q = qr_thin_Q(X) * sqrt(N - 1);',
+                  'matrix[K, K] R = qr_thin_R(X) / sqrt(N - 1);',
+                  'matrix[K, K] R_inv = inverse(R);']
+
+    # parameters
+    if qr:
+        params = ['vector[K] beta_qr;                // coefficients on the basis Q']
+    else:
+        params = ['vector[K] beta;                   // linear predictor coefficients']
+    if zero:
+        params += ['vector[K] gamma;                  // zero process coefficients']
+    if aux:
+        params += ['real<lower=0> %s;' % aux]
+    if ri:
+        params += ['real<lower=0> sigma_re;',
+                   '// random intercepts',
+                   'vector<multiplier=(noncentered ? sigma_re : 1.0)>[J] a;']
+
+    # model
+    model = []
+    if zero == 'inflated':
+        model += ['vector[N0] eta0 = %s;' % _predictor('0', ri),
+                  'vector[N1] eta1 = %s;' % _predictor('1', ri),
+                  'vector[N0] zeta0 = X0 * gamma;',
+                  'vector[N1] zeta1 = X1 * gamma;',
+                  '']
+    elif zero == 'hurdle':
+        model += ['vector[N1] eta1 = %s;' % _predictor('1', ri), '']
+    else:
+        model += ['vector[N] eta = %s;'
+                  % _predictor('', ri, compressed and family == 'poisson', qr)]
+        if family == 'beta':
+            model += ['vector[N] shape1 = theta * inv_logit(eta);']
+        model += ['']
+
+    if qr:
+        model += ['// priors, beta = R_inv * beta_qr is linear (no Jacobian)',
+                  'target += normal_lpdf(R_inv * beta_qr | beta_mu, beta_sd);']
+    else:
+        model += ['// priors',
+                  'beta ~ normal(beta_mu, beta_sd);']
+    if zero:
+        model += ['gamma ~ normal(gamma_mu, gamma_sd);']
+    if aux:
+        model += ['%s ~ gamma(aux_shape, aux_rate);' % aux]
+    if ri:
+        model += ['a ~ normal(0, sigma_re);',
+                  'sigma_re ~ cauchy(0, sigma_re_scale);']
+    model += ['', '// likelihood']
+
+    if zero == 'inflated':
+        model += ['target += log_inv_logit(zeta0) + log1p_exp(%s - zeta0);'
+                  % _log_p0(family, 'eta0'),
+                  'target += log1m_inv_logit(zeta1);']
+        model += _likelihood(family, link, '1')
+    elif zero == 'hurdle':
+        model += ['Z ~ bernoulli_logit(X * gamma);']
+        model += _likelihood(family, link, '1')
+        if discrete:
+            model += ['target += -sum(log1m_exp(%s));'
+                      % _log_p0(family, 'eta1')]
+    else:
+        model += _likelihood(family, link, '', compressed)
+        if truncated:
+            model += ['target += -sum(log1m_exp(%s));' % _log_p0(family, 'eta')]
+
+    generated = []
+    if qr:
+        generated = ['vector[K] beta = R_inv * beta_qr;  // linear predictor coefficients']
+
+    code = []
+    for name, lines in [('functions', functions), ('data', data),
+                        ('transformed data', tdata), ('parameters', params),
+                        ('model', model), ('generated quantities', generated)]:
+        if lines:
+            code += [name + '{']
+            code += [('    ' + line).rstrip() for line in lines]
+            code += ['}']
+
+    return '\n'.join(code) + '\n'
+
+
+def glm_model(family, link=None, zero=None, random_intercept=False,
+              compressed=False, qr=False, **kwargs):
+    """
+    Compiled generic regression model, loaded from the cache if possible.
+
+    input: family, link, zero, random_intercept, compressed, qr -> see glm_code
+           kwargs -> arguments passed to stan_cache.compile_model
+
+    output: pystan.StanModel
+    """
+
+    code = glm_code(family, link, zero, random_intercept, compressed, qr)
+    name = model_name(family, link, zero, random_intercept, compressed, qr)
+
+    return compile_model(code, model_name=name, **kwargs)
+
+
+def glm_data(X, Y, family, zero=None, group=None, trials=None, priors=None,
+             compress=False):
+    """
+    Data dictionary for a generic regression model.
+
+    input: X -> array, design matrix (N x K), including the intercept
+           Y -> array, response variable
+           family -> str, response distribution
+           zero -> str, zero process: None, 'inflated', 'hurdle' or
+                   'truncated'
+           group -> array, group labels for the random intercept
+           trials -> array, number of trials (binomial family only)
+           priors -> dict, prior hyperparameters overriding PRIORS
+           compress -> bool, aggregate the observations sharing a
+                       covariate pattern (see compression.py)
+
+    output: dict, data for the Stan program
+    """
+
+    if group is not None:
+        # from the observations, before any compression
+        noncentered = hierarchical.noncentered(group, trials)
+
+    packed = {}
+    if compress:
+        packed = compression.compress(X, Y, family, group, trials)
+        family, X, Y = packed['family'], packed['X'], packed['Y']
+        group, trials = packed['group'], packed.get('trials')
+
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+
+    data = {}
+    data['N'] = X.shape[0]
+    data['K'] = X.shape[1]
+    data['X'] = X
+    data['Y'] = np.asarray(Y, dtype=int if family in DISCRETE else float)
+
+    if family == 'binomial':
+        data['m'] = np.asarray(trials, dtype=int)
+    if 'exposure' in packed:
+        data['log_exposure'] = np.log(packed['exposure'])
+    if 'n' in packed:
+        data['n'], data['ss'] = packed['n'], packed['ss']
+
+    if group is not None:
+        labels, index = np.unique(group, return_inverse=True)
+        data['J'] = len(labels)
+        data['group'] = index + 1
+
+    hyper = dict(PRIORS, **(priors or {}))
+    data['beta_mu'], data['beta_sd'] = hyper['beta_mu'], hyper['beta_sd']
+    if zero in ('inflated', 'hurdle'):
+        data['gamma_mu'], data['gamma_sd'] = hyper['gamma_mu'], hyper['gamma_sd']
+    if family in AUX:
+        data['aux_shape'], data['aux_rate'] = hyper['aux_shape'], hyper['aux_rate']
+    if group is not None:
+        data['sigma_re_scale'] = hyper['sigma_re_scale']
+        data['noncentered'] = noncentered
+
+    return data
+
+
+def split_hurdle(X, Y, family, link=None, group=None, priors=None, **kwargs):
+    """
+    Fit a hurdle model as two independent programs, run concurrently: a
+    logistic regression of the zero indicator on every observation, whose
+    coefficients are returned as gamma, and the positive part (zero-truncated
+    for counts) on the positive values only.
+
+    With a random intercept, the groups are numbered over all the
+    observations, as in the joint program, so a[j] is the same group in
+    both fits; groups without positive values are drawn from their prior.
+
+    input: X, Y, family, link, group, priors -> see glm
+           kwargs -> arguments passed to StanModel.sampling
+
+    output: factorized.MergedFit
+    """
+
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    Y = np.asarray(Y)
+    positive = Y > 0
+
+    hyper = dict(PRIORS, **(priors or {}))
+    logistic = {'beta_mu': hyper['gamma_mu'], 'beta_sd': hyper['gamma_sd']}
+    zero = 'truncated' if family in DISCRETE else None
+    groups = None if group is None else np.asarray(group)[positive]
+    positives = glm_data(X[positive], Y[positive], family, zero, groups,
+                         priors=priors)
+    if group is not None:
+        # labels and parameterization of the joint program
+        labels, index = np.unique(group, return_inverse=True)
+        positives['J'], positives['group'] = len(labels), index[positive] + 1
+        positives['noncentered'] = hierarchical.noncentered(group)
+
+    parts = [(glm_model(family, link, zero, group is not None), positives),
+             (glm_model('bernoulli'),
+              glm_data(X, (Y == 0).astype(int), 'bernoulli', priors=logistic),
+              {'beta': 'gamma'})]
+    order = ['beta', 'gamma', AUX.get(family), 'sigma_re', 'a']
+
+    return factorized.sample(parts, order, **kwargs)
+
+
+def glm(X, Y, family, link=None, zero=None, group=None, trials=None,
+        priors=None, compress=False, qr=False, split=False, warm_start=False,
+        **kwargs):
+    """
+    Fit a generic regression model.
+
+    input: X, Y, family, zero, group, trials, priors, compress -> see glm_data
+           link -> str, link function
+           qr -> bool, sample the coefficients on the QR basis of X
+           split -> bool, fit the two parts of a hurdle model separately
+                    (see split_hurdle)
+           warm_start -> bool, start the chains around the posterior mode,
+                         searched from the statsmodels GLM estimates, with
+                         an estimated inverse metric (see warm_start.py)
+           kwargs -> arguments passed to stan_cache.sampling
+                     (reuse_adaptation, targets, exclude,
+                     online, store, store_pars, checkpoint) and
+                     StanModel.sampling
+                     (iter, chains, warmup, thin, n_jobs, ...)
+
+    output: pystan StanFit4Model (factorized.MergedFit if split)
+    """
+
+    if split:
+        if zero != 'hurdle':
+            raise ValueError('only hurdle models can be split, not zero=%s' % zero)
+        return split_hurdle(X, Y, family, link, group, priors,
+                            warm_start=warm_start, **kwargs)
+
+    if warm_start and not (compress or qr):
+        from warm_start import glm_estimates   # needs statsmodels
+        warm_start = glm_estimates(X, Y, family, link, zero, trials) or True
+
+    program = compression.FAMILIES.get(family, family) if compress else family
+    model = glm_model(program, link, zero, group is not None, compress, qr)
+    data = glm_data(X, Y, family, zero, group, trials, priors, compress)
+
+    return sampling(model, data, warm_start=warm_start, **kwargs)
+
+
+def precompile(families=None):
+    """
+    Compile every generic program of the given families.
+
+    input: families -> list of str (default: all families)
+
+    output: list of str, names of the compiled programs
+    """
+
+    names = []
+    for zero, members in ZERO.items():
+        for family in members:
+            if families and family not in families:
+                continue
+            for link, ri in itertools.product(LINKS[family], [False, True]):
+                glm_model(family, link, zero, ri)
+                names.append(model_name(family, link, zero, ri))
+
+    for family in sorted(set(compression.FAMILIES.values())):
+        if families and family not in families:
+            continue
+        for link, ri in itertools.product(LINKS[family], [False, True]):
+            glm_model(family, link, None, ri, True)
+            names.append(model_name(family, link, None, ri, True))
+
+    for family in sorted(LINKS):
+        if families and family not in families:
+            continue
+        for link, ri in itertools.product(LINKS[family], [False, True]):
+            glm_model(family, link, None, ri, qr=True)
+            names.append(model_name(family, link, None, ri, qr=True))
+
+    return names
+
+
+if __name__ == '__main__':
+    for name in precompile(sys.argv[1:]):
+        print(name)
@@ -0,0 +1,458 @@
+"""
+Posterior statistics computed while the sampler runs.
+
+For long runs of models with many latent variables, the draws are only
+needed for a few summaries of the global parameters. Stan writes every
+draw of every chain to a CSV file as it goes (sample_file of
+StanModel.sampling); Stream follows those files from a background thread
+and folds each post-warmup draw into an OnlineSummary:
+
+    Moments     means, variances and, optionally, the covariance matrix,
+                with the updates of Welford (1962), merged block by block
+                as in Chan, Golub & LeVeque (1979)
+    P2          quantiles of each parameter with the P-square algorithm of
+                Jain & Chlamtac (1985), which keeps five markers per
+                quantile instead of the draws
+
+The memory used is proportional to the number of parameters (squared
+with the covariance), not to the number of draws. Every few seconds,
+the number of draws read from each chain is reported on stderr.
+
+stan_cache.sampling(..., online=True) runs a Stream around the sampler
+and stores the OnlineSummary in fit.sim['online']. A Stream can also
+write the draws of each chain to a draw_store.DrawStore as they arrive
+(stan_cache.sampling(..., store=path)).
+
+When run_length resumes a run from a checkpoint, only the segments after
+the checkpoint are sampled again. The Stream then starts from the draws
+of the checkpoint: the store of the interrupted run is reopened and cut
+back to the draws of the saved fit (the interrupted run may have written
+more), and the summary starts from the draws in the saved fit.
+"""
+
+import glob
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import posterior
+from draw_store import HEADER, DrawStore
+
+
+PROBS = (0.025, 0.25, 0.5, 0.75, 0.975)
+MAX_COVARIANCE = 200                        # parameters with a covariance matrix
+INTERVAL = 10                               # seconds between progress reports
+
+
+class Moments(object):
+    """
+    Running mean, variance and covariance of vectors.
+
+    input: size -> int, number of parameters
+           covariance -> bool, also accumulate the cross products
+    """
+
+    def __init__(self, size, covariance=False):
+        self.n = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.comoment = np.zeros((size, size)) if covariance else None
+
+    def update(self, block):
+        """Add a block of draws (draws x parameters)."""
+
+        block = np.atleast_2d(block)
+        n = block.shape[0]
+        if n == 0:
+            return
+
+        mean = block.mean(axis=0)
+        centred = block - mean
+        delta = mean - self.mean
+        total = self.n + n
+        weight = self.n * n / total
+
+        self.mean = self.mean + delta * n / total
+        self.m2 += (centred ** 2).sum(axis=0) + delta ** 2 * weight
+        if self.comoment is not None:
+            self.comoment += np.dot(centred.T, centred) + np.outer(delta, delta) * weight
+        self.n = total
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.full(len(self.m2), np.nan)
+
+    @property
+    def covariance(self):
+        if self.comoment is None or self.n < 2:
+            return None
+        return self.comoment / (self.n - 1)
+
+
+class P2(object):
+    """
+    Streaming estimates of some quantiles of each parameter (P-square),
+    all updated at once.
+
+    input: size -> int, number of parameters
+           probs -> tuple of float, probabilities of the quantiles
+    """
+
+    def __init__(self, size, probs=PROBS):
+        self.probs = tuple(probs)
+        self.size = size
+        p = np.repeat(self.probs, size)     # one column per quantile and parameter
+        self.desired = np.array([1 + 0 * p, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5 + 0 * p])
+        self.increments = np.array([0 * p, p / 2, p, (1 + p) / 2, 1 + 0 * p])
+        self.positions = np.tile(np.arange(1.0, 6.0)[:, None], (1, len(p)))
+        self.heights = None
+        self.first = []                     # the first five draws
+
+    def update(self, x):
+        """Add one draw (a vector of parameters)."""
+
+        x = np.tile(np.asarray(x, dtype=float), len(self.probs))
+        if self.heights is None:
+            self.first.append(x)
+            if len(self.first) == 5:
+                self.heights = np.sort(self.first, axis=0)
+            return
+
+        q, n = self.heights, self.positions
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        cell = (x >= q[1:4]).sum(axis=0)
+        n += np.arange(5)[:, None] > cell
+        self.desired += self.increments
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            move = (((d >= 1) & (n[i + 1] - n[i] > 1)) |
+                    ((d <= -1) & (n[i - 1] - n[i] < -1)))
+            if not move.any():
+                continue
+            s = np.sign(d)
+            parabolic = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+            neighbour = np.where(s > 0, i + 1, i - 1)
+            columns = np.arange(q.shape[1])
+            linear = q[i] + s * (q[neighbour, columns] - q[i]) / (n[neighbour, columns] - n[i])
+            height = np.where((q[i - 1] < parabolic) & (parabolic < q[i + 1]),
+                              parabolic, linear)
+            q[i] = np.where(move, height, q[i])
+            n[i] = np.where(move, n[i] + s, n[i])
+
+    @property
+    def values(self):
+        """Current estimates: array (quantiles, parameters)."""
+
+        if self.heights is None:
+            if not self.first:
+                return np.full((len(self.probs), self.size), np.nan)
+            first = np.array(self.first)[:, :self.size]
+            return np.percentile(first, 100 * np.asarray(self.probs), axis=0)
+        return self.heights[2].reshape(len(self.probs), self.size)
+
+
+class OnlineSummary(object):
+    """
+    Mean, standard deviation, quantiles and covariance of a stream of
+    draws.
+
+    input: names -> list of str, scalar components
+           probs -> tuple of float, quantiles
+           covariance -> bool, accumulate the covariance matrix (by
+                         default, for up to MAX_COVARIANCE components)
+    """
+
+    def __init__(self, names, probs=PROBS, covariance=None):
+        self.names = list(names)
+        if covariance is None:
+            covariance = len(self.names) <= MAX_COVARIANCE
+        self.moments = Moments(len(self.names), covariance)
+        self.quantiles = P2(len(self.names), probs)
+
+    @property
+    def n(self):
+        return self.moments.n
+
+    def update(self, block):
+        """Add a block of draws (draws x components)."""
+
+        block = np.atleast_2d(np.asarray(block, dtype=float))
+        self.moments.update(block)
+        for row in block:
+            self.quantiles.update(row)
+
+    def summary(self):
+        """pandas DataFrame with columns mean, sd and the quantiles."""
+
+        table = pd.DataFrame({'mean': self.moments.mean,
+                              'sd': np.sqrt(self.moments.variance)}, index=self.names)
+        for prob, values in zip(self.quantiles.probs, self.quantiles.values):
+            table['%g%%' % (100 * prob)] = values
+
+        return table
+
+    def covariance(self):
+        """pandas DataFrame, covariance matrix of the components (or None)."""
+
+        covariance = self.moments.covariance
+        if covariance is None:
+            return None
+        return pd.DataFrame(covariance, index=self.names, columns=self.names)
+
+
+def _flatname(column):
+    """Stan CSV column name (beta.2.1) to flat name (beta[2,1])."""
+
+    base, dot, index = column.partition('.')
+    return base + ('[%s]' % index.replace('.', ',') if dot else '')
+
+
+class _File(object):
+    """A CSV file of one chain, read as it grows."""
+
+    def __init__(self, path, skip):
+        self.path = path
+        self.skip = skip                    # warmup rows
+        self.offset = 0
+        self.rest = ''
+        self.columns = None
+        self.rows = 0
+
+    def read(self):
+        """New complete lines of post-warmup draws."""
+
+        with open(self.path) as f:
+            f.seek(self.offset)
+            text = self.rest + f.read()
+            self.offset = f.tell()
+        lines = text.split('\n')
+        self.rest = lines.pop()
+
+        draws = []
+        for line in lines:
+            if not line or line.startswith('#'):
+                continue
+            if self.columns is None:
+                self.columns = line.split(',')
+                continue
+            self.rows += 1
+            if self.rows > self.skip:
+                draws.append(line)
+
+        return draws
+
+
+class Stream(object):
+    """
+    Online statistics of the draws written by StanModel.sampling, and
+    optionally a copy of the draws in a DrawStore.
+
+    Used as a context manager around the sampling call, with the
+    arguments of that call (which must include sample_file):
+
+        with Stream(kwargs) as stream:
+            fit = model.sampling(data=data, **kwargs)
+        stream.stats.summary()
+
+    input: kwargs -> dict, arguments of StanModel.sampling
+           pars -> list of str, variables to summarize (default: the
+                   variables stored in the fit, kwargs['pars'], or all
+                   but lp__)
+           probs -> tuple of float, quantiles
+           covariance -> bool, see OnlineSummary
+           interval -> float, seconds between progress reports (None for
+                       no report)
+           summary -> bool, accumulate an OnlineSummary (stats)
+           store -> str, directory of a DrawStore receiving the draws
+                    of store_pars (and lp__), or None
+           store_pars -> list of str, variables written to the store
+                         (default: those stored in the fit,
+                         kwargs['pars'], or all); Stan writes every
+                         variable to the CSV files, so this may include
+                         variables left out of the fit
+           resume -> dict, checkpoint of a run resumed by run_length
+                     (see run_length.saved), or None
+    """
+
+    def __init__(self, kwargs, pars=None, probs=PROBS, covariance=None,
+                 interval=INTERVAL, summary=True, store=None, store_pars=None,
+                 resume=None):
+        self.root, self.ext = os.path.splitext(kwargs['sample_file'])
+        iterations = kwargs.get('iter', 2000)
+        warmup = kwargs.get('warmup', iterations // 2)
+        thin = kwargs.get('thin', 1)
+        self.chains = kwargs.get('chains', 4)
+        self.skip = (warmup + thin - 1) // thin
+        self.capacity = (iterations - warmup + thin - 1) // thin
+        self.expected = self.capacity * self.chains
+
+        stored = kwargs.get('pars')         # variables kept in the fit
+        self.pars = pars if pars is not None else stored
+        self.store_pars = store_pars if store_pars is not None else stored
+        self.probs, self.covariance = probs, covariance
+        self.interval = interval
+        self.summarize, self.store_path = summary, store
+        self.resume = resume
+        # CSV files of the segments sampled before the checkpoint are stale
+        self.first = 0 if resume is None else len(resume['history']) + 1
+        self.resumed = 0 if resume is None else sum(resume['draws'])
+        self.files = {}
+        self.stats = None
+        self.store = None
+        self._index = None
+        self._names = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _chain(self, path):
+        """Chain of a CSV file: files are named root[-segmentK][_id].ext."""
+
+        name = path[len(self.root):-len(self.ext) or None]
+        return name.rpartition('_')[2] if '_' in name else '0'
+
+    def _order(self, path):
+        """Files in the order they were written: segment, then chain."""
+
+        segment = re.match(r'-segment(\d+)', path[len(self.root):])
+        return (int(segment.group(1)) if segment else 0, int(self._chain(path)))
+
+    def _resume(self):
+        """Start from the draws of the checkpoint (see resume)."""
+
+        fit, counts = self.resume['fit'], self.resume['draws']
+        if self.store_path is not None:
+            if not os.path.isfile(os.path.join(self.store_path, HEADER)):
+                raise ValueError('cannot resume: no store in %s' % self.store_path)
+            store = DrawStore(self.store_path, 'r+')
+            if (store.header['chains'] != self.chains or
+                    store.header['capacity'] != self.capacity or
+                    any(n < count for n, count in zip(store.counts, counts))):
+                raise ValueError('cannot resume: the store in %s does not hold '
+                                 'the draws of the checkpoint' % self.store_path)
+            store.header['counts'] = list(counts)
+            store.flush()
+            self.store = store
+
+        if self.summarize:
+            missing = [name for name in self.pars or [] if name not in fit.sim['pars_oi']]
+            if missing:
+                raise ValueError('cannot resume the online summary of %s: not '
+                                 'stored in the fit' % ', '.join(missing))
+            names, values = posterior.draws(fit, self.pars)
+            keep = [i for i, name in enumerate(names) if not name.endswith('__')]
+            self.stats = OnlineSummary([names[i] for i in keep], self.probs,
+                                       self.covariance)
+            for chain in range(values.shape[1]):
+                self.stats.update(values[:, chain, keep])
+
+    def _stored(self, name):
+        """True if a component is written to the store."""
+
+        base = name.partition('[')[0]
+        if self.resume is not None:         # the variables of the reopened store
+            return base in self.store.names
+        return name == 'lp__' or not name.endswith('__') and (
+            self.store_pars is None or base in self.store_pars)
+
+    def _start(self, columns):
+        names = [_flatname(column) for column in columns]
+        self._index = [i for i, name in enumerate(names)
+                       if not name.endswith('__') and
+                       (self.pars is None or name.partition('[')[0] in self.pars)]
+        if self.summarize and self.stats is None:
+            self.stats = OnlineSummary([names[i] for i in self._index],
+                                       self.probs, self.covariance)
+        if self.store_path is not None:
+            stored = [i for i, name in enumerate(names) if self._stored(name)]
+            self._names = ([names[i] for i in stored], stored)
+            if self.store is None:
+                self.store = DrawStore.create(self.store_path, self._names[0],
+                                              self.chains, self.capacity)
+
+    def _poll(self, final=False):
+        for path in sorted(glob.glob(self.root + '*' + self.ext)):
+            if path not in self.files and self._order(path)[0] >= self.first:
+                # continuation segments of run_length have no warmup
+                skip = 0 if '-segment' in path[len(self.root):] else self.skip
+                self.files[path] = _File(path, skip)
+
+        # chains are numbered once all of them have started
+        ids = sorted(set(self._chain(path) for path in self.files), key=int)
+        if len(ids) < self.chains and not final:
+            return
+
+        for path in sorted(self.files, key=self._order):
+            chain = self.files[path]
+            lines = chain.read()
+            if not lines:
+                continue
+            if self._index is None:
+                self._start(chain.columns)
+            block = np.array([line.split(',') for line in lines], dtype=float)
+            if self.stats is not None:
+                self.stats.update(block[:, self._index])
+            if self.store is not None:
+                self.store.append(ids.index(self._chain(path)), self._names[0],
+                                  block[:, self._names[1]])
+
+        if self.store is not None:
+            self.store.flush()
+
+    def report(self):
+        """One line with the number of post-warmup draws read so far."""
+
+        read = [max(0, chain.rows - chain.skip) for path, chain in sorted(self.files.items())]
+        return ('%d of %d post-warmup draws (%s)'
+                % (self.resumed + sum(read), self.expected,
+                   ', '.join('%d' % n for n in read)))
+
+    def _run(self):
+        last = time.time()
+        while not self._stop.wait(0.5):
+            self._poll()
+            if self.interval is not None and time.time() - last >= self.interval:
+                sys.stderr.write('online: %s\n' % self.report())
+                last = time.time()
+
+    def __enter__(self):
+        if self.resume is not None:
+            self._resume()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._poll(final=True)
+        if self.interval is not None:
+            sys.stderr.write('online: %s\n' % self.report())
+        return False
+
+
+def sample_file():
+    """A new temporary path for the CSV files of the chains."""
+
+    handle, path = tempfile.mkstemp(prefix='bmad-draws-', suffix='.csv')
+    os.close(handle)
+    os.remove(path)
+    return path
+
+
+def remove(path):
+    """Remove the CSV files of the chains written to sample_file path."""
+
+    root, ext = os.path.splitext(path)
+    for name in glob.glob(root + '*' + ext):
+        os.remove(name)
@@ -0,0 +1,203 @@
+"""
+Warm starts for NUTS from fast point estimates.
+
+By default Stan draws initial values uniformly in (-2, 2) on the
+unconstrained scale and starts the adaptation with a unit metric, so
+a large share of the warmup is spent finding the typical set and
+learning the scale of each parameter. Both are cheap to estimate
+beforehand:
+
+    mode      the posterior mode, i.e. the maximum likelihood estimate
+              penalized by the priors, found with L-BFGS
+              (StanModel.optimizing). For the generic regressions the
+              optimizer starts from the statsmodels GLM estimates
+              (glm_estimates); for the other programs (hurdle,
+              zero-inflated, NB-P, generalized Poisson, ...) from Stan's
+              init=0 point.
+    scales    the curvature of the log density at the mode, in the
+              unconstrained space where NUTS moves: the diagonal of the
+              inverse of the negative Hessian is the variance of each
+              coordinate.
+
+warm_start() turns them into one jittered initial point per chain and a
+diagonal inverse metric, passed to StanModel.sampling as init and
+control['inv_metric']. The warmup then only needs to refine the step
+size and the metric, and a few hundred iterations are enough for the
+models of the book. stan_cache.sampling(..., warm_start=True) does it
+for any script.
+"""
+
+import os
+import sys
+
+import numpy as np
+import statsmodels.api as sm
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stan_lint import parameter_names
+
+
+# largest number of unconstrained parameters for which the full Hessian
+# is inverted; above it, each coordinate is scaled by its own curvature
+MAX_DENSE = 500
+
+
+def _values(fit, names, upar):
+    """
+    Constrained values of the parameters at a point of the unconstrained
+    space.
+
+    input: fit -> pystan StanFit4Model of the program
+           names -> list of str, parameter names (see parameter_names)
+           upar -> array, unconstrained parameters
+
+    output: dict, parameter name -> value, as expected by init
+    """
+
+    flat = np.asarray(fit.constrain_pars(np.asarray(upar, dtype=float)))
+    dims = dict(zip(fit.model_pars, fit.par_dims))
+
+    values, i = {}, 0
+    for name in names:
+        shape = tuple(dims[name])
+        n = int(np.prod(shape))
+        values[name] = (flat[i:i + n].reshape(shape, order='F') if shape
+                        else float(flat[i]))
+        i += n
+
+    return values
+
+
+def _variances(fit, upar, step=1e-4):
+    """
+    Variance of each unconstrained coordinate, from the Hessian of the
+    log density at upar (central differences of the gradient).
+    """
+
+    n = len(upar)
+    gradient = lambda u: np.asarray(fit.grad_log_prob(u, adjust_transform=True))
+
+    if n > MAX_DENSE:
+        curvature = np.empty(n)
+        for j in range(n):
+            e = np.zeros(n)
+            e[j] = step
+            curvature[j] = -(gradient(upar + e)[j] - gradient(upar - e)[j]) / (2 * step)
+        variances = 1 / curvature
+    else:
+        H = np.empty((n, n))
+        for j in range(n):
+            e = np.zeros(n)
+            e[j] = step
+            H[:, j] = (gradient(upar + e) - gradient(upar - e)) / (2 * step)
+        H = (H + H.T) / 2
+        try:
+            variances = np.diag(np.linalg.inv(-H)).copy()   # diag is read-only
+        except np.linalg.LinAlgError:
+            variances = np.full(n, np.nan)
+        curvature = -np.diag(H)
+
+        # flat or non-concave directions: conditional variance, or unit scale
+        bad = ~np.isfinite(variances) | (variances <= 0)
+        variances[bad] = np.where(curvature[bad] > 0, 1 / curvature[bad], 1.0)
+
+    return np.where(np.isfinite(variances) & (variances > 0), variances, 1.0)
+
+
+def warm_start(model, data, chains=4, start=None, jitter=1.0, seed=None):
+    """
+    Initial values and inverse metric for NUTS from the posterior mode.
+
+    input: model -> pystan.StanModel
+           data -> dict, data for the model
+           chains -> int, number of chains
+           start -> dict, starting values of the optimizer for some of the
+                    parameters (e.g. from glm_estimates); the others
+                    start at Stan's init=0 point
+           jitter -> float, standard deviation of the initial values
+                     around the mode, in units of the posterior scale
+           seed -> int, seed of the optimizer and of the jitter
+
+    output: dict with keys
+            'init' -> list of dict, initial values of each chain
+            'inv_metric' -> array, diagonal inverse metric
+    """
+
+    rng = np.random.RandomState(seed)
+    seed = rng.randint(2 ** 31 - 1)
+    names = parameter_names(model.model_code)
+
+    # a fit gives access to the log density and to the transforms
+    fit = model.sampling(data=data, iter=1, chains=1, seed=seed,
+                         algorithm='Fixed_param')
+    npars = len(fit.unconstrained_param_names())
+
+    init = _values(fit, names, np.zeros(npars))
+    init.update(start or {})
+    mode = model.optimizing(data=data, init=[init], seed=seed, as_vector=False)['par']
+
+    upar = np.asarray(fit.unconstrain_pars(dict((name, mode[name]) for name in names)))
+    variances = _variances(fit, upar)
+    scale = jitter * np.sqrt(variances)
+
+    return {'init': [_values(fit, names, upar + scale * rng.standard_normal(npars))
+                     for chain in range(chains)],
+            'inv_metric': variances}
+
+
+def _link(name):
+    """statsmodels link function by name (the class names changed case)."""
+
+    links = sm.families.links
+    return getattr(links, name.capitalize(), None) or getattr(links, name)
+
+
+def glm_estimates(X, Y, family, link=None, zero=None, trials=None):
+    """
+    Maximum likelihood estimates of the coefficients of a generic
+    regression (see stan_models.py) with statsmodels.
+
+    For the zero processes, beta is estimated from the positive values
+    and, for a hurdle, gamma from a logistic regression of the zero
+    indicator. The lognormal family with log link and the beta family are
+    left to the optimizer.
+
+    input: X -> array, design matrix (N x K), including the intercept
+           Y -> array, response variable
+           family, link, zero -> see stan_models.glm_code
+           trials -> array, number of trials (binomial family only)
+
+    output: dict, parameter name -> estimate
+    """
+
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    Y = np.asarray(Y, dtype=float)
+
+    estimates = {}
+    if zero == 'hurdle':
+        estimates['gamma'] = sm.GLM((Y == 0).astype(float), X,
+                                    family=sm.families.Binomial()).fit().params
+    if zero in ('hurdle', 'inflated'):
+        X, Y = X[Y > 0], Y[Y > 0]
+
+    if family == 'normal':
+        response, glm_family = Y, sm.families.Gaussian()
+    elif family == 'lognormal' and link in (None, 'identity'):
+        response, glm_family = np.log(Y), sm.families.Gaussian()
+    elif family == 'gamma':
+        response, glm_family = Y, sm.families.Gamma(_link('log')())
+    elif family in ('bernoulli', 'binomial'):
+        response = Y if family == 'bernoulli' else np.column_stack(
+            (Y, np.asarray(trials) - Y))
+        glm_family = sm.families.Binomial(_link(link or 'logit')())
+    elif family == 'poisson':
+        response, glm_family = Y, sm.families.Poisson()
+    elif family == 'negbinomial':
+        response, glm_family = Y, sm.families.NegativeBinomial()
+    else:
+        return estimates
+
+    estimates['beta'] = sm.GLM(response, X, family=glm_family).fit().params
+    return estimates
@@ -0,0 +1,67 @@
+"""
+Gradient evaluations per second of the generic Bernoulli, Poisson and
+normal regressions of the shared library, fitted to every observation
+and to data compressed to one row per covariate pattern.
+
+The design has an intercept, two binary covariates and a covariate with
+10 levels, so there are at most 40 distinct patterns whatever N is.
+
+Usage:
+
+    python compression.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import compare
+from compression import FAMILIES
+from stan_models import glm_code, glm_data
+
+
+def simulate(family, N, seed=18472):
+    """Synthetic data with N observations and few covariate patterns."""
+
+    rng = np.random.RandomState(seed)
+    X = np.column_stack((np.ones(N), rng.binomial(1, 0.7, size=N),
+                         rng.binomial(1, 0.4, size=N),
+                         rng.randint(10, size=N) / 10.0))
+
+    eta = np.dot(X, [0.5, -1.5, 1.0, 2.0])
+    if family == 'bernoulli':
+        y = rng.binomial(1, 1 / (1 + np.exp(-eta)))
+    elif family == 'poisson':
+        y = rng.poisson(np.exp(eta))
+    else:
+        y = rng.normal(eta, 1.0)
+
+    return family, X, y
+
+
+def full_data(dataset):
+    """Data of the program fitting every observation."""
+
+    family, X, y = dataset
+    return glm_data(X, y, family)
+
+
+def compressed_data(dataset):
+    """Data of the program fitting one row per covariate pattern."""
+
+    family, X, y = dataset
+    return glm_data(X, y, family, compress=True)
+
+
+if __name__ == '__main__':
+    sizes = [1000, 10000, 100000]
+
+    for family in ['bernoulli', 'poisson', 'normal']:
+        print('\n%s' % family)
+        datasets = [('N = %d' % N, simulate(family, N)) for N in sizes]
+        compare([('full', glm_code(family), full_data),
+                 ('compressed', glm_code(FAMILIES[family], compressed=True),
+                  compressed_data)], datasets)
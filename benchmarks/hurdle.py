@@ -0,0 +1,220 @@
+"""
+Gradient evaluations per second of the hurdle models of chapter 7,
+before and after partitioning zeros and positive values in transformed
+data (codes 7.8, 7.10, 7.12 and 7.14/10.21).
+
+Usage:
+
+    python hurdle.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import compare, stan_program
+from stan_models import glm_code, glm_data
+
+
+# original per-observation programs
+poisson_loop = """
+data{
+    int<lower=0> N;
+    int<lower=0> Kb;
+    int<lower=0> Kc;
+    matrix[N, Kb] Xb;
+    matrix[N, Kc] Xc;
+    int<lower=0> Y[N];
+}
+parameters{
+    vector[Kc] beta;
+    vector[Kb] gamma;
+    real<lower=0, upper=5.0> r;
+    
+}
+transformed parameters{
+    vector[N] mu;
+    vector[N] Pi;
+
+    mu = exp(Xc * beta);
+    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+}
+model{
+    for (i in 1:N) {
+        (Y[i] == 0) ~ bernoulli(1-Pi[i]);
+        if (Y[i] > 0) Y[i] ~ poisson(mu[i]) T[1,];
+    }
+}
+"""
+
+negbinomial_loop = """
+data{
+    int<lower=0> N;
+    int<lower=0> Kb;
+    int<lower=0> Kc;
+    matrix[N, Kb] Xb;
+    matrix[N, Kc] Xc;
+    int<lower=0> Y[N];
+}
+parameters{
+    vector[Kc] beta;
+    vector[Kb] gamma;
+    real<lower=0, upper=5.0> alpha;
+}
+transformed parameters{
+    vector[N] mu;
+    vector[N] Pi;
+    vector[N] temp;
+    vector[N] u;
+    mu = exp(Xc * beta);
+    temp = Xb * gamma;
+    for (i in 1:N) {
+        Pi[i] = inv_logit(temp[i]);
+        u[i] = 1.0/(1.0 + alpha * mu[i]);
+    }
+}
+model{
+    vector[N] LogTrunNB;
+    vector[N] z;
+    vector[N] l1;
+    vector[N] l2;
+    vector[N] ll;
+    for (i in 1:Kc){
+        beta[i] ~ normal(0, 100);
+        gamma[i] ~ normal(0, 100);
+    }
+    for (i in 1:N) {
+        LogTrunNB[i] = (1.0/alpha) * log(u[i]) + Y[i] * log(1 - u[i]) +
+                                    lgamma(Y[i] + 1.0/alpha) - lgamma(1.0/alpha) -
+                                    lgamma(Y[i] + 1) - log(1 - pow(u[i],1.0/alpha));
+                                    z[i] = step(Y[i] - 0.0001);
+        l1[i] = (1 - z[i]) * log(1 - Pi[i]);
+        l2[i] = z[i] * (log(Pi[i]) + LogTrunNB[i]);
+        ll[i] = l1[i] + l2[i];
+    }
+    target += ll;
+}
+"""
+
+gamma_loop = """
+data{
+    int N;
+    int Kb;
+    int Kc;
+    matrix[N, Kb] Xb;
+    matrix[N, Kc] Xc;
+    real<lower=0> Y[N];
+}
+parameters{
+    vector[Kc] beta;
+    vector[Kb] gamma;
+    real<lower=0> phi;
+}
+model{
+    vector[N] mu;
+    vector[N] Pi;
+    mu = exp(Xc * beta);
+
+    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+
+    for (i in 1:N) {
+        (Y[i] == 0) ~ bernoulli(Pi[i]);
+        if (Y[i] > 0) Y[i] ~ gamma(mu[i], phi) T[0,];
+    }
+}
+"""
+
+lognormal_loop = """
+data{
+    int<lower=0> N;
+    int<lower=0> Kb;
+    int<lower=0> Kc;
+    matrix[N, Kb] Xb;
+    matrix[N, Kc] Xc;
+    real<lower=0> Y[N];
+}
+parameters{
+    vector[Kc] beta;
+    vector[Kb] gamma;
+    real<lower=0> sigmaLN;
+}
+model{
+    vector[N] mu;
+    vector[N] Pi;
+
+    mu = exp(Xc * beta);
+    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+
+    for (i in 1:N) {
+        (Y[i] == 0) ~ bernoulli(Pi[i]);
+        if (Y[i] > 0) Y[i] ~ lognormal(mu[i], sigmaLN);
+    }
+}
+"""
+
+
+def simulate(family, N, seed=141):
+    """Synthetic hurdle data with N observations and one covariate."""
+
+    rng = np.random.RandomState(seed)
+    x1 = rng.uniform(size=N)
+    X = np.column_stack((np.ones(N), x1))
+
+    mu = np.exp(0.5 + 1.5 * x1)
+    if family == 'poisson':
+        y = np.maximum(rng.poisson(mu), 1)
+    elif family == 'negbinomial':
+        y = np.maximum(rng.negative_binomial(2, 2 / (2 + mu)), 1)
+    elif family == 'gamma':
+        y = rng.gamma(2.0, mu / 2.0)
+    else:
+        y = rng.lognormal(np.log(mu), 0.4)
+
+    zero = rng.uniform(size=N) < 1 / (1 + np.exp(1 - 2 * x1))
+    y[zero] = 0
+
+    return X, y
+
+
+def split_data(dataset):
+    """Data of the original programs, with duplicated design matrices."""
+
+    X, y = dataset
+    return {'N': X.shape[0], 'Kb': X.shape[1], 'Kc': X.shape[1],
+            'Xb': X, 'Xc': X, 'Y': y}
+
+
+def shared_data(dataset):
+    """Data of the vectorized programs, with a single design matrix."""
+
+    X, y = dataset
+    return {'N': X.shape[0], 'K': X.shape[1], 'X': X, 'Y': y}
+
+
+def library_data(dataset):
+    """Data of the lognormal hurdle from the shared library."""
+
+    X, y = dataset
+    return glm_data(X, y, 'lognormal', zero='hurdle')
+
+
+if __name__ == '__main__':
+    sizes = [750, 10000, 100000]
+
+    cases = [('poisson', poisson_loop, stan_program('chapter_7/code_7.8.py'),
+              shared_data),
+             ('negbinomial', negbinomial_loop,
+              stan_program('chapter_7/code_7.10.py'), shared_data),
+             ('gamma', gamma_loop, stan_program('chapter_7/code_7.12.py'),
+              shared_data),
+             ('lognormal', lognormal_loop,
+              glm_code('lognormal', 'log', 'hurdle'), library_data)]
+
+    for family, loop, vectorized, make_data in cases:
+        print('\n%s hurdle' % family)
+        datasets = [('N = %d' % N, simulate(family, N)) for N in sizes]
+        compare([('loop', loop, split_data),
+                 ('vectorized', vectorized, make_data)], datasets)
@@ -0,0 +1,56 @@
+"""
+Effective sample size per second of the random intercept Poisson model
+of code 8.15 with centered and non-centered random intercepts, for small
+and large groups, and the parameterization hierarchical.noncentered
+chooses in each case.
+
+Like qr.py, this benchmark runs the sampler. The ESS is the smallest
+n_eff over the random intercepts and their scale, and divergent
+transitions after warmup are counted.
+
+Usage:
+
+    python noncentered.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import ess_rate, stan_program
+from hierarchical import noncentered
+from stan_cache import compile_model
+
+
+def simulate(NGroups, size, seed=1656):
+    """Data of code 8.15 with NGroups groups of size observations."""
+
+    rng = np.random.RandomState(seed)
+    N = NGroups * size
+    X = np.column_stack((np.ones(N), rng.uniform(size=N), rng.uniform(size=N)))
+    groups = np.repeat(np.arange(NGroups), size)
+    a = rng.normal(0, 0.5, size=NGroups)
+    y = rng.poisson(np.exp(np.dot(X, [1.0, 0.2, -0.75]) + a[groups]))
+
+    return {'N': N, 'K': 3, 'NGroups': NGroups, 'X': X, 'Y': y,
+            're': groups + 1, 'b0': np.zeros(3), 'B0': np.diag(np.repeat(100, 3)),
+            'a0': np.zeros(NGroups), 'A0': np.diag(np.ones(NGroups))}
+
+
+if __name__ == '__main__':
+    model = compile_model(stan_program('chapter_8/code_8.15.py'))
+
+    print('%-20s%10s%32s%32s' % ('groups', 'chosen', 'centered (ESS/s, ESS, div)',
+                                 'non-centered (ESS/s, ESS, div)'))
+
+    for NGroups, size in [(50, 3), (50, 20), (10, 200)]:
+        data = simulate(NGroups, size)
+        rates = [ess_rate(model, dict(data, noncentered=flag), ['sigma_re', 'a'])
+                 for flag in (0, 1)]
+        chosen = 'non-c.' if noncentered(data['re']) else 'centered'
+        print('%-20s%10s' % ('%d x %d obs' % (NGroups, size), chosen) +
+              ''.join('%14.1f %8.0f %8d' % (rate, ess, div)
+                      for rate, ess, seconds, div in rates))
@@ -0,0 +1,209 @@
+"""
+Gradient evaluations per second of the random intercept models of
+chapter 8 (codes 8.4 and 8.15) and of the random intercept and slope
+model (code 8.18), before and after replacing the per-observation loops
+with multi-indexing of the random effects and log-link likelihoods.
+The current program of code 8.18 also has independent normal priors
+instead of multi_normal ones; random_slopes.py measures that change.
+
+Code 8.23 is not included: its parameterization of the negative binomial
+is only defined for alpha < 1, which the default initialization of the
+benchmark does not guarantee.
+
+Usage:
+
+    python random_effects.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import compare, stan_program
+
+
+# original per-observation programs
+normal_loop = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    int<lower=0> NGroups;
+    matrix[N, K] X;
+    real Y[N];
+    int re[N];
+    vector[K] b0;
+    matrix[K, K] B0;
+    vector[NGroups] a0;
+    matrix[NGroups, NGroups] A0;
+}
+parameters{
+    vector[K] beta;
+    vector[NGroups] a;
+    real<lower=0> sigma_plot;
+    real<lower=0> sigma_eps;
+}
+transformed parameters{
+    vector[N] eta;
+    vector[N] mu; 
+ 
+    eta = X * beta;
+    for (i in 1:N){ 
+        mu[i] = eta[i] + a[re[i]+1];
+    }
+}
+model{    
+    sigma_plot ~ cauchy(0, 25);
+    sigma_eps ~ cauchy(0, 25);
+
+    beta ~ multi_normal(b0, B0);
+    a ~ multi_normal(a0, sigma_plot * A0);
+
+    Y ~ normal(mu, sigma_eps);  
+}
+"""
+
+poisson_loop = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    int<lower=0> NGroups;
+    matrix[N, K] X;
+    int Y[N];
+    int re[N];
+    vector[K] b0;
+    matrix[K, K] B0;
+    vector[NGroups] a0;
+    matrix[NGroups, NGroups] A0;
+}
+parameters{
+    vector[K] beta;
+    vector[NGroups] a;
+    real<lower=0, upper=10> sigma_re;
+}
+transformed parameters{
+    vector[N] eta;
+    vector[N] mu; 
+ 
+    eta = X * beta;
+    for (i in 1:N){ 
+        mu[i] = exp(eta[i] + a[re[i]+1]);
+    }
+}
+model{    
+    sigma_re ~ cauchy(0, 25);
+
+    beta ~ multi_normal(b0, B0);
+    a ~ multi_normal(a0, sigma_re * A0);
+
+    Y ~ poisson(mu);  
+}
+"""
+
+slopes_loop = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    int<lower=0> NGroups;
+    matrix[N, K] X;
+    int Y[N];
+    int re[N];
+    vector[K] b0;
+    matrix[K, K] B0;
+    vector[NGroups] a0;
+    matrix[NGroups, NGroups] A0;
+}
+parameters{
+    vector[K] beta;
+    vector[NGroups] a;
+    vector[NGroups] b;
+    real<lower=0> sigma_ri;
+    real<lower=0> sigma_rs;
+}
+transformed parameters{
+    vector[N] eta;
+    vector[N] mu; 
+ 
+    eta = X * beta;
+    for (i in 1:N){ 
+        mu[i] = exp(eta[i] + a[re[i]+1] + b[re[i] + 1] * X[i,2]);
+    }
+}
+model{    
+    sigma_ri ~ gamma(0.01, 0.01);
+    sigma_rs ~ gamma(0.01, 0.01);
+
+    beta ~ multi_normal(b0, B0);
+    a ~ multi_normal(a0, sigma_ri * A0);
+    b ~ multi_normal(a0, sigma_rs * A0);
+
+    Y ~ poisson(mu);  
+}
+"""
+
+
+def simulate(family, N, NGroups=10, seed=1656):
+    """Synthetic data with N observations in NGroups groups of equal size."""
+
+    rng = np.random.RandomState(seed)
+    x1 = rng.uniform(size=N)
+    x2 = rng.binomial(1, 0.5, size=N)
+    X = np.column_stack((np.ones(N), x1, x2))
+
+    groups = np.repeat(np.arange(NGroups), N // NGroups)
+    a = rng.normal(0, 0.1, size=NGroups)
+    b = rng.normal(0, 0.35, size=NGroups)
+
+    if family == 'normal':
+        y = rng.normal(np.dot(X, [1.0, 0.5, -0.5]) + a[groups], 1.0)
+    elif family == 'poisson':
+        y = rng.poisson(np.exp(np.dot(X, [1.0, 0.5, -0.5]) + a[groups]))
+    else:
+        y = rng.poisson(np.exp(np.dot(X, [1.0, 4.0, -7.0]) + a[groups] +
+                               b[groups] * x1))
+
+    return X, y, groups, NGroups
+
+
+def make_data(dataset, base=1):
+    """Data dictionary, with group indices starting at base."""
+
+    X, y, groups, NGroups = dataset
+    return {'N': X.shape[0], 'K': X.shape[1], 'NGroups': NGroups,
+            'X': X, 'Y': y, 're': groups + base,
+            'b0': np.zeros(X.shape[1]), 'B0': np.diag(np.repeat(100, X.shape[1])),
+            'a0': np.zeros(NGroups), 'A0': np.diag(np.ones(NGroups)),
+            'noncentered': 0}
+
+
+def make_data_loop(dataset):
+    """Data dictionary of the original programs, with 0-based groups."""
+
+    return make_data(dataset, base=0)
+
+
+def make_data_diagonal(dataset):
+    """Data dictionary of code 8.18, with the prior variances of beta."""
+
+    data = make_data(dataset)
+    data['B0'] = np.diag(data['B0'])
+    return data
+
+
+if __name__ == '__main__':
+    sizes = [5000, 50000]
+
+    cases = [('normal', normal_loop, stan_program('chapter_8/code_8.4.py'),
+              make_data),
+             ('poisson', poisson_loop, stan_program('chapter_8/code_8.15.py'),
+              make_data),
+             ('random slopes', slopes_loop,
+              stan_program('chapter_8/code_8.18.py'), make_data_diagonal)]
+
+    for family, loop, indexed, indexed_data in cases:
+        print('\n%s' % family)
+        datasets = [('N = %d' % N, simulate(family, N)) for N in sizes]
+        compare([('loop', loop, make_data_loop),
+                 ('indexed', indexed, indexed_data)], datasets)
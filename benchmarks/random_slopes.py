@@ -0,0 +1,104 @@
+"""
+Gradient evaluations per second of the random intercept and slope
+Poisson model of code 8.18 as the number of groups grows, with
+
+    multi_normal    the former priors, with dense diagonal covariance
+                    matrices of size K x K and NGroups x NGroups
+    normal          independent vectorized normal priors (stan_code)
+    lkj             correlated intercepts and slopes, non-centered, with
+                    an LKJ prior on their correlation (stan_code_lkj)
+
+There are 50 observations per group. The multi_normal program factorizes
+an NGroups x NGroups matrix at every evaluation, so it is only run up to
+1000 groups.
+
+Usage:
+
+    python random_slopes.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import compare, stan_program
+
+
+# code 8.18 before the priors were made independent
+slopes_dense = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    int<lower=0> NGroups;
+    matrix[N, K] X;
+    int Y[N];
+    int<lower=1, upper=NGroups> re[N];
+    vector[K] b0;
+    matrix[K, K] B0;
+    vector[NGroups] a0;
+    matrix[NGroups, NGroups] A0;
+}
+transformed data{
+    vector[N] x1 = col(X, 2);
+}
+parameters{
+    vector[K] beta;
+    real<lower=0> sigma_ri;
+    real<lower=0> sigma_rs;
+    vector[NGroups] a;
+    vector[NGroups] b;
+}
+model{
+    sigma_ri ~ gamma(0.01, 0.01);
+    sigma_rs ~ gamma(0.01, 0.01);
+
+    beta ~ multi_normal(b0, B0);
+    a ~ multi_normal(a0, sigma_ri * A0);
+    b ~ multi_normal(a0, sigma_rs * A0);
+
+    Y ~ poisson_log(X * beta + a[re] + b[re] .* x1);
+}
+"""
+
+
+def simulate(NGroups, size=50, seed=1656):
+    """Data of code 8.18 with NGroups groups of size observations."""
+
+    rng = np.random.RandomState(seed)
+    N = NGroups * size
+    x1 = rng.uniform(size=N)
+    X = np.column_stack((np.ones(N), x1, (x1 > 0.5).astype(float)))
+    groups = np.repeat(np.arange(NGroups), size)
+    a = rng.normal(0, 0.1, size=NGroups)
+    b = rng.normal(0, 0.35, size=NGroups)
+    y = rng.poisson(np.exp(np.dot(X, [1.0, 4.0, -7.0]) + a[groups] +
+                           b[groups] * x1))
+
+    return {'N': N, 'K': 3, 'NGroups': NGroups, 'X': X, 'Y': y,
+            're': groups + 1, 'b0': np.zeros(3), 'B0': np.repeat(100, 3),
+            'noncentered': 0}
+
+
+def dense_data(data):
+    """Data of the multi_normal program."""
+
+    NGroups = data['NGroups']
+    return dict(data, B0=np.diag(data['B0']), a0=np.zeros(NGroups),
+                A0=np.diag(np.ones(NGroups)))
+
+
+if __name__ == '__main__':
+    script = 'chapter_8/code_8.18.py'
+    normal = ('normal', stan_program(script), lambda data: data)
+    lkj = ('lkj', stan_program(script, 'stan_code_lkj'), lambda data: data)
+
+    print('up to 1000 groups')
+    compare([('multi_normal', slopes_dense, dense_data), normal, lkj],
+            [('J = %d' % J, simulate(J)) for J in [10, 100, 1000]])
+
+    print('\nthousands of groups')
+    compare([normal, lkj],
+            [('J = %d' % J, simulate(J)) for J in [2000, 5000, 10000]])
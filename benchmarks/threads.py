@@ -0,0 +1,116 @@
+"""
+Scaling of the within-chain parallel programs of codes 7.5, 8.18 and
+10.19 with the number of threads per chain.
+
+Each program evaluates its likelihood in shards with map_rect. The table
+shows the gradient evaluations per second of the sequential program and
+of the sharded one with 1 to 32 threads, and the speedup of each relative
+to the sequential program. The data are simulated with 10 times the
+number of observations of the book examples.
+
+Usage:
+
+    python threads.py [grain]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import gradient_rate, stan_program
+from stan_cache import compile_model, THREADS
+
+
+def zinb(N, seed=141):
+    """Zero-inflated negative binomial data, as in code 7.5."""
+
+    rng = np.random.RandomState(seed)
+    X = np.column_stack((np.ones(N), rng.uniform(size=N),
+                         rng.binomial(1, 0.6, size=N)))
+
+    mu = np.exp(np.dot(X, [1.0, 2.0, 1.5]))
+    pi = 1 / (1 + np.exp(-np.dot(X, [2.0, -5.0, 3.0])))
+    y = rng.negative_binomial(0.5, 0.5 / (0.5 + mu))
+    y[rng.uniform(size=N) < pi] = 0
+
+    return {'N': N, 'K': 3, 'X': X, 'Y': y}
+
+
+def random_slopes(N, NGroups=10, seed=1656):
+    """Poisson data with random intercepts and slopes, as in code 8.18."""
+
+    rng = np.random.RandomState(seed)
+    x1 = rng.uniform(size=N)
+    X = np.column_stack((np.ones(N), x1, (x1 > 0.5).astype(float)))
+    re = np.repeat(np.arange(NGroups), N // NGroups)
+    a = rng.normal(0, 0.1, size=NGroups)
+    b = rng.normal(0, 0.35, size=NGroups)
+    y = rng.poisson(np.exp(np.dot(X, [1.0, 4.0, -7.0]) + a[re] + b[re] * x1))
+
+    return {'N': N, 'K': 3, 'NGroups': NGroups, 'X': X, 'Y': y, 're': re + 1,
+            'b0': np.zeros(3), 'B0': np.repeat(100, 3), 'noncentered': 0}
+
+
+def populations(N, seed=1056):
+    """Bernoulli data from two populations, as in code 10.19."""
+
+    rng = np.random.RandomState(seed)
+    X = np.column_stack((np.ones(N), rng.normal(13, 1, size=N),
+                         rng.uniform(size=N)))
+    gal = rng.binomial(1, 0.5, size=N) + 1
+    beta = np.array([[-0.5, 0.5], [0.1, -0.1], [-1.0, 1.0]])
+    eta = np.sum(X * beta[:, gal - 1].T, axis=1)
+    y = rng.binomial(1, 1 / (1 + np.exp(-(eta - eta.mean()))))
+
+    return {'N': N, 'K': 3, 'P': 2, 'X': X, 'Y': y, 'gal': gal,
+            'noncentered': 0}
+
+
+def scaling(script, data, threads, grain, min_time=2.0):
+    """
+    Gradient evaluations per second of the sequential and sharded programs
+    of a script.
+
+    input: script -> str, path relative to the repository root
+           data -> dict, data of the sequential program
+           threads -> list of int, numbers of threads per chain
+           grain -> int, observations per shard
+           min_time -> float, minimum duration of each measurement
+
+    output: tuple of float (sequential rate) and list of float
+            (sharded rate for each number of threads)
+    """
+
+    sequential = compile_model(stan_program(script))
+    sharded = compile_model(stan_program(script, 'stan_code_parallel'),
+                            **THREADS)
+
+    base = gradient_rate(sequential, data, min_time)
+
+    rates = []
+    for n in threads:
+        os.environ['STAN_NUM_THREADS'] = str(n)
+        rates.append(gradient_rate(sharded, dict(data, grain=grain), min_time))
+
+    return base, rates
+
+
+if __name__ == '__main__':
+    grain = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = [1, 2, 4, 8, 16, 32]
+
+    cases = [('chapter_7/code_7.5.py', zinb(75000)),
+             ('chapter_8/code_8.18.py', random_slopes(50000)),
+             ('chapter_10/code_10.19.py', populations(17440))]
+
+    print('grain = %d' % grain)
+    print('%-26s%16s' % ('program', 'sequential') +
+          ''.join('%16s' % ('%d threads' % n) for n in threads))
+
+    for script, data in cases:
+        base, rates = scaling(script, data, threads, grain)
+        print('%-26s%14.1f/s' % (script, base) +
+              ''.join('%9.1f (x%4.1f)' % (rate, rate / base) for rate in rates))
@@ -0,0 +1,150 @@
+"""
+Gradient evaluations per second of the zero-inflated Poisson (code 7.2)
+and negative binomial (code 7.5) models, before and after splitting
+zeros from non-zero counts in transformed data.
+
+Usage:
+
+    python zero_inflated.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import compare, stan_program
+
+
+# original per-observation programs
+poisson_loop = """
+data{
+    int N;
+    int Kb;
+    int Kc;
+    matrix[N, Kb] Xb;
+    matrix[N, Kc] Xc;
+    int Y[N];
+}
+parameters{
+    vector[Kc] beta;
+    vector[Kb] gamma;
+    
+}
+transformed parameters{
+    vector[N] mu;
+    vector[N] Pi;
+
+    mu = exp(Xc * beta);
+    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+}
+model{
+    real LL[N];
+
+    for (i in 1:N) {
+        if (Y[i] == 0) {
+            LL[i] = log_sum_exp(bernoulli_lpmf(1|Pi[i]), 
+                               bernoulli_lpmf(0|Pi[i]) + 
+                               poisson_lpmf(Y[i]|mu[i]));
+        } else {
+            LL[i] = bernoulli_lpmf(0|Pi[i]) +
+                               poisson_lpmf(Y[i]|mu[i]);
+        }
+    }
+    
+    target += LL;
+}
+"""
+
+negbinomial_loop = """
+data{
+    int N;
+    int Kb;
+    int Kc;
+    matrix[N, Kb] Xb;
+    matrix[N, Kc] Xc;
+    int Y[N];
+}
+parameters{
+    vector[Kc] beta;
+    vector[Kb] gamma;
+    real<lower=0> alpha;
+    
+}
+transformed parameters{
+    vector[N] mu;
+    vector[N] Pi;
+
+    mu = exp(Xc * beta);
+    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+}
+model{
+    vector[N] LL;
+
+    alpha ~ gamma(0.001, 0.001);
+
+
+    for (i in 1:N) {
+        if (Y[i] == 0) {
+            LL[i] = log_sum_exp(bernoulli_lpmf(1| Pi[i]), 
+                               bernoulli_lpmf(0| Pi[i]) + 
+                               neg_binomial_2_lpmf(Y[i]| mu[i], 1/alpha));
+        } else {
+            LL[i] = bernoulli_lpmf(0| Pi[i]) + 
+                               neg_binomial_2_lpmf(Y[i]| mu[i], 1/alpha);
+        }
+    }
+    target += LL;
+}
+"""
+
+
+def simulate(family, N, seed=141):
+    """Synthetic zero-inflated counts with N observations, as in code 7.5."""
+
+    rng = np.random.RandomState(seed)
+    x1 = rng.uniform(size=N)
+    x2 = rng.binomial(1, 0.6, size=N)
+    X = np.column_stack((np.ones(N), x1, x2))
+
+    mu = np.exp(1.0 + 2.0 * x1 + 1.5 * x2)
+    if family == 'poisson':
+        y = rng.poisson(mu)
+    else:
+        y = rng.negative_binomial(0.5, 0.5 / (0.5 + mu))
+
+    zero = rng.uniform(size=N) < 1 / (1 + np.exp(-(2.0 - 5.0 * x1 + 3.0 * x2)))
+    y[zero] = 0
+
+    return X, y
+
+
+def split_data(dataset):
+    """Data of the original programs, with duplicated design matrices."""
+
+    X, y = dataset
+    return {'N': X.shape[0], 'Kb': X.shape[1], 'Kc': X.shape[1],
+            'Xb': X, 'Xc': X, 'Y': y}
+
+
+def shared_data(dataset):
+    """Data of the vectorized programs, with a single design matrix."""
+
+    X, y = dataset
+    return {'N': X.shape[0], 'K': X.shape[1], 'X': X, 'Y': y}
+
+
+if __name__ == '__main__':
+    sizes = [750, 7500, 100000]
+
+    cases = [('poisson', poisson_loop, stan_program('chapter_7/code_7.2.py')),
+             ('negbinomial', negbinomial_loop,
+              stan_program('chapter_7/code_7.5.py'))]
+
+    for family, loop, vectorized in cases:
+        print('\nzero-inflated %s' % family)
+        datasets = [('N = %d' % N, simulate(family, N)) for N in sizes]
+        compare([('loop', loop, split_data),
+                 ('vectorized', vectorized, shared_data)], datasets)
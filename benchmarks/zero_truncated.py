@@ -0,0 +1,99 @@
+"""
+Gradient evaluations per second of the zero-truncated Poisson (code 6.23)
+and negative binomial (code 6.25) models, before and after vectorizing
+the likelihood and its truncation term.
+
+Usage:
+
+    python zero_truncated.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from benchmark import compare, stan_program
+
+
+# original per-observation programs
+poisson_loop = """
+data{
+    int N;
+    int K;
+    matrix[N, K] X;
+    int Y[N];
+}
+parameters{
+    vector[K] beta;
+}
+model{
+    vector[N] mu;
+
+    mu = exp(X * beta);
+
+    # likelihood
+    for (i in 1:N) Y[i] ~ poisson(mu[i]) T[1,];
+}
+"""
+
+negbinomial_loop = """
+data{
+    int N;
+    int K;
+    matrix[N, K] X;
+    int Y[N];
+}
+parameters{
+    vector[K] beta;
+    real<lower=1> alpha;
+}
+model{
+    vector[N] mu;
+
+    # covariates transformation
+    mu = exp(X * beta);      
+   
+    # likelihood
+    for (i in 1:N) Y[i] ~ neg_binomial(mu[i], 1.0/(alpha - 1.0)) T[0,];
+}
+"""
+
+
+def simulate(family, N, seed=123579):
+    """Synthetic zero-truncated counts with N observations, as in code 6.23."""
+
+    rng = np.random.RandomState(seed)
+    X = np.column_stack((np.ones(N), rng.binomial(1, 0.3, size=N),
+                         rng.binomial(1, 0.6, size=N), rng.uniform(size=N)))
+
+    mu = np.exp(np.dot(X, [1.0, 2.0, -3.0, -1.5]))
+    if family == 'poisson':
+        y = rng.poisson(mu)
+    else:
+        y = rng.negative_binomial(mu, 0.2)
+
+    return X, np.maximum(y, 1)
+
+
+def make_data(dataset):
+    """Data dictionary, shared by both versions."""
+
+    X, y = dataset
+    return {'N': X.shape[0], 'K': X.shape[1], 'X': X, 'Y': y}
+
+
+if __name__ == '__main__':
+    sizes = [3000, 100000]
+
+    cases = [('poisson', poisson_loop, stan_program('chapter_6/code_6.23.py')),
+             ('negbinomial', negbinomial_loop,
+              stan_program('chapter_6/code_6.25.py'))]
+
+    for family, loop, vectorized in cases:
+        print('\nzero-truncated %s' % family)
+        datasets = [('N = %d' % N, simulate(family, N)) for N in sizes]
+        compare([('loop', loop, make_data),
+                 ('vectorized', vectorized, make_data)], datasets)
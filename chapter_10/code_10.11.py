@@ -21,9 +21,14 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_cache import stan
+
 # Data
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p5/f_gas.csv'
 
@@ -50,34 +55,33 @@ data{
     int<lower=0> nobs;                # number of data points
     int<lower=0> K;                   # number of coefficients
     matrix[nobs, K] X;                # stellar mass
-    real<lower=0, upper=1> Y[nobs];   # atomic gas fraction
+    vector<lower=0, upper=1>[nobs] Y; # atomic gas fraction
+}
+transformed data{
+    vector[nobs] log_Y = log(Y);
+    vector[nobs] log1m_Y = log1m(Y);
 }
 parameters{
     vector[K] beta;                   # linear predictor coefficients
     real<lower=0> theta;
 }
 model{
-    vector[nobs] pi;
-    real a[nobs];
-    real b[nobs];
-    
-    for (i in 1:nobs){
-       pi[i] = inv_logit(X[i] * beta);
-       a[i]  = theta * pi[i];
-       b[i]  = theta * (1 - pi[i]);
-    }
+    vector[nobs] a = theta * inv_logit(X * beta);
+    vector[nobs] b = theta - a;
 
     # priors and likelihood
     for (i in 1:K) beta[i] ~ normal(0, 100);
     theta ~ gamma(0.01, 0.01);
 
-    Y ~ beta(a, b);
+    # beta likelihood, a + b = theta
+    target += nobs * lgamma(theta) - sum(lgamma(a)) - sum(lgamma(b))
+              + dot_product(a - 1, log_Y) + dot_product(b - 1, log1m_Y);
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=7500, chains=3,
-                  warmup=5000, thin=1, n_jobs=3)
+fit = stan(model_code=stan_code, data=data, iter=7500, chains=3,
+           warmup=5000, thin=1, n_jobs=3)
 
 # Output
 print(fit)
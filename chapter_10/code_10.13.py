@@ -21,9 +21,14 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_models import glm
+
 # Data
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p6/Red_spirals.csv'
 
@@ -31,35 +36,14 @@ path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Se
 data_frame = dict(pd.read_csv(path_to_data))
 x = np.array(data_frame['fracdeV'])
 
-# prepare data for Stan
-data = {}
-data['X'] = sm.add_constant((x.transpose()))
-data['Y'] = np.array(data_frame['type'])
-data['nobs'] = data['X'].shape[0]
-data['K'] = data['X'].shape[1]
+X = sm.add_constant((x.transpose()))
+Y = np.array(data_frame['type'])            # galaxy type: 1 - red, 0 - blue
 
 # Fit
-stan_code="""
-data{
-    int<lower=0> nobs;                # number of data points
-    int<lower=0> K;                   # number of coefficients
-    matrix[nobs, K] X;                # bulge size
-    int Y[nobs];                      # galaxy type: 1 - red, 0 - blue
-}
-parameters{
-    vector[K] beta;                   # linear predictor coefficients
-}
-model{
-    # priors and likelihood
-    for (i in 1:K) beta[i] ~ normal(0, 100);
-
-    Y ~ bernoulli_logit(X * beta);
-}
-"""
-
-# Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=6000, chains=3,
-                  warmup=3000, thin=1, n_jobs=3)
+# Bernoulli model from the shared library in auxiliar_functions/stan_models.py,
+# fitted as binomial counts of the galaxies sharing the same fracdeV
+fit = glm(X, Y, family='bernoulli', compress=True, iter=3300, chains=3,
+          warmup=300, thin=1, n_jobs=3, warm_start=True)
 
 # Output
 print(fit)
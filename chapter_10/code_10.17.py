@@ -22,69 +22,41 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_models import glm
+
 # Data
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p7/GCs.csv'
 
 data_frame = dict(pd.read_csv(path_to_data))
 
-# prepare data for Stan
-data = {}
-data['X'] = sm.add_constant(np.array(data_frame['MV_T']))
-data['Y'] = np.array(data_frame['N_GC'])
-data['N'] = len(data['X'])
-data['K'] = 2
+X = sm.add_constant(np.array(data_frame['MV_T']))     # galaxy visual magnitude
+Y = np.array(data_frame['N_GC'])                      # size of globular cluster population
 
 # Fit
-stan_code="""
-data{
-    int<lower=0> N;           # number of data points
-    int<lower=1> K;           # number of linear predictor coefficients  
-    matrix[N,K] X;            # galaxy visual magnitude
-    int Y[N];                 # size of globular cluster population
-}
-parameters{
-    vector[K] beta;           # linear predictor coefficients
-    real<lower=0> theta;
-}
-model{
-    vector[N] mu;             # linear predictor
-
-    mu = exp(X * beta);
-
-    theta ~ gamma(0.001, 0.001);
-
-    # likelihood
-    Y ~ neg_binomial_2(mu, theta);
-}
-generated quantities{
-    real dispersion;
-    vector[N] expY;           # mean
-    vector[N] varY;           # variance
-    vector[N] PRes;
-    vector[N] mu2;
-
-    mu2 = exp(X * beta);
-    expY = mu2;
- 
-    for (i in 1:N){ 
-        varY[i] = mu2[i] + pow(mu2[i], 2) / theta;
-        PRes[i] = pow((Y[i] - expY[i]) / sqrt(varY[i]),2); 
-    }
-
-    dispersion = sum(PRes) / (N - (K + 1));
-}
-"""
-
-# Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=10000, chains=3,
-                  warmup=5000, thin=1, n_jobs=3)
+# NB2 model from the shared library in auxiliar_functions/stan_models.py
+fit = glm(X, Y, family='negbinomial', iter=5300, chains=3,
+          warmup=300, thin=1, n_jobs=3, warm_start=True,
+          reuse_adaptation=True)
+
+# Pearson dispersion statistic for each draw
+post = fit.extract(['beta', 'theta'])
+expY = np.exp(np.dot(post['beta'], X.T))
+varY = expY + expY ** 2 / post['theta'][:, np.newaxis]
+PRes = (Y - expY) ** 2 / varY
+dispersion = PRes.sum(axis=1) / (X.shape[0] - (X.shape[1] + 1))
 
 # Output
-nlines = 9                                 # number of lines in screen output
+nlines = 8                                 # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item) 
+
+print('dispersion: mean = %.3f, sd = %.3f' % (dispersion.mean(), dispersion.std()))
@@ -23,9 +23,16 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from hierarchical import noncentered
+from run_length import report
+from stan_cache import stan, THREADS
+
 # Data
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p8/Seyfert.csv'
 
@@ -40,9 +47,10 @@ data['Y'] = data_frame['bpt']
 data['X'] = sm.add_constant(np.column_stack((x1,x2)))
 data['K'] = data['X'].shape[1]
 data['N'] = data['X'].shape[0]
-data['gal'] = [0 if item == data_frame['zoo'][0] else 1 
+data['gal'] = [1 if item == data_frame['zoo'][0] else 2 
                  for item in data_frame['zoo']]
 data['P'] = 2
+data['noncentered'] = noncentered(data['gal'])   # parameterization of beta
 
 
 # Fit
@@ -53,21 +61,86 @@ data{
     int<lower=0> P;                # number of populations
     matrix[N,K] X;                 # [logM200, galactocentric distance]
     int<lower=0, upper=1> Y[N];    # Seyfert 1/SF 0
-    int<lower=0, upper=1> gal[N];  # elliptical 0/spiral 1
+    int<lower=1, upper=P> gal[N];  # elliptical 1/spiral 2
+    int<lower=0, upper=1> noncentered; # sample (beta - mu) / sigma
 }
 parameters{
-    matrix[K,P] beta;
     real<lower=0> sigma;
     real mu;
+    matrix<offset=(noncentered ? mu : 0.0),
+           multiplier=(noncentered ? sigma : 1.0)>[K,P] beta;
 }
 model{
-    vector[N] pi;
+    vector[N] pi = rows_dot_product(X, beta[:, gal]');
+
+    # shared hyperpriors
+    sigma ~ gamma(0.001, 0.001);
+    mu ~ normal(0, 100);
 
-    for (i in 1:N) {
-        if (gal[i] == gal[1]) pi[i] = dot_product(col(beta,1),X[i]);
-        else pi[i] = dot_product(col(beta,2), X[i]);
+    # priors and likelihood
+    for (i in 1:K) {
+        for (j in 1:P) beta[i,j] ~ normal(mu, sigma);
     }
 
+    Y ~ bernoulli_logit(pi);
+}
+"""
+
+# Same model, with the likelihood split in shards of grain observations
+# which map_rect evaluates on several threads per chain
+stan_code_parallel="""
+functions{
+    // log-likelihood of one shard: x_i = {n, K, Y, gal},
+    // x_r = design matrix of the shard, column-major
+    vector bernoulli_pop(vector phi, vector theta, real[] x_r, int[] x_i) {
+        int n = x_i[1];
+        int K = x_i[2];
+        int P = num_elements(phi) / K;
+        int grain = (num_elements(x_i) - 2) / 2;
+        int g[n] = x_i[(grain + 3):(grain + n + 2)];
+        matrix[n, K] Xs = to_matrix(x_r[1:(n * K)], n, K);
+        matrix[K, P] beta = to_matrix(phi, K, P);
+
+        return [bernoulli_logit_lpmf(x_i[3:(n + 2)] | 
+                                     rows_dot_product(Xs, beta[:, g]'))]';
+    }
+}
+data{
+    int<lower=0> N;                # number of data points
+    int<lower=0> K;                # number of coefficients
+    int<lower=0> P;                # number of populations
+    matrix[N,K] X;                 # [logM200, galactocentric distance]
+    int<lower=0, upper=1> Y[N];    # Seyfert 1/SF 0
+    int<lower=1, upper=P> gal[N];  # elliptical 1/spiral 2
+    int<lower=0, upper=1> noncentered; # sample (beta - mu) / sigma
+    int<lower=1> grain;            # observations per shard
+}
+transformed data{
+    int S = (N + grain - 1) / grain;   # number of shards
+    int xi[S, 2 * grain + 2];
+    real xr[S, grain * K];
+    vector[0] theta[S];            # no shard-specific parameters
+
+    for (s in 1:S) {
+        int start = (s - 1) * grain + 1;
+        int end = min(s * grain, N);
+        int n = end - start + 1;
+
+        xi[s] = rep_array(0, 2 * grain + 2);
+        xr[s] = rep_array(0.0, grain * K);
+        xi[s, 1:2] = {n, K};
+        xi[s, 3:(n + 2)] = Y[start:end];
+        xi[s, (grain + 3):(grain + n + 2)] = gal[start:end];
+        xr[s, 1:(n * K)] = to_array_1d(X[start:end]);
+    }
+}
+parameters{
+    real<lower=0> sigma;
+    real mu;
+    matrix<offset=(noncentered ? mu : 0.0),
+           multiplier=(noncentered ? sigma : 1.0)>[K,P] beta;
+}
+model{
     # shared hyperpriors
     sigma ~ gamma(0.001, 0.001);
     mu ~ normal(0, 100);
@@ -77,13 +150,29 @@ model{
         for (j in 1:P) beta[i,j] ~ normal(mu, sigma);
     }
 
-    Y ~ bernoulli_logit(pi);
+    target += sum(map_rect(bernoulli_pop, to_vector(beta), theta, xr, xi));
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=60000, chains=3,
-                  warmup=30000, thin=10, n_jobs=3)
+parallel = False                   # threads within each chain
+grain = 250                        # observations per shard
+threads = 8                        # threads per chain
+
+if parallel:
+    data['grain'] = grain
+    fit = stan(model_code=stan_code_parallel, data=data, compile_args=THREADS,
+               threads=threads, iter=20500, chains=3, warmup=500, n_jobs=3,
+               warm_start=True, targets={}, online=True,
+               checkpoint='checkpoint_10.19')
+else:
+    fit = stan(model_code=stan_code, data=data, iter=20500, chains=3,
+               warmup=500, n_jobs=3, warm_start=True, targets={}, online=True,
+               checkpoint='checkpoint_10.19')
 
 # Output
 print(fit)
+print(report(fit))
+
+# posterior covariance, accumulated while sampling
+print(fit.sim['online'].covariance())
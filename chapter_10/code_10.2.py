@@ -20,7 +20,14 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from run_length import report
+from stan_cache import stan
 
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p1/M_sigma.csv'
 
@@ -34,6 +41,7 @@ data['errx'] = np.array(data_frame['errx'])
 data['obsy'] = np.array(data_frame['obsy'])
 data['erry'] = np.array(data_frame['erry'])
 data['N'] = len(data['obsx'])
+data['draw_latent'] = 1              # draw true x and y after fitting
 
 # Stan Gaussian model with errors
 stan_code="""
@@ -43,30 +51,50 @@ data{
     vector<lower=0>[N] errx;          # errors in velocity dispersion measurements
     vector[N] obsy;                   # obs black hole mass
     vector<lower=0>[N] erry;          # errors in black hole mass measurements
+    int<lower=0, upper=1> draw_latent; # draw true values in generated quantities
+}
+transformed data{
+    vector[N] varx = square(errx);
+    vector[N] vary = square(erry);
 }
 parameters{
     real alpha;                       # intercept
     real beta;                        # angular coefficient
     real<lower=0> epsilon;            # scatter around true black hole mass
-    vector[N] x;                      # true velocity dispersion
-    vector[N] y;                      # true black hole mass
 }
 model{
 
-    # likelihood  
-    obsx ~ normal(x, errx);
-    y ~ normal(alpha + beta * x, epsilon);
-    obsy ~ normal(y, erry);
+    # likelihood, true velocity dispersion and black hole mass
+    # integrated out (flat prior on x)
+    obsy ~ normal(alpha + beta * obsx, 
+                  sqrt(square(beta) * varx + square(epsilon) + vary));
+}
+generated quantities{
+    vector[N * draw_latent] x;        # true velocity dispersion
+    vector[N * draw_latent] y;        # true black hole mass
+
+    for (i in 1:(N * draw_latent)) {
+        real vy = square(epsilon) + vary[i];
+        real px = 1 / varx[i] + square(beta) / vy;
+        real py = 1 / square(epsilon) + 1 / vary[i];
+
+        x[i] = normal_rng((obsx[i] / varx[i] + beta * (obsy[i] - alpha) / vy) / px,
+                          sqrt(1 / px));
+        y[i] = normal_rng(((alpha + beta * x[i]) / square(epsilon) 
+                           + obsy[i] / vary[i]) / py, sqrt(1 / py));
+    }
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=15000, chains=3,
-                  warmup=5000, thin=10, n_jobs=3)
+# at most 10000 draws per chain, fewer once R-hat and ESS are on target
+fit = stan(model_code=stan_code, data=data, iter=12500, chains=3,
+           warmup=2500, thin=1, n_jobs=3, reuse_adaptation=True, targets={})
 
 # Output
 nlines = 8                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
-    print(item) 
+    print(item)
+print(report(fit)) 
@@ -21,9 +21,14 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_models import glm
+
 # Data
 path_to_data = ('https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p9/MstarZSFR.csv')
 
@@ -33,52 +38,16 @@ data_frame = dict(pd.read_csv(path_to_data))
 # prepare data for Stan
 y = np.array([np.arcsinh(10**10*item) for item in data_frame['Mstar']])
 x = np.array([np.log10(item) for item in data_frame['Mdm']])
-
-data = {}
-data['Y'] = y
-data['Xc'] = sm.add_constant(x.transpose())
-data['Xb'] = sm.add_constant(x.transpose())
-data['Kc'] = data['Xc'].shape[1]
-data['Kb'] = data['Xb'].shape[1]
-data['N'] = data['Xc'].shape[0]
+X = sm.add_constant(x.transpose())
 
 # Fit
-stan_code="""
-data{
-    int<lower=0> N;                # number of data points
-    int<lower=0> Kc;               # number of coefficients
-    int<lower=0> Kb;
-    matrix[N,Kb] Xb;               # dark matter halo mass
-    matrix[N,Kc] Xc;
-    real<lower=0> Y[N];            # stellar mass
-}
-parameters{
-    vector[Kc] beta;
-    vector[Kb] gamma;
-    real<lower=0> sigmaLN;
-}
-model{
-    vector[N] mu;
-    vector[N] Pi;
-
-    mu = Xc * beta;
-    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
-  
-    # priors and likelihood
-    for (i in 1:Kc) beta[i] ~ normal(0, 100);
-    for (i in 1:Kb) gamma[i] ~ normal(0, 100);
-    sigmaLN ~ gamma(0.001, 0.001);
-
-    for (i in 1:N) {
-        (Y[i] == 0) ~ bernoulli(Pi[i]);
-        if (Y[i] > 0) Y[i] ~ lognormal(mu[i], sigmaLN);
-    }
-}
-"""
+# Lognormal-logit hurdle from the shared library in auxiliar_functions/stan_models.py
+# gamma: probability of a zero, beta: location of the lognormal
+# split = True fits the two parts as two concurrent programs
+split = False
 
-# Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=15000, chains=3,
-                  warmup=5000, thin=1, n_jobs=3)
+fit = glm(X, y, family='lognormal', zero='hurdle', split=split, iter=10300,
+          chains=3, warmup=300, thin=1, n_jobs=3, warm_start=True)
 
 # Output
 print(fit)
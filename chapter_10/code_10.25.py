@@ -22,9 +22,14 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_cache import stan
+
 # Data
 path_to_data = "https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p10/sunspot.csv"
 
@@ -64,8 +69,8 @@ model{
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=7500, chains=3,
-                  warmup=5000, thin=1, n_jobs=3)
+fit = stan(model_code=stan_code, data=data, iter=7500, chains=3,
+           warmup=5000, thin=1, n_jobs=3, reuse_adaptation=True)
 
 # Output
 print(fit)
@@ -21,7 +21,16 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from draw_store import open_store
+from hierarchical import noncentered
+from posterior import stansummary
+from run_length import report
+from stan_cache import stan
 
 # Data
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p2/HR.csv'
@@ -35,9 +44,12 @@ data['obsy'] = np.array(data_frame['HR'])
 data['erry'] = np.array(data_frame['e_HR'])
 data['type'] = np.array([1 if item == 'P' else 0 
                          for item in data_frame['Type']])
+data['pop'] = np.where(data['type'] == data['type'][0], 1, 2)   # population index
 data['N'] = len(data['obsx'])
 data['K'] = 2                        # number of distinct populations
 data['L'] = 2                        # number of coefficients
+data['draw_latent'] = 1              # draw true x and y after fitting
+data['noncentered'] = noncentered(data['pop'])   # parameterization of beta
 
 # Fit
 stan_code="""
@@ -49,25 +61,31 @@ data{
     vector<lower=0>[N] errx;          # errors in host mass measurements
     vector[N] obsy;                   # obs Hubble Residual
     vector<lower=0>[N] erry;          # errors in Hubble Residual measurements
-    vector[N] type;                   # flag for spec/photo sample
+    int<lower=1, upper=K> pop[N];     # population of each data point
+    int<lower=0, upper=1> draw_latent; # draw true values in generated quantities
+    int<lower=0, upper=1> noncentered; # sample (beta - mu0) / sig0
+}
+transformed data{
+    vector[N] vary = square(erry);
+    vector[N] vxhat;                  # variance of true mass given obsx
+    vector[N] xhat;                   # mean of true mass given obsx
+
+    # x ~ normal(0, 10) and obsx ~ normal(x, errx)
+    vxhat = 1 ./ (1 / square(10.0) + 1 ./ square(errx));
+    xhat = vxhat .* obsx ./ square(errx);
 }
 parameters{
-    matrix[K,L] beta;                 # linear predictor coefficients
-    real<lower=0> sigma;              # scatter around true black hole mass
-    vector[N] x;                      # true host galaxy mass
-    vector[N] y;                      # true Hubble Residuals
-    real<lower=0, upper=5> sig0;      # scatter for shared hyperprior on beta
     real mu0;                         # mean for shared hyperprior on beta
-}
-transformed parameters{
-    vector[N] mu;                     # linear predictor
-
-    for (i in 1:N) {
-        if (type[i] == type[1]) mu[i] = beta[1,1] + beta[2,1] * x[i];
-        else mu[i] = beta[1,2] + beta[2,2] * x[i];
-    }
+    real<lower=0, upper=5> sig0;      # scatter for shared hyperprior on beta
+    # linear predictor coefficients
+    matrix<offset=(noncentered ? mu0 : 0.0),
+           multiplier=(noncentered ? sig0 : 1.0)>[K,L] beta;
+    real<lower=0> sigma;              # scatter around true black hole mass
 }
 model{
+    vector[N] a = to_vector(beta[1, pop]);
+    vector[N] b = to_vector(beta[2, pop]);
+
     # shared hyperprior
     mu0 ~ normal(0, 1);
     sig0 ~ normal(0, 5);
@@ -76,23 +94,46 @@ model{
         for (j in 1:L) beta[i,j] ~ normal(mu0, sig0);
     } 
 
-    # priors and likelihood
-    obsx ~ normal(x, errx);
-    x ~ normal(0, 10);
-    y ~ normal(mu, sigma);
+    # priors and likelihood, true mass and residual integrated out
     sigma ~ gamma(0.5,0.5);
 
-    obsy ~ normal(y, erry);
+    obsy ~ normal(a + b .* xhat, sqrt(square(b) .* vxhat + square(sigma) + vary));
+}
+generated quantities{
+    vector[N * draw_latent] x;        # true host galaxy mass
+    vector[N * draw_latent] y;        # true Hubble Residuals
+
+    for (i in 1:(N * draw_latent)) {
+        real a = beta[1, pop[i]];
+        real b = beta[2, pop[i]];
+        real vy = square(sigma) + vary[i];
+        real px = 1 / vxhat[i] + square(b) / vy;
+        real py = 1 / square(sigma) + 1 / vary[i];
+
+        x[i] = normal_rng((xhat[i] / vxhat[i] + b * (obsy[i] - a) / vy) / px,
+                          sqrt(1 / px));
+        y[i] = normal_rng(((a + b * x[i]) / square(sigma) + obsy[i] / vary[i]) / py,
+                          sqrt(1 / py));
+    }
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=40000, chains=3,
-                  warmup=15000, thin=1, n_jobs=3)
+# at most 10000 draws per chain, fewer once R-hat and ESS are on target;
+# the latent x and y are left out of the fit and written to disk only;
+# a restarted run resumes from the last checkpoint
+fit = stan(model_code=stan_code, data=data, iter=11000, chains=3,
+           warmup=1000, thin=1, n_jobs=3, targets={}, exclude=['x', 'y'],
+           store='draws_10.4', store_pars=['x', 'y'],
+           checkpoint='checkpoint_10.4')
 
 # Output
-nlines = 10                                  # number of lines in screen output
+nlines = 12                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
-    print(item) 
+    print(item)
+print(report(fit))
+
+# posterior mean of the true host galaxy masses, from the memory-mapped draws
+xtrue = open_store('draws_10.4').draws('x').mean(axis=(0, 1)) 
@@ -22,9 +22,16 @@
 
 import numpy as np
 import pandas as pd
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from hierarchical import noncentered
+from posterior import stansummary
+from stan_cache import stan
+
 # Data
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p3/PLC.csv'
 
@@ -37,10 +44,11 @@ data['x1'] = np.array(data_frame['logP'])
 data['x2'] = np.array(data_frame['V_I'])
 data['y'] = np.array(data_frame['M_V'])
 data['nobs'] = len(data['x1'])
-data['type'] = np.array([1 if item == data_frame['type'][0] else 0 
-                         for item in data_frame['type']])
+data['pop'] = np.array([2 if item == data_frame['type'][0] else 1 
+                        for item in data_frame['type']])
 data['M'] = 3
 data['K'] = data['M'] - 1
+data['noncentered'] = noncentered(data['pop'])   # parameterization of beta
 
 # Fit
 stan_code="""
@@ -51,22 +59,22 @@ data{
     vector[nobs] x1;                  # obs log period
     vector[nobs] x2;                  # obs color V-I
     vector[nobs] y;                   # obs luminosity
-    int type[nobs];                   # system type (near/genuine contact)
+    int<lower=1, upper=K> pop[nobs];  # system type (near/genuine contact)
+    int<lower=0, upper=1> noncentered; # sample (beta - mu0) / sigma0
 }
 parameters{
-    matrix[M,K] beta;                 # linear predictor coefficients
-    real<lower=0> sigma[K];           # scatter around linear predictor
     real mu0;
-    real sigma0;
+    real<lower=0> sigma0;
+    # linear predictor coefficients
+    matrix<offset=(noncentered ? mu0 : 0.0),
+           multiplier=(noncentered ? sigma0 : 1.0)>[M,K] beta;
+    real<lower=0> sigma[K];           # scatter around linear predictor
 }
 model{
     vector[nobs] mu;                  # linear predictor
 
-    for (i in 1:nobs) {
-        if (type[i] == type[1])
-            mu[i] = beta[1,2] + beta[2,2] * x1[i] + beta[3,2] * x2[i];
-        else mu[i] = beta[1,1] + beta[2,1] * x1[i] + beta[3,1] * x2[i];
-    }
+    mu = to_vector(beta[1, pop]) + to_vector(beta[2, pop]) .* x1 
+         + to_vector(beta[3, pop]) .* x2;
 
     # priors and likelihood
     mu0 ~ normal(0, 100);
@@ -77,20 +85,17 @@ model{
         for (j in 1:M) beta[j,i] ~ normal(mu0,sigma0);
     }
 
-    for (i in 1:nobs){
-        if (type[i] == type[1]) y[i] ~ normal(mu[i], sigma[2]);
-        else y[i] ~ normal(mu[i], sigma[1]);
-    }
+    y ~ normal(mu, sigma[pop]);
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=5000, chains=3,
-                  warmup=2500, thin=1, n_jobs=3)
+fit = stan(model_code=stan_code, data=data, iter=3000, chains=3,
+           warmup=1000, thin=1, n_jobs=3)
 
 # Output
-nlines = 13                                  # number of lines in screen output
+nlines = 15                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item) 
@@ -21,9 +21,14 @@
 import numpy as np
 import pandas as pd
 import pylab as plt
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_cache import stan
+
 # Data
 path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Section_10p4/NGC6611.csv'
 
@@ -31,16 +36,22 @@ path_to_data = 'https://raw.githubusercontent.com/astrobayes/BMAD/master/data/Se
 data_frame = dict(pd.read_csv(path_to_data))
 
 # prepare data for Stan
+# the lognormal likelihood depends on the data only through the 
+# mean and the sum of squared deviations of log(Mass)
+log_mass = np.log(np.array(data_frame['Mass']))
+
 data = {}
-data['X'] = data_frame['Mass']
-data['nobs'] = data['X'].shape[0]
+data['nobs'] = log_mass.shape[0]
+data['mean_log_X'] = np.mean(log_mass)
+data['ss_log_X'] = np.sum((log_mass - np.mean(log_mass)) ** 2)
 
 # Fit
 # Stan  model
 stan_code="""
 data{
     int<lower=0> nobs;                # number of data points
-    vector[nobs] X;                   # stellar mass
+    real mean_log_X;                  # mean log stellar mass
+    real<lower=0> ss_log_X;           # sum of squared deviations of log mass
 }
 parameters{
     real mu;                          # mean 
@@ -51,13 +62,15 @@ model{
     sigma ~ normal(0, 100);
     mu ~ normal(0, 100);
 
-    X ~ lognormal(mu, sigma);
+    # lognormal, up to a constant
+    target += -nobs * log(sigma) 
+              - (ss_log_X + nobs * square(mean_log_X - mu)) / (2 * square(sigma));
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=5000, chains=3,
-                  warmup=2500, thin=1, n_jobs=3)
+fit = stan(model_code=stan_code, data=data, iter=5000, chains=3,
+           warmup=2500, thin=1, n_jobs=3)
 
 # Output
 print(fit)
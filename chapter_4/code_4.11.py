@@ -12,10 +12,16 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 
 from scipy.stats import norm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import compile_model, sampling
+
 ############### Data
 np.random.seed(42)                      # set seed to replicate example
 nobs = 1000                             # number of obs in model 
@@ -41,6 +47,7 @@ toy_data['errx'] = errx                      # uncertainty in explanatory variab
 toy_data['obsy'] = obsy                      # response variable
 toy_data['erry'] = erry                      # uncertainty in response variable
 toy_data['xmean'] = np.repeat(0, nobs)       # initial guess for true x position
+toy_data['draw_latent'] = 1                  # draw true x and y after fitting
 
 
 # STAN code
@@ -52,29 +59,30 @@ data {
     vector[N] errx; 
     vector[N] erry;     
     vector[N] xmean;        
+    int<lower=0, upper=1> draw_latent;
 }
 transformed data{
     vector[N] varx;
     vector[N] vary;
+    vector[N] vary2;
+    vector[N] vxhat;
+    vector[N] xhat;
 
     for (i in 1:N){ 
         varx[i] = fabs(errx[i]);
         vary[i] = fabs(erry[i]);
     }
+
+    // x ~ normal(xmean, 100) and obsx ~ normal(x, varx) give
+    // x | obsx ~ normal(xhat, sqrt(vxhat))
+    vxhat = 1 ./ (1 / square(100.0) + 1 ./ square(varx));
+    xhat = vxhat .* (xmean / square(100.0) + obsx ./ square(varx));
+    vary2 = square(vary);
 }
 parameters {
     real beta0;
     real beta1;                                             
     real<lower=0> sigma;
-    vector[N] x;
-    vector[N] y; 
-}
-transformed parameters{
-    vector[N] mu;
-
-    for (i in 1:N){ 
-        mu[i] = beta0 + beta1 * x[i];
-    }
 }
 model{
     beta0 ~ normal(0.0, 100);               // Diffuse normal priors for predictors
@@ -82,24 +90,38 @@ model{
 
     sigma ~ normal(0.0, 100);              // Uniform prior for standard deviation
 
-    x ~ normal(xmean, 100);
-    obsx ~ normal(x, varx);
-    y ~ normal(mu, sigma);
-    obsy ~ normal(y, vary);
+    // true x and y integrated out, the marginal of obsx is constant
+    obsy ~ normal(beta0 + beta1 * xhat, 
+                  sqrt(square(beta1) * vxhat + square(sigma) + vary2));
+}
+generated quantities{
+    vector[N * draw_latent] x;
+    vector[N * draw_latent] y; 
+
+    for (i in 1:(N * draw_latent)){
+        real vy = square(sigma) + vary2[i];
+        real px = 1 / vxhat[i] + square(beta1) / vy;
+        real py = 1 / square(sigma) + 1 / vary2[i];
+
+        x[i] = normal_rng((xhat[i] / vxhat[i] + beta1 * (obsy[i] - beta0) / vy) / px,
+                          sqrt(1 / px));
+        y[i] = normal_rng(((beta0 + beta1 * x[i]) / square(sigma) 
+                           + obsy[i] / vary2[i]) / py, sqrt(1 / py));
+    }
 }
 """
 
 # compile model
-model = pystan.StanModel(model_code=stan_code)
+model = compile_model(model_code=stan_code)
 
 # Perform fit
-fit = model.sampling(data=toy_data, iter=5000, chains=3,
-                     n_jobs=3, warmup=2500, verbose=False, thin=1, check_hmc_diagnostics=True)
+fit = sampling(model, data=toy_data, iter=5000, chains=3,
+               n_jobs=3, warmup=2500, verbose=False, thin=1, check_hmc_diagnostics=True)
 
 # Output
 nlines = 8                                   # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -10,9 +10,15 @@
 import arviz
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 from scipy.stats import uniform
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import compile_model, sampling
+
 # Data
 np.random.seed(1056)                 # set seed to replicate example
 nobs= 5000                           # number of obs in model 
@@ -54,15 +60,15 @@ model {
 """
 
 # compile model
-model = pystan.StanModel(model_code=stan_code)
+model = compile_model(model_code=stan_code)
 
 # perform fit
-fit = model.sampling(data=toy_data, iter=5000, chains=3, verbose=False, n_jobs=3)
+fit = sampling(model, data=toy_data, iter=5000, chains=3, verbose=False, n_jobs=3)
 
 # Output
 nlines = 8                     # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -9,9 +9,15 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 from scipy.stats import uniform, norm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import compile_model, sampling
+
 # Data
 np.random.seed(1056)                 # set seed to replicate example
 nobs= 5000                           # number of obs in model 
@@ -44,35 +50,28 @@ parameters {
     matrix[k,1] beta;                                             
     real<lower=0> sigma;               
 }
-transformed parameters{
-    matrix[nobs,1] mu;
-    vector[nobs] mu2;
-
-    mu = x * beta;
-    mu2 = to_vector(mu);                 // normal distribution 
-                                         // does not take matrices as input
-}
 model {
     for (i in 1:k){                      // Diffuse normal priors for predictors
         beta[i] ~ normal(0.0, 100);
     }
     sigma ~ uniform(0, 100);             // Uniform prior for standard deviation
 
-    y ~ normal(mu2, sigma);              // Likelihood function
+    y ~ normal(to_vector(x * beta), sigma);   // Likelihood function, normal
+                                              // does not take matrices as input
 }
 """
 
 # Compile model
-model = pystan.StanModel(model_code=stan_code)
+model = compile_model(model_code=stan_code)
 
 # perform fit
-fit = model.sampling(data=toy_data, iter=5000, chains=3,
-                     n_jobs=3, verbose=False, check_hmc_diagnostics=True)
+fit = sampling(model, data=toy_data, iter=5000, chains=3,
+               n_jobs=3, verbose=False, check_hmc_diagnostics=True)
 
 # Output
 nlines = 9                                   # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
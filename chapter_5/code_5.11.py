@@ -9,10 +9,16 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 
 from scipy.stats import uniform, invgauss
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 # Data
 np.random.seed(1056)                 # set seed to replicate example
 nobs= 1000                           # number of obs in model 
@@ -40,42 +46,31 @@ data{
     vector[N] Y;
     vector[N] x1;
 }
+transformed data{
+    real log_c = N * log(2 * pi()) + 3 * sum(log(Y));
+}
 parameters{
     real beta0;
     real beta1;
     real<lower=0> lambda;
 }
-transformed parameters{
-    vector[N] exb;
-    vector[N] xb;
-
-    for (i in 1:N) xb[i] = beta0 + beta1 * x1[i];
-    for (i in 1:N) exb[i] = exp(xb[i]);
-}
 model{
-    real l1;
-    real l2;   
-    vector[N] loglike;
+    vector[N] exb = exp(beta0 + beta1 * x1);
 
     lambda ~ uniform(0.0001, 100);
 
-    for (i in 1:N){
-        l1 = 0.5 * (log(lambda) - log(2 * pi() * pow(Y[i], 3)));
-        l2 = -lambda*pow(Y[i] - exb[i], 2)/(2 * pow(exb[i], 2) * Y[i]);
-        loglike[i] = l1 + l2;
-    }
-
-    target += loglike;
+    target += 0.5 * (N * log(lambda) - log_c);
+    target += -lambda * sum(square(Y - exb) ./ (2 * square(exb) .* Y));
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=stan_data, iter=5000, chains=3,
-                  warmup=2500, n_jobs=3)
+fit = stan(model_code=stan_code, data=stan_data, iter=5000, chains=3,
+           warmup=2500, n_jobs=3)
 
 # Output
 nlines = 8                                   # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -9,11 +9,16 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 
 from scipy.stats import uniform
 from scipy.stats import beta as beta_dist
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_cache import stan
+
 # Data
 np.random.seed(1056)                 # set seed to replicate example
 nobs= 2000                           # number of obs in model 
@@ -41,31 +46,28 @@ data{
     vector[N] x1;
     vector<lower=0, upper=1>[N] y;
 }
+transformed data{
+    vector[N] log_y = log(y);
+    vector[N] log1m_y = log1m(y);
+}
 parameters{
     real beta0;
     real beta1;
     real<lower=0> theta;
 }
 model{
-    vector[N] eta;
-    vector[N] p;
-    vector[N] shape1;
-    vector[N] shape2;
-
-    for (i in 1:N){
-        eta[i] = beta0 + beta1 * x1[i];
-        p[i] = inv_logit(eta[i]);
-        shape1[i] = theta * p[i];
-        shape2[i] = theta * (1 - p[i]);
-    }
+    vector[N] shape1 = theta * inv_logit(beta0 + beta1 * x1);
+    vector[N] shape2 = theta - shape1;
 
-    y ~ beta(shape1, shape2);
+    # beta likelihood, shape1 + shape2 = theta
+    target += N * lgamma(theta) - sum(lgamma(shape1)) - sum(lgamma(shape2))
+              + dot_product(shape1 - 1, log_y) + dot_product(shape2 - 1, log1m_y);
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
-                  warmup=2500, n_jobs=3)
+fit = stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
+           warmup=2500, n_jobs=3)
 
 # Output
 print(fit)  
@@ -8,11 +8,17 @@
 # 1 response (y) and 2 explanatory variables (x1, x2)
 
 import numpy as np
-import pystan
+import os
+import sys
 import statsmodels.api as sm
 
 from scipy.stats import uniform, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 # Data
 np.random.seed(13979)                # set seed to replicate example
 nobs= 5000                           # number of obs in model 
@@ -49,14 +55,9 @@ data{
 parameters{
     vector[K] beta;
 }
-transformed parameters{
-    vector[N] eta;
-
-    eta = X * beta;
-}
 model{
 
-    Y ~ bernoulli_logit(eta);
+    Y ~ bernoulli_logit(X * beta);
 }
 generated quantities{
     real LLi[N];
@@ -79,12 +80,13 @@ generated quantities{
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=10000, chains=3,
-                  warmup=5000, n_jobs=1)
+# per-observation quantities are not stored
+fit = stan(model_code=stan_code, data=mydata, iter=10000, chains=3,
+           warmup=5000, n_jobs=1, exclude=['LLi', 'etanew', 'pnew'])
 
 # Output
-lines = list(range(8)) + [2 * nobs + 8, 2 * nobs + 9, 2 * nobs + 10]
-output = str(fit).split('\n')
+lines = range(11)
+output = stansummary(fit, max_rows=len(lines) - 5).split('\n')
 
 for i in lines:
     print(output[i])   
@@ -7,10 +7,16 @@
 # Code 5.24 - Probit model in Python using Stan
 
 import numpy as np
-import pystan
+import os
+import sys
 import statsmodels.api as sm
 from scipy.stats import uniform, norm, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 # Data
 np.random.seed(1944)                        # set seed to replicate example
 nobs = 2000                                 # number of obs in model
@@ -50,13 +56,9 @@ data{
 parameters{
    vector[K] beta;
 }
-transformed parameters{
-    vector[N] xb;
-    
-    xb = X * beta;
-}
 model{
-   
+    vector[N] xb = X * beta;
+
     for (i in 1:N) Y[i] ~ bernoulli(Phi(xb[i]));      # likelihood
 }
 generated quantities{
@@ -80,13 +82,14 @@ generated quantities{
 }
 """
 
-fit = pystan.stan(model_code=probit_code, data=probit_data, iter=5000, chains=3,
-warmup=3000, n_jobs=3)
+# per-observation quantities are not stored
+fit = stan(model_code=probit_code, data=probit_data, iter=5000, chains=3,
+warmup=3000, n_jobs=3, exclude=['LLi', 'xb2', 'p'])
 
 # Output
-lines = list(range(8)) + [2 * nobs + 8, 2 * nobs + 9, 2 * nobs + 10]
+lines = range(11)
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=len(lines) - 5).split('\n')
 
 for i in lines:
     print(output[i])
@@ -9,10 +9,16 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 
 from scipy.stats import uniform, poisson, binom
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 # Data
 np.random.seed(33559)                # set seed to replicate example
 nobs= 2000                           # number of obs in model
@@ -49,23 +55,17 @@ data{
 parameters{
     vector[K] beta;
 }
-transformed parameters{
-    vector[N] eta;
-    vector[N] p;
-    eta = X * beta;
-    for (i in 1:N) p[i] = inv_logit(eta[i]);
-}
 model{
-    Y ~ binomial(m, p);
+    Y ~ binomial_logit(m, X * beta);
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
+fit = stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
 warmup=3000, n_jobs=3)
 
 # Output
 nlines = 8
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)
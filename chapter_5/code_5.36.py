@@ -9,11 +9,17 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 
 from scipy.stats import uniform, poisson, binom
 from scipy.stats import beta as beta_dist
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 
 # Data
 np.random.seed(33559)                # set seed to replicate example
@@ -55,31 +61,19 @@ parameters{
     vector[K] beta;
     real<lower=0> sigma;
 }
-transformed parameters{
-    vector[N] eta;
-    vector[N] pi;
-    vector[N] shape1;
-    vector[N] shape2;
- 
-    eta = X * beta;
-    for (i in 1:N){ 
-        pi[i] = inv_logit(eta[i]); 
-        shape1[i] = sigma * pi[i];
-        shape2[i] = sigma * (1 - pi[i]);
-    }
-}
 model{    
+    vector[N] shape1 = sigma * inv_logit(X * beta);
 
-    Y ~ beta_binomial(m, shape1, shape2);  
+    Y ~ beta_binomial(m, shape1, sigma - shape1);
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=7000, chains=3,
-                  warmup=3500, n_jobs=3)
+fit = stan(model_code=stan_code, data=mydata, iter=7000, chains=3,
+           warmup=3500, n_jobs=3)
 
 # Output
 nlines = 8
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)
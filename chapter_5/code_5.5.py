@@ -9,7 +9,13 @@
 
 import numpy as np
 from scipy.stats import uniform, lognorm
-import pystan
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import compile_model, sampling
 
 # Data
 np.random.seed(1056)                 # set seed to replicate example
@@ -35,35 +41,34 @@ stan_lognormal = """
 data{
     int<lower=0> N;
     vector[N] x1;
-    vector[N] y;
+    vector<lower=0>[N] y;
+}
+transformed data{
+    vector[N] log_y = log(y);
 }
 parameters{ 
     real beta0;
     real beta1;
     real<lower=0> sigma;
 }
-transformed parameters{
-    vector[N] mu;
-    
-    for (i in 1:N) mu[i] = beta0 + beta1 * x1[i];
-}
 model{
-    y ~ lognormal(mu, sigma);
+    # lognormal likelihood, up to the constant -sum(log_y)
+    log_y ~ normal(beta0 + beta1 * x1, sigma);
 }
 """
 
 # Compile model
-model = pystan.StanModel(model_code=stan_lognormal)
+model = compile_model(model_code=stan_lognormal)
 
 # perform fit
-fit = model.sampling(data=mydata, iter=5000, chains=3,
-                     verbose=False, n_jobs=3, check_hmc_diagnostics=True)
+fit = sampling(model, data=mydata, iter=5000, chains=3,
+               verbose=False, n_jobs=3, check_hmc_diagnostics=True)
 
 
 ############### Output
 nlines = 8                          # number of lines in output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -8,10 +8,16 @@
 # 1 response (y) and 2 explanatory variables (x1, x2)
 
 import numpy as np
-import pystan
+import os
+import sys
 
 from scipy.stats import uniform, gamma
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import compile_model, sampling
+
 # Data
 np.random.seed(33559)                # set seed to replicate example
 nobs= 3000                           # number of obs in model 
@@ -47,34 +53,23 @@ parameters{
     real beta2;
     real<lower=0> r;
 }
-transformed parameters{
-    vector[N] eta;
-    vector[N] mu;
-    vector[N] lambda;
-
-    for (i in 1:N){
-        eta[i] = beta0 + beta1 * x1[i] + beta2 * x2[i];
-        mu[i] = exp(eta[i]);
-        lambda[i] = r/mu[i];
-    }
-}
 model{
     r ~ gamma(0.01, 0.01);
-    for (i in 1:N) y[i] ~ gamma(r, lambda[i]);
+    y ~ gamma(r, r * exp(-(beta0 + beta1 * x1 + beta2 * x2)));   # rate r/mu
 }
 """
 
 # Compile model
-model = pystan.StanModel(model_code=stan_gamma)
+model = compile_model(model_code=stan_gamma)
 
 # perform fit
-fit = model.sampling(data=mydata, iter=7000, chains=3,
-                     warmup=6000, n_jobs=3, check_hmc_diagnostics=True)
+fit = sampling(model, data=mydata, iter=7000, chains=3,
+               warmup=6000, n_jobs=3, check_hmc_diagnostics=True)
 
 # Output
 nlines = 9                                   # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
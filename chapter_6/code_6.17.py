@@ -9,11 +9,17 @@
 
 
 import numpy as np
-import pystan 
+import os
+import sys
 
 from scipy.stats import uniform, binom, nbinom
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_models import glm
+
 # Data
 np.random.seed(141)                 # set seed to replicate example
 nobs= 2500                          # number of obs in model 
@@ -29,44 +35,15 @@ xb = np.dot(X, beta)          # linear predictor
 exb = np.exp(xb)
 nby = nbinom.rvs(exb, theta)
 
-mydata = {}                                # build data dictionary
-mydata['N'] = nobs                         # sample size
-mydata['X'] = X                            # predictors         
-mydata['Y'] = nby                          # response variable
-mydata['K'] = len(beta)
-  
-
 # Fit
-stan_code = """
-data{
-    int N;
-    int K;
-    matrix[N,K] X;
-    int Y[N];
-}
-parameters{
-    vector[K] beta;
-    real<lower=0, upper=5> alpha;
-}
-transformed parameters{
-    vector[N] mu;
-   
-    mu = exp(X * beta);
-}
-model{
-    Y ~ neg_binomial(mu, alpha);
-}
-"""
-
-
-# Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=10000, chains=3,
-                  warmup=5000, n_jobs=3)
+# NB2 model from the shared library in auxiliar_functions/stan_models.py
+fit = glm(X, nby, family='negbinomial', iter=5300, chains=3,
+          warmup=300, n_jobs=3, warm_start=True)
 
 # Output
 nlines = 9                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
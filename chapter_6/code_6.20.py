@@ -8,12 +8,18 @@
 # 1 response (y) and 1 explanatory variable (x1)
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from  scipy.misc import factorial
 from scipy.stats import uniform, rv_discrete
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 
 def sign(delta):
     """Returns a pair of vectors to set sign on 
@@ -83,41 +89,37 @@ data{
     matrix[N, K] X;
     int Y[N];
 }
+transformed data{
+    vector[N] y = to_vector(Y);
+    vector[N] ym1 = y - 1;                  // Y - 1
+    row_vector[K] Xsum = rep_row_vector(1, N) * X;   // column sums of X
+    real sumY = sum(y);
+    real lfac = sum(lgamma(y + 1));         // sum of log(Y!)
+}
 parameters{
     vector[K] beta;
     real<lower=-1, upper=1> delta;
 }
-transformed parameters{
-    vector[N] mu;
-
-    mu = exp(X * beta);
-}
 model{
-    vector[N] l1;
-    vector[N] l2;
-    vector[N] LL;
+    vector[N] mu = exp(X * beta);
 
     delta ~ uniform(-1, 1);
 
-    for (i in 1:N){
-        l1[i] = log(mu[i]) + (Y[i] - 1) * log(mu[i] + delta * Y[i]);
-        l2[i] = mu[i] + delta * Y[i] + lgamma(Y[i] + 1);
-        LL[i] = l1[i] - l2[i];
-    }
-
-   target += LL;
+    // sum of log(mu) + (Y - 1) * log(mu + delta * Y) - mu - delta * Y - log(Y!)
+    target += Xsum * beta + dot_product(ym1, log(mu + delta * y)) -
+              sum(mu) - delta * sumY - lfac;
 }
 """
 
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
-                  warmup=4000, n_jobs=3)
+fit = stan(model_code=stan_code, data=mydata, iter=1300, chains=3,
+           warmup=300, n_jobs=3, warm_start=True)
 
 # Output
-nlines = range(9)          # lines in screen output
+nlines = range(8)          # lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=len(nlines) - 5).split('\n')
 for i in nlines:
     print(output[i])   
 
@@ -8,11 +8,16 @@
 # 1 response (y) and 3 explanatory variable (x1, x2, x3)
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from scipy.stats import uniform, binom, poisson
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_cache import stan
+
 def ztpoisson(N, lambda_par):
     """Zero truncated Poisson distribution."""
 
@@ -57,18 +62,17 @@ parameters{
     vector[K] beta;
 }
 model{
-    vector[N] mu;
-
-    mu = exp(X * beta);
+    vector[N] eta = X * beta;               # log(mu)
 
-    # likelihood
-    for (i in 1:N) Y[i] ~ poisson(mu[i]) T[1,];
+    # likelihood, truncated at zero: P(Y) / (1 - exp(-mu))
+    Y ~ poisson_log(eta);
+    target += -sum(log1m_exp(-exp(eta)));
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
-                  warmup=4000, n_jobs=3)
+fit = stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
+           warmup=4000, n_jobs=3)
 
 # Output
 print(fit) 
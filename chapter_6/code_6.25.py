@@ -8,11 +8,17 @@
 # 1 response (y) and 2 explanatory variables (x1, x2)
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from scipy.stats import uniform, nbinom, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 def gen_ztnegbinom(n, mu, size):
     """Zero truncated negative binomial distribution.
 
@@ -76,20 +82,22 @@ model{
     # covariates transformation
     mu = exp(X * beta);      
    
-    # likelihood
-    for (i in 1:N) Y[i] ~ neg_binomial(mu[i], 1.0/(alpha - 1.0)) T[0,];
+    # likelihood, truncated at zero: P(Y) / (1 - P(0)),
+    # with log P(0) = mu * log(b/(1 + b)) = -mu * log(alpha), b = 1/(alpha - 1)
+    Y ~ neg_binomial(mu, 1.0/(alpha - 1.0));
+    target += -sum(log1m_exp(-mu * log(alpha)));
 }
 """
 
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
-                  warmup=2500, n_jobs=3)
+fit = stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
+           warmup=2500, n_jobs=3)
 
 # Output
 nlines = 9                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -11,12 +11,18 @@
 
 
 import numpy as np
-import pystan
+import os
+import sys
 
 import statsmodels.api as sm
 from rpy2.robjects import r, FloatVector
 from scipy.stats import uniform, binom, nbinom, poisson, gamma
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 
 def gen_negbin(N, mu1, theta1):
     """Negative binomial distribution."""
@@ -66,30 +72,23 @@ parameters{
     real<lower=0> theta;
     real<lower=0, upper=3> Q;
 }
-transformed parameters{
-    vector[N] mu;
-    real<lower=0> theta_eff[N];
-   
-    mu = exp(X * beta);
-    for (i in 1:N) {
-        theta_eff[i] = theta * pow(mu[i], Q);
-    }
-}
 model{        
+    vector[N] eta = X * beta;
 
-    Y ~ neg_binomial_2(mu, theta_eff);
+    # log mean eta, size theta * mu^Q
+    Y ~ neg_binomial_2_log(eta, theta * exp(Q * eta));
 }
 """
 
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
-                  warmup=2500, n_jobs=3)
+fit = stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
+           warmup=2500, n_jobs=3)
 
 # Output
 nlines = 9                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
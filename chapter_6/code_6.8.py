@@ -8,11 +8,16 @@
 # 1 response (y) and 2 explanatory variables (x1_2, x2)
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from scipy.stats import norm, poisson, binom
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_models import glm
+
 # Data
 np.random.seed(18472)                     # set seed to replicate example
 nobs= 750                                  # number of obs in model 
@@ -26,32 +31,10 @@ py = poisson.rvs(exb)                      # create y as adjusted
 
 X = sm.add_constant(np.column_stack((x1_2, x2)))
 
-mydata = {}                                # build data dictionary
-mydata['N'] = nobs                         # sample size
-mydata['X'] = X                            # predictors         
-mydata['Y'] = py                           # response variable
-mydata['K'] = mydata['X'].shape[1]         # number of coefficients
-  
 # Fit
-stan_code = """
-data{
-    int N;
-    int K;
-    matrix[N,K] X;
-    int Y[N];
-}
-parameters{
-    vector[K] beta;
-}
-model{
-    Y ~ poisson_log(X * beta);
-}
-"""
-
-
-# Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
-                  warmup=4000, n_jobs=3)
+# Poisson model from the shared library in auxiliar_functions/stan_models.py
+fit = glm(X, py, family='poisson', iter=1300, chains=3,
+          warmup=300, n_jobs=3, warm_start=True)
 
 # Output
 print(fit) 
@@ -10,10 +10,17 @@
 
 
 import numpy as np
-import pystan
+import os
+import sys
 from scipy.stats import bernoulli, uniform, poisson
 import statsmodels.api as sm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from factorized import sample
+from posterior import stansummary
+from stan_cache import stan
+
 def ztp(N, lambda_):
     """zero-truncated Poisson distribution"""
 
@@ -45,68 +52,147 @@ X = sm.add_constant(X)
 mydata = {}                                                         # build data dictionary
 mydata['Y'] = poy                                                   # response variable
 mydata['N'] = nobs                                                  # sample size
-mydata['Xb'] = X                                                    # predictors
-mydata['Xc'] = X
-mydata['Kb'] = X.shape[1]                                           # number of coefficients
-mydata['Kc'] = X.shape[1]
+mydata['X'] = X                                                     # predictors
+mydata['K'] = X.shape[1]                                            # number of coefficients
 
 # Fit
 stan_code = """
+functions{
+    int num_zeros(int[] y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
+    }
+}
 data{
     int<lower=0> N;
-    int<lower=0> Kb;
-    int<lower=0> Kc;
-    matrix[N, Kb] Xb;
-    matrix[N, Kc] Xc;
+    int<lower=0> K;
+    matrix[N, K] X;
     int<lower=0> Y[N];
 }
+transformed data{
+    int<lower=0> N1 = N - num_zeros(Y);     // number of positive counts
+    int<lower=1> Y1[N1];                    // positive counts
+    matrix[N1, K] X1;                       // predictors of positive counts
+    int<lower=0, upper=1> Z[N];             // 1 if Y > 0
+
+    {
+        int j = 1;
+
+        for (i in 1:N) {
+            Z[i] = (Y[i] > 0);
+            if (Y[i] > 0) {
+                Y1[j] = Y[i];
+                X1[j] = X[i];
+                j += 1;
+            }
+        }
+    }
+}
 parameters{
-    vector[Kc] beta;
-    vector[Kb] gamma;
+    vector[K] beta;
+    vector[K] gamma;
     real<lower=0, upper=5.0> alpha;
 }
-transformed parameters{
-    vector[N] mu;
-    vector[N] Pi;
-    vector[N] temp;
-    vector[N] u;
-    mu = exp(Xc * beta);
-    temp = Xb * gamma;
-    for (i in 1:N) {
-        Pi[i] = inv_logit(temp[i]);
-        u[i] = 1.0/(1.0 + alpha * mu[i]);
-    }
+model{
+    vector[N1] eta1 = X1 * beta;
+
+    beta ~ normal(0, 100);
+    gamma ~ normal(0, 100);
+
+    Z ~ bernoulli_logit(X * gamma);             // P(Y > 0) = inv_logit(X * gamma)
+    Y1 ~ neg_binomial_2_log(eta1, 1.0/alpha);
+
+    // truncation at zero: log P(Y = 0) = -log(1 + alpha * mu)/alpha
+    target += -sum(log1m_exp(-log1p_exp(eta1 + log(alpha)) / alpha));
+}
+"""
+
+# The two parts share no parameter: the same model as two smaller programs,
+# sampled concurrently (see auxiliar_functions/factorized.py)
+stan_code_zero = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    matrix[N, K] X;
+    int<lower=0> Y[N];
+}
+transformed data{
+    int<lower=0, upper=1> Z[N];             // 1 if Y > 0
+
+    for (i in 1:N) Z[i] = (Y[i] > 0);
+}
+parameters{
+    vector[K] gamma;
 }
 model{
-    vector[N] LogTrunNB;
-    vector[N] z;
-    vector[N] l1;
-    vector[N] l2;
-    vector[N] ll;
-    for (i in 1:Kc){
-        beta[i] ~ normal(0, 100);
-        gamma[i] ~ normal(0, 100);
+    gamma ~ normal(0, 100);
+
+    Z ~ bernoulli_logit(X * gamma);             // P(Y > 0) = inv_logit(X * gamma)
+}
+"""
+
+stan_code_positive = """
+functions{
+    int num_zeros(int[] y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
     }
-    for (i in 1:N) {
-        LogTrunNB[i] = (1.0/alpha) * log(u[i]) + Y[i] * log(1 - u[i]) +
-                                    lgamma(Y[i] + 1.0/alpha) - lgamma(1.0/alpha) -
-                                    lgamma(Y[i] + 1) - log(1 - pow(u[i],1.0/alpha));
-                                    z[i] = step(Y[i] - 0.0001);
-        l1[i] = (1 - z[i]) * log(1 - Pi[i]);
-        l2[i] = z[i] * (log(Pi[i]) + LogTrunNB[i]);
-        ll[i] = l1[i] + l2[i];
+}
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    matrix[N, K] X;
+    int<lower=0> Y[N];
+}
+transformed data{
+    int<lower=0> N1 = N - num_zeros(Y);     // number of positive counts
+    int<lower=1> Y1[N1];                    // positive counts
+    matrix[N1, K] X1;                       // predictors of positive counts
+
+    {
+        int j = 1;
+
+        for (i in 1:N) {
+            if (Y[i] > 0) {
+                Y1[j] = Y[i];
+                X1[j] = X[i];
+                j += 1;
+            }
+        }
     }
-    target += ll;
+}
+parameters{
+    vector[K] beta;
+    real<lower=0, upper=5.0> alpha;
+}
+model{
+    vector[N1] eta1 = X1 * beta;
+
+    beta ~ normal(0, 100);
+
+    Y1 ~ neg_binomial_2_log(eta1, 1.0/alpha);
+
+    // truncation at zero: log P(Y = 0) = -log(1 + alpha * mu)/alpha
+    target += -sum(log1m_exp(-log1p_exp(eta1 + log(alpha)) / alpha));
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=6000, chains=3,warmup=4000, n_jobs=3)
+split = False                                                       # fit the two parts separately
+
+if split:
+    fit = sample([(stan_code_positive, mydata), (stan_code_zero, mydata)],
+                 order=['beta', 'gamma', 'alpha'], iter=6000, chains=3,
+                 warmup=4000, n_jobs=3)
+else:
+    fit = stan(model_code=stan_code, data=mydata, iter=6000, chains=3,warmup=4000, n_jobs=3)
  
 # Output
 nlines = 10                                                     # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 
 for item in output[:nlines]:
     print(item)
@@ -8,10 +8,16 @@
 
 
 import numpy as np
-import pystan
+import os
+import sys
 import statsmodels.api as sm
 from scipy.stats import uniform, gamma, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from factorized import sample
+from stan_cache import stan
+
 # Data
 np.random.seed(33559)                             # set seed to replicate example
 nobs = 1000                                       # number of obs in model
@@ -36,42 +42,125 @@ X = sm.add_constant(X)
 mydata = {}                                       # build data dictionary
 mydata['Y'] = gy                                  # response variable
 mydata['N'] = nobs                                # sample size
-mydata['Xb'] = X                                  # predictors
-mydata['Xc'] = X
-mydata['Kb'] = X.shape[1]                         # number of coefficients
-mydata['Kc'] = X.shape[1]
+mydata['X'] = X                                   # predictors
+mydata['K'] = X.shape[1]                          # number of coefficients
 
 stan_code = """
+functions{
+    int num_zeros(vector y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
+    }
+}
 data{
     int N;
-    int Kb;
-    int Kc;
-    matrix[N, Kb] Xb;
-    matrix[N, Kc] Xc;
-    real<lower=0> Y[N];
+    int K;
+    matrix[N, K] X;
+    vector<lower=0>[N] Y;
+}
+transformed data{
+    int<lower=0> N1 = N - num_zeros(Y);     // number of positive values
+    vector<lower=0>[N1] Y1;                 // positive values
+    matrix[N1, K] X1;                       // predictors of positive values
+    int<lower=0, upper=1> Z[N];             // 1 if Y == 0
+
+    {
+        int j = 1;
+
+        for (i in 1:N) {
+            Z[i] = (Y[i] == 0);
+            if (Y[i] > 0) {
+                Y1[j] = Y[i];
+                X1[j] = X[i];
+                j += 1;
+            }
+        }
+    }
 }
 parameters{
-    vector[Kc] beta;
-    vector[Kb] gamma;
+    vector[K] beta;
+    vector[K] gamma;
     real<lower=0> phi;
 }
 model{
-    vector[N] mu;
-    vector[N] Pi;
-    mu = exp(Xc * beta);
+    Z ~ bernoulli_logit(X * gamma);             // P(Y == 0) = inv_logit(X * gamma)
+    Y1 ~ gamma(exp(X1 * beta), phi);
+}
+"""
 
-    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+# The two parts share no parameter: the same model as two smaller programs,
+# sampled concurrently (see auxiliar_functions/factorized.py)
+stan_code_zero = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    matrix[N, K] X;
+    vector<lower=0>[N] Y;
+}
+transformed data{
+    int<lower=0, upper=1> Z[N];             // 1 if Y == 0
 
-    for (i in 1:N) {
-        (Y[i] == 0) ~ bernoulli(Pi[i]);
-        if (Y[i] > 0) Y[i] ~ gamma(mu[i], phi) T[0,];
+    for (i in 1:N) Z[i] = (Y[i] == 0);
+}
+parameters{
+    vector[K] gamma;
+}
+model{
+    Z ~ bernoulli_logit(X * gamma);             // P(Y == 0) = inv_logit(X * gamma)
+}
+"""
+
+stan_code_positive = """
+functions{
+    int num_zeros(vector y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
     }
 }
+data{
+    int N;
+    int K;
+    matrix[N, K] X;
+    vector<lower=0>[N] Y;
+}
+transformed data{
+    int<lower=0> N1 = N - num_zeros(Y);     // number of positive values
+    vector<lower=0>[N1] Y1;                 // positive values
+    matrix[N1, K] X1;                       // predictors of positive values
+
+    {
+        int j = 1;
+
+        for (i in 1:N) {
+            if (Y[i] > 0) {
+                Y1[j] = Y[i];
+                X1[j] = X[i];
+                j += 1;
+            }
+        }
+    }
+}
+parameters{
+    vector[K] beta;
+    real<lower=0> phi;
+}
+model{
+    Y1 ~ gamma(exp(X1 * beta), phi);
+}
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=6000, chains=3,
-                  warmup=4000, n_jobs=3)
+split = False                                     # fit the two parts separately
+
+if split:
+    fit = sample([(stan_code_positive, mydata), (stan_code_zero, mydata)],
+                 order=['beta', 'gamma', 'phi'], iter=6000, chains=3,
+                 warmup=4000, n_jobs=3)
+else:
+    fit = stan(model_code=stan_code, data=mydata, iter=6000, chains=3,
+               warmup=4000, n_jobs=3)
 
 # Output
 print (fit)
@@ -9,11 +9,16 @@
 #
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from scipy.stats import uniform, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from stan_models import glm
+
 # Data
 np.random.seed(33559)                                 # set seed to replicate example
 nobs= 2000                                            # number of obs in model 
@@ -32,47 +37,14 @@ ly = [y[i]*bern[i] for i in  range(nobs)]             # Add structural zeros
 X = np.transpose(x1)
 X = sm.add_constant(X)
 
-mydata = {}                                # build data dictionary
-mydata['Y'] = ly                           # response variable
-mydata['N'] = nobs                         # sample size
-mydata['Xb'] = X                           # predictors         
-mydata['Xc'] = X
-mydata['Kb'] = X.shape[1]                  # number of coefficients
-mydata['Kc'] = X.shape[1] 
-
 # Fit
-stan_code = """
-data{
-    int<lower=0> N;
-    int<lower=0> Kb;
-    int<lower=0> Kc;
-    matrix[N, Kb] Xb;
-    matrix[N, Kc] Xc;
-    real<lower=0> Y[N];
-}
-parameters{
-    vector[Kc] beta;
-    vector[Kb] gamma;
-    real<lower=0> sigmaLN;
-}
-model{
-    vector[N] mu;
-    vector[N] Pi;
-
-    mu = exp(Xc * beta);
-    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
-
-    for (i in 1:N) {
-        (Y[i] == 0) ~ bernoulli(Pi[i]);
-        if (Y[i] > 0) Y[i] ~ lognormal(mu[i], sigmaLN);
-    }
-}
-"""
-
-
-# Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=7000, chains=3,
-                  warmup=4000, n_jobs=3)
+# Lognormal-logit hurdle from the shared library in auxiliar_functions/stan_models.py
+# gamma: probability of a zero, beta: log-link location of the lognormal
+# split = True fits the two parts as two concurrent programs
+split = False
+
+fit = glm(X, ly, family='lognormal', link='log', zero='hurdle', split=split,
+          iter=3300, chains=3, warmup=300, n_jobs=3, warm_start=True)
 
 # Output
 print(fit)  
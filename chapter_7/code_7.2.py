@@ -9,12 +9,18 @@
 #
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from rpy2.robjects import r, FloatVector
 from scipy.stats import uniform, norm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 
 def zipoisson(N, lambda_par, psi):
     """Zero inflated Poisson sampler."""
@@ -50,60 +56,73 @@ X = sm.add_constant(X)
 
 mydata = {}                                # build data dictionary
 mydata['N'] = nobs                         # sample size
-mydata['Xb'] = X                           # predictors         
-mydata['Xc'] = X
+mydata['X'] = X                            # predictors
 mydata['Y'] = zipy                         # response variable
-mydata['Kb'] = X.shape[1]                  # number of coefficients
-mydata['Kc'] = X.shape[1]
+mydata['K'] = X.shape[1]                   # number of coefficients
 
 # Fit
 stan_code = """
+functions{
+    int num_zeros(int[] y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
+    }
+}
 data{
     int N;
-    int Kb;
-    int Kc;
-    matrix[N, Kb] Xb;
-    matrix[N, Kc] Xc;
+    int K;
+    matrix[N, K] X;
     int Y[N];
 }
-parameters{
-    vector[Kc] beta;
-    vector[Kb] gamma;
-    
+transformed data{
+    int<lower=0> N0 = num_zeros(Y);         // number of zeros
+    int<lower=0> N1 = N - N0;               // number of non-zero counts
+    int<lower=1> Y1[N1];                    // non-zero counts
+    matrix[N0, K] X0;                       // predictors of zeros
+    matrix[N1, K] X1;                       // predictors of non-zero counts
+
+    {
+        int j0 = 1;
+        int j1 = 1;
+
+        for (i in 1:N) {
+            if (Y[i] == 0) {
+                X0[j0] = X[i];
+                j0 += 1;
+            } else {
+                Y1[j1] = Y[i];
+                X1[j1] = X[i];
+                j1 += 1;
+            }
+        }
+    }
 }
-transformed parameters{
-    vector[N] mu;
-    vector[N] Pi;
-
-    mu = exp(Xc * beta);
-    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+parameters{
+    vector[K] beta;
+    vector[K] gamma;
 }
 model{
-    real LL[N];
-
-    for (i in 1:N) {
-        if (Y[i] == 0) {
-            LL[i] = log_sum_exp(bernoulli_lpmf(1|Pi[i]), 
-                               bernoulli_lpmf(0|Pi[i]) + 
-                               poisson_lpmf(Y[i]|mu[i]));
-        } else {
-            LL[i] = bernoulli_lpmf(0|Pi[i]) +
-                               poisson_lpmf(Y[i]|mu[i]);
-        }
-    }
-    
-    target += LL;
+    vector[N0] eta0 = X0 * beta;            // log Poisson mean
+    vector[N0] zeta0 = X0 * gamma;          // logit probability of a structural zero
+
+    // zeros: log(Pi + (1 - Pi) * exp(-mu))
+    target += log_inv_logit(zeta0) + log1p_exp(-exp(eta0) - zeta0);
+
+    // non-zero counts: log(1 - Pi) + log Poisson(Y | mu)
+    target += log1m_inv_logit(X1 * gamma);
+    Y1 ~ poisson_log(X1 * beta);
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
-                  warmup=4000, n_jobs=3)
+fit = stan(model_code=stan_code, data=mydata, iter=5000, chains=3,
+           warmup=4000, n_jobs=3)
 
 # Output
 nlines = 9                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -10,12 +10,18 @@
 # 1 response (y) and 2 explanatory variables (x1, x2)
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from rpy2.robjects import r, FloatVector
 from scipy.stats import uniform, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan, THREADS
+
 
 def gen_zinegbinom(N, mu1, mu2, alpha):
     """Zero inflated negative binomial distribution."""
@@ -53,62 +59,176 @@ X = sm.add_constant(X)
 mydata = {}                                # build data dictionary
 mydata['Y'] = zinby                        # response variable
 mydata['N'] = nobs                         # sample size
-mydata['Xb'] = X                           # predictors         
-mydata['Xc'] = X
-mydata['Kb'] = X.shape[1]                   # number of coefficients
-mydata['Kc'] = X.shape[1] 
+mydata['X'] = X                            # predictors
+mydata['K'] = X.shape[1]                   # number of coefficients
 
 # Fit
 stan_code = """
+functions{
+    int num_zeros(int[] y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
+    }
+}
 data{
     int N;
-    int Kb;
-    int Kc;
-    matrix[N, Kb] Xb;
-    matrix[N, Kc] Xc;
+    int K;
+    matrix[N, K] X;
     int Y[N];
 }
+transformed data{
+    int<lower=0> N0 = num_zeros(Y);         // number of zeros
+    int<lower=0> N1 = N - N0;               // number of non-zero counts
+    int<lower=1> Y1[N1];                    // non-zero counts
+    matrix[N0, K] X0;                       // predictors of zeros
+    matrix[N1, K] X1;                       // predictors of non-zero counts
+
+    {
+        int j0 = 1;
+        int j1 = 1;
+
+        for (i in 1:N) {
+            if (Y[i] == 0) {
+                X0[j0] = X[i];
+                j0 += 1;
+            } else {
+                Y1[j1] = Y[i];
+                X1[j1] = X[i];
+                j1 += 1;
+            }
+        }
+    }
+}
 parameters{
-    vector[Kc] beta;
-    vector[Kb] gamma;
+    vector[K] beta;
+    vector[K] gamma;
     real<lower=0> alpha;
-    
-}
-transformed parameters{
-    vector[N] mu;
-    vector[N] Pi;
-
-    mu = exp(Xc * beta);
-    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
 }
 model{
-    vector[N] LL;
+    vector[N0] eta0 = X0 * beta;            // log NB mean
+    vector[N0] zeta0 = X0 * gamma;          // logit probability of a structural zero
 
     alpha ~ gamma(0.001, 0.001);
 
+    // zeros: log(Pi + (1 - Pi) * NB(0 | mu, 1/alpha)),
+    // with log NB(0 | mu, 1/alpha) = -log(1 + alpha * mu)/alpha
+    target += log_inv_logit(zeta0) +
+              log1p_exp(-log1p_exp(eta0 + log(alpha)) / alpha - zeta0);
+
+    // non-zero counts: log(1 - Pi) + log NB(Y | mu, 1/alpha)
+    target += log1m_inv_logit(X1 * gamma);
+    Y1 ~ neg_binomial_2_log(X1 * beta, 1/alpha);
+}
+"""
 
-    for (i in 1:N) {
-        if (Y[i] == 0) {
-            LL[i] = log_sum_exp(bernoulli_lpmf(1| Pi[i]), 
-                               bernoulli_lpmf(0| Pi[i]) + 
-                               neg_binomial_2_lpmf(Y[i]| mu[i], 1/alpha));
-        } else {
-            LL[i] = bernoulli_lpmf(0| Pi[i]) + 
-                               neg_binomial_2_lpmf(Y[i]| mu[i], 1/alpha);
+# Same model, with the likelihood split in shards of grain observations
+# which map_rect evaluates on several threads per chain
+stan_code_parallel = """
+functions{
+    int num_zeros(int[] y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
+    }
+
+    // log-likelihood of one shard: x_i = {n, n0, Y}, zeros first,
+    // x_r = design matrix of the shard, column-major
+    vector zinb(vector phi, vector theta, real[] x_r, int[] x_i) {
+        int n = x_i[1];
+        int n0 = x_i[2];
+        int K = (num_elements(phi) - 1) / 2;
+        matrix[n, K] Xs = to_matrix(x_r[1:(n * K)], n, K);
+        vector[n] eta = Xs * phi[1:K];
+        vector[n] zeta = Xs * phi[(K + 1):(2 * K)];
+        real alpha = phi[2 * K + 1];
+        real lp = 0;
+
+        if (n0 > 0)
+            lp += sum(log_inv_logit(zeta[1:n0]) +
+                      log1p_exp(-log1p_exp(eta[1:n0] + log(alpha)) / alpha
+                                - zeta[1:n0]));
+        if (n0 < n)
+            lp += sum(log1m_inv_logit(zeta[(n0 + 1):n])) +
+                  neg_binomial_2_log_lpmf(x_i[(n0 + 3):(n + 2)] | 
+                                          eta[(n0 + 1):n], 1/alpha);
+
+        return [lp]';
+    }
+}
+data{
+    int N;
+    int K;
+    matrix[N, K] X;
+    int Y[N];
+    int<lower=1> grain;                     // observations per shard
+}
+transformed data{
+    int<lower=0> N0 = num_zeros(Y);         // number of zeros
+    int S = (N + grain - 1) / grain;        // number of shards
+    int xi[S, grain + 2];
+    real xr[S, grain * K];
+    vector[0] theta[S];                     // no shard-specific parameters
+
+    {
+        int order[N];                       // zeros first
+        int j0 = 1;
+        int j1 = N0 + 1;
+
+        for (i in 1:N) {
+            if (Y[i] == 0) {
+                order[j0] = i;
+                j0 += 1;
+            } else {
+                order[j1] = i;
+                j1 += 1;
+            }
+        }
+
+        for (s in 1:S) {
+            int start = (s - 1) * grain + 1;
+            int end = min(s * grain, N);
+            int n = end - start + 1;
+
+            xi[s] = rep_array(0, grain + 2);
+            xr[s] = rep_array(0.0, grain * K);
+            xi[s, 1] = n;
+            xi[s, 2] = max(0, min(N0, end) - start + 1);
+            xi[s, 3:(n + 2)] = Y[order[start:end]];
+            xr[s, 1:(n * K)] = to_array_1d(X[order[start:end]]);
         }
     }
-    target += LL;
+}
+parameters{
+    vector[K] beta;
+    vector[K] gamma;
+    real<lower=0> alpha;
+}
+model{
+    alpha ~ gamma(0.001, 0.001);
+
+    target += sum(map_rect(zinb, append_row(append_row(beta, gamma), alpha),
+                           theta, xr, xi));
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=7000, chains=3,
-                  warmup=3500, n_jobs=3)
+parallel = False                             # threads within each chain
+grain = 500                                  # observations per shard
+threads = 8                                  # threads per chain
+
+if parallel:
+    mydata['grain'] = grain
+    fit = stan(model_code=stan_code_parallel, data=mydata, compile_args=THREADS,
+               threads=threads, iter=7000, chains=3, warmup=3500, n_jobs=3)
+else:
+    fit = stan(model_code=stan_code, data=mydata, iter=7000, chains=3,
+               warmup=3500, n_jobs=3)
 
 # Output
 nlines = 12                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -11,11 +11,18 @@
 # https://groups.google.com/forum/#!msg/stan-users/X1dBkLNel4s/o4NGTJgsCAAJ
 
 import numpy as np
-import pystan 
+import os
+import sys
 import statsmodels.api as sm
 
 from scipy.stats import uniform, bernoulli, poisson
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from factorized import sample
+from posterior import stansummary
+from stan_cache import stan
+
 def ztp(N, lambda_):
     """Zero truncated Poisson distribution"""
     temp = [poisson.pmf(0, item) for item in lambda_]
@@ -50,50 +57,137 @@ X = sm.add_constant(X)
 mydata = {}                                # build data dictionary
 mydata['Y'] = poy                          # response variable
 mydata['N'] = nobs                         # sample size
-mydata['Xb'] = X                           # predictors         
-mydata['Xc'] = X
-mydata['Kb'] = X.shape[1]                  # number of coefficients
-mydata['Kc'] = X.shape[1] 
+mydata['X'] = X                            # predictors
+mydata['K'] = X.shape[1]                   # number of coefficients
 
 stan_code = """
+functions{
+    int num_zeros(int[] y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
+    }
+}
 data{
     int<lower=0> N;
-    int<lower=0> Kb;
-    int<lower=0> Kc;
-    matrix[N, Kb] Xb;
-    matrix[N, Kc] Xc;
+    int<lower=0> K;
+    matrix[N, K] X;
     int<lower=0> Y[N];
 }
+transformed data{
+    int<lower=0> N1 = N - num_zeros(Y);     // number of positive counts
+    int<lower=1> Y1[N1];                    // positive counts
+    matrix[N1, K] X1;                       // predictors of positive counts
+    int<lower=0, upper=1> Z[N];             // 1 if Y > 0
+
+    {
+        int j = 1;
+
+        for (i in 1:N) {
+            Z[i] = (Y[i] > 0);
+            if (Y[i] > 0) {
+                Y1[j] = Y[i];
+                X1[j] = X[i];
+                j += 1;
+            }
+        }
+    }
+}
 parameters{
-    vector[Kc] beta;
-    vector[Kb] gamma;
+    vector[K] beta;
+    vector[K] gamma;
     real<lower=0, upper=5.0> r;
-    
 }
-transformed parameters{
-    vector[N] mu;
-    vector[N] Pi;
+model{
+    vector[N1] eta1 = X1 * beta;
+
+    Z ~ bernoulli_logit(X * gamma);             // P(Y > 0) = inv_logit(X * gamma)
+    Y1 ~ poisson_log(eta1);
+    target += -sum(log1m_exp(-exp(eta1)));      // truncation at zero
+}
+"""
+
+# The two parts share no parameter: the same model as two smaller programs,
+# sampled concurrently (see auxiliar_functions/factorized.py)
+stan_code_zero = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    matrix[N, K] X;
+    int<lower=0> Y[N];
+}
+transformed data{
+    int<lower=0, upper=1> Z[N];             // 1 if Y > 0
 
-    mu = exp(Xc * beta);
-    for (i in 1:N) Pi[i] = inv_logit(Xb[i] * gamma);
+    for (i in 1:N) Z[i] = (Y[i] > 0);
+}
+parameters{
+    vector[K] gamma;
 }
 model{
-    for (i in 1:N) {
-        (Y[i] == 0) ~ bernoulli(1-Pi[i]);
-        if (Y[i] > 0) Y[i] ~ poisson(mu[i]) T[1,];
+    Z ~ bernoulli_logit(X * gamma);             // P(Y > 0) = inv_logit(X * gamma)
+}
+"""
+
+stan_code_positive = """
+functions{
+    int num_zeros(int[] y) {
+        int n = 0;
+        for (i in 1:num_elements(y)) n += (y[i] == 0);
+        return n;
+    }
+}
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    matrix[N, K] X;
+    int<lower=0> Y[N];
+}
+transformed data{
+    int<lower=0> N1 = N - num_zeros(Y);     // number of positive counts
+    int<lower=1> Y1[N1];                    // positive counts
+    matrix[N1, K] X1;                       // predictors of positive counts
+
+    {
+        int j = 1;
+
+        for (i in 1:N) {
+            if (Y[i] > 0) {
+                Y1[j] = Y[i];
+                X1[j] = X[i];
+                j += 1;
+            }
+        }
     }
 }
+parameters{
+    vector[K] beta;
+    real<lower=0, upper=5.0> r;
+}
+model{
+    vector[N1] eta1 = X1 * beta;
+
+    Y1 ~ poisson_log(eta1);
+    target += -sum(log1m_exp(-exp(eta1)));      // truncation at zero
+}
 """
 
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=mydata, iter=7000, chains=3,
-                  warmup=4000, n_jobs=3)
+split = False                              # fit the two parts separately
+
+if split:
+    fit = sample([(stan_code_positive, mydata), (stan_code_zero, mydata)],
+                 order=['beta', 'gamma', 'r'], iter=7000, chains=3,
+                 warmup=4000, n_jobs=3)
+else:
+    fit = stan(model_code=stan_code, data=mydata, iter=7000, chains=3,
+               warmup=4000, n_jobs=3)
 
 ############### Output
 nlines = 10                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)   
 
@@ -9,10 +9,17 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan 
+import os
+import sys
 
 from scipy.stats import norm, uniform, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from hierarchical import noncentered
+from posterior import stansummary
+from stan_cache import stan
+
 y = [6,11,9,13,17,21,8,10,15,19,7,12,8,5,13,17,5,12,9,10]
 m = [45,54,39,47,29,44,36,57,62,55,66,48,49,39,28,35,39,43,50,36]
 x1 = [1,1,1,1,1,1,1,1,1,1,0,0,0,0,0,0,0,0,0,0]
@@ -28,11 +35,12 @@ model_data['X'] = X                             # covariates
 model_data['K'] = K                             # num. betas
 model_data['m'] = m                             # binomial denominator
 model_data['N'] = len(y)                        # sample size
-model_data['re'] = Groups                       # random effects
+model_data['re'] = np.array(Groups) + 1         # random effects, 1-based
 model_data['b0'] = np.repeat(0, K) 
 model_data['B0'] = np.diag(np.repeat(100, K))
 model_data['a0'] = np.repeat(0, len(y))
 model_data['A0'] = np.diag(np.repeat(1, len(y)))
+model_data['noncentered'] = noncentered(Groups)  # parameterization of a
 
 
 # Fit
@@ -42,26 +50,18 @@ data{
     int<lower=0> K;
     matrix[N, K] X;
     int<lower=0> Y[N];
-    int re[N];
+    int<lower=1, upper=N> re[N];
     int m[N];
     vector[K] b0;
     matrix[K, K] B0;
     vector[N] a0;
     matrix[N, N] A0;
+    int<lower=0, upper=1> noncentered;
 }
 parameters{
     vector[K] beta;
-    vector[N] a;
     real<lower=0> sigma;
-}
-transformed parameters{
-    vector[N] eta;
-    vector[N] p; 
- 
-    eta = X * beta;
-    for (i in 1:N){ 
-        p[i] = eta[i] + a[re[i]+1];
-    }
+    vector<multiplier=(noncentered ? sqrt(sigma) : 1.0)>[N] a;
 }
 model{    
     sigma ~ cauchy(0, 25);
@@ -69,17 +69,17 @@ model{
     beta ~ multi_normal(b0, B0);
     a ~ multi_normal(a0, sigma * A0);
 
-    Y ~ binomial_logit(m, p);  
+    Y ~ binomial_logit(m, X * beta + a[re]);
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=model_data, iter=5000, chains=3, thin=10,
-                  warmup=4000, n_jobs=3)
+fit = stan(model_code=stan_code, data=model_data, iter=2000, chains=3,
+           warmup=1000, n_jobs=3)
 
 # Output
 nlines = 29                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)  
 
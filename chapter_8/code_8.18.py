@@ -8,11 +8,18 @@
 
 
 import numpy as np
-import pystan
+import os
+import sys
 import statsmodels.api as sm
 
 from scipy.stats import norm, uniform, poisson
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from hierarchical import noncentered
+from posterior import stansummary
+from stan_cache import stan, THREADS
+
 # Data
 np.random.seed(1656)                 # set seed to replicate example
 N = 5000                             # number of obs in model 
@@ -39,11 +46,10 @@ model_data['X'] = X
 model_data['K'] = K
 model_data['N'] = N
 model_data['NGroups'] = NGroups
-model_data['re'] = Groups
+model_data['re'] = Groups + 1                    # 1-based group index
 model_data['b0'] = np.repeat(0, K) 
-model_data['B0'] = np.diag(np.repeat(100, K))
-model_data['a0'] = np.repeat(0, NGroups)
-model_data['A0'] = np.diag(np.repeat(1, NGroups))
+model_data['B0'] = np.repeat(100, K)             # prior variances of beta
+model_data['noncentered'] = noncentered(Groups)  # parameterization of a, b
 
 # Fit
 stan_code = """
@@ -53,47 +59,173 @@ data{
     int<lower=0> NGroups;
     matrix[N, K] X;
     int Y[N];
-    int re[N];
-    vector[K] b0;
-    matrix[K, K] B0;
-    vector[NGroups] a0;
-    matrix[NGroups, NGroups] A0;
+    int<lower=1, upper=NGroups> re[N];
+    vector[K] b0;                           # prior means of beta
+    vector<lower=0>[K] B0;                  # prior variances of beta
+    int<lower=0, upper=1> noncentered;
+}
+transformed data{
+    vector[N] x1 = col(X, 2);               # covariate with random slopes
+    vector[K] sd_beta = sqrt(B0);
 }
 parameters{
     vector[K] beta;
-    vector[NGroups] a;
-    vector[NGroups] b;
     real<lower=0> sigma_ri;
     real<lower=0> sigma_rs;
+    vector<multiplier=(noncentered ? sqrt(sigma_ri) : 1.0)>[NGroups] a;
+    vector<multiplier=(noncentered ? sqrt(sigma_rs) : 1.0)>[NGroups] b;
 }
-transformed parameters{
-    vector[N] eta;
-    vector[N] mu; 
- 
-    eta = X * beta;
-    for (i in 1:N){ 
-        mu[i] = exp(eta[i] + a[re[i]+1] + b[re[i] + 1] * X[i,2]);
+model{    
+    sigma_ri ~ gamma(0.01, 0.01);
+    sigma_rs ~ gamma(0.01, 0.01);
+
+    beta ~ normal(b0, sd_beta);
+    a ~ normal(0, sqrt(sigma_ri));
+    b ~ normal(0, sqrt(sigma_rs));
+
+    Y ~ poisson_log(X * beta + a[re] + b[re] .* x1);
+}
+"""
+
+# Same model, with the likelihood split in shards of grain observations
+# which map_rect evaluates on several threads per chain
+stan_code_parallel = """
+functions{
+    // log-likelihood of one shard: x_i = {n, K, NGroups, Y, re},
+    // x_r = design matrix of the shard, column-major
+    vector poisson_ris(vector phi, vector theta, real[] x_r, int[] x_i) {
+        int n = x_i[1];
+        int K = x_i[2];
+        int J = x_i[3];
+        int grain = (num_elements(x_i) - 3) / 2;
+        int g[n] = x_i[(grain + 4):(grain + n + 3)];
+        matrix[n, K] Xs = to_matrix(x_r[1:(n * K)], n, K);
+        vector[J] a = phi[(K + 1):(K + J)];
+        vector[J] b = phi[(K + J + 1):(K + 2 * J)];
+
+        return [poisson_log_lpmf(x_i[4:(n + 3)] | 
+                                 Xs * phi[1:K] + a[g] + b[g] .* col(Xs, 2))]';
     }
 }
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    int<lower=0> NGroups;
+    matrix[N, K] X;
+    int Y[N];
+    int<lower=1, upper=NGroups> re[N];
+    vector[K] b0;                           # prior means of beta
+    vector<lower=0>[K] B0;                  # prior variances of beta
+    int<lower=0, upper=1> noncentered;
+    int<lower=1> grain;                     # observations per shard
+}
+transformed data{
+    vector[K] sd_beta = sqrt(B0);
+    int S = (N + grain - 1) / grain;        # number of shards
+    int xi[S, 2 * grain + 3];
+    real xr[S, grain * K];
+    vector[0] theta[S];                     # no shard-specific parameters
+
+    for (s in 1:S) {
+        int start = (s - 1) * grain + 1;
+        int end = min(s * grain, N);
+        int n = end - start + 1;
+
+        xi[s] = rep_array(0, 2 * grain + 3);
+        xr[s] = rep_array(0.0, grain * K);
+        xi[s, 1:3] = {n, K, NGroups};
+        xi[s, 4:(n + 3)] = Y[start:end];
+        xi[s, (grain + 4):(grain + n + 3)] = re[start:end];
+        xr[s, 1:(n * K)] = to_array_1d(X[start:end]);
+    }
+}
+parameters{
+    vector[K] beta;
+    real<lower=0> sigma_ri;
+    real<lower=0> sigma_rs;
+    vector<multiplier=(noncentered ? sqrt(sigma_ri) : 1.0)>[NGroups] a;
+    vector<multiplier=(noncentered ? sqrt(sigma_rs) : 1.0)>[NGroups] b;
+}
 model{    
     sigma_ri ~ gamma(0.01, 0.01);
     sigma_rs ~ gamma(0.01, 0.01);
 
-    beta ~ multi_normal(b0, B0);
-    a ~ multi_normal(a0, sigma_ri * A0);
-    b ~ multi_normal(a0, sigma_rs * A0);
+    beta ~ normal(b0, sd_beta);
+    a ~ normal(0, sqrt(sigma_ri));
+    b ~ normal(0, sqrt(sigma_rs));
+
+    target += sum(map_rect(poisson_ris, append_row(beta, append_row(a, b)),
+                           theta, xr, xi));
+}
+"""
 
-    Y ~ poisson(mu);  
+# Random intercepts and slopes drawn jointly, with their correlation:
+# non-centered effects z scaled by the standard deviations tau and the
+# Cholesky factor L of the correlation matrix, with an LKJ prior on L
+stan_code_lkj = """
+data{
+    int<lower=0> N;
+    int<lower=0> K;
+    int<lower=0> NGroups;
+    matrix[N, K] X;
+    int Y[N];
+    int<lower=1, upper=NGroups> re[N];
+    vector[K] b0;                           # prior means of beta
+    vector<lower=0>[K] B0;                  # prior variances of beta
+}
+transformed data{
+    vector[N] x1 = col(X, 2);               # covariate with random slopes
+    vector[K] sd_beta = sqrt(B0);
+}
+parameters{
+    vector[K] beta;
+    vector<lower=0>[2] tau;                 # sd of intercepts and slopes
+    cholesky_factor_corr[2] L;              # their correlation
+    matrix[2, NGroups] z;                   # standardized group effects
+}
+model{
+    matrix[2, NGroups] ab = diag_pre_multiply(tau, L) * z;
+
+    tau ~ cauchy(0, 25);
+    L ~ lkj_corr_cholesky(2);
+    to_vector(z) ~ std_normal();
+    beta ~ normal(b0, sd_beta);
+
+    Y ~ poisson_log(X * beta + to_vector(ab[1, re]) + to_vector(ab[2, re]) .* x1);
+}
+generated quantities{
+    vector[NGroups] a;                      # random intercepts
+    vector[NGroups] b;                      # random slopes
+    corr_matrix[2] rho = multiply_lower_tri_self_transpose(L);
+    {
+        matrix[2, NGroups] ab = diag_pre_multiply(tau, L) * z;
+        a = ab[1]';
+        b = ab[2]';
+    }
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=model_data, iter=4000, chains=3, thin=10,
-                  warmup=3000, n_jobs=3)
+parallel = False                             # threads within each chain
+correlated = False                           # correlated intercepts and slopes
+grain = 500                                  # observations per shard
+threads = 8                                  # threads per chain
+
+if parallel:
+    model_data['grain'] = grain
+    fit = stan(model_code=stan_code_parallel, data=model_data, compile_args=THREADS,
+               threads=threads, iter=2000, chains=3, warmup=1000, n_jobs=3)
+elif correlated:
+    fit = stan(model_code=stan_code_lkj, data=model_data,
+               pars=['beta', 'tau', 'a', 'b', 'rho'], iter=2000, chains=3,
+               warmup=1000, n_jobs=3)
+else:
+    fit = stan(model_code=stan_code, data=model_data, iter=2000, chains=3,
+               warmup=1000, n_jobs=3)
 
 # Output
-nlines = 30                                  # number of lines in screen output
+nlines = 34 if correlated else 30           # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 
 for item in output[:nlines]:
     print(item)  
@@ -26,7 +26,14 @@ y = nbinom.rvs(mu, 0.5)
 
 
 # Code 8.23 Random intercept negative binomial model in Python using Stan
-import pystan
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from hierarchical import noncentered
+from posterior import stansummary
+from stan_cache import stan
 
 X = sm.add_constant(np.column_stack((x1,x2)))
 K = X.shape[1]
@@ -38,11 +45,12 @@ model_data['X'] = X
 model_data['K'] = K
 model_data['N'] = N
 model_data['NGroups'] = NGroups
-model_data['re'] = Groups
+model_data['re'] = Groups + 1                    # 1-based group index
 model_data['b0'] = np.repeat(0, K) 
 model_data['B0'] = np.diag(np.repeat(100, K))
 model_data['a0'] = np.repeat(0, NGroups)
 model_data['A0'] = np.diag(np.repeat(1, NGroups))
+model_data['noncentered'] = noncentered(Groups)  # parameterization of a
 
 
 # Fit
@@ -53,27 +61,19 @@ data{
     int<lower=0> NGroups;
     matrix[N, K] X;
     int Y[N];
-    int re[N];
+    int<lower=1, upper=NGroups> re[N];
     vector[K] b0;
     matrix[K, K] B0;
     vector[NGroups] a0;
     matrix[NGroups, NGroups] A0;
+    int<lower=0, upper=1> noncentered;
 }
 parameters{
     vector[K] beta;
-    vector[NGroups] a;
     real<lower=0> sigma_re;
+    vector<multiplier=(noncentered ? sqrt(sigma_re) : 1.0)>[NGroups] a;
     real<lower=0> alpha;
 }
-transformed parameters{
-    vector[N] eta;
-    vector[N] mu; 
- 
-    eta = X * beta;
-    for (i in 1:N){ 
-        mu[i] = exp(eta[i] + a[re[i]+1]);
-    }
-}
 model{    
 
     sigma_re ~ cauchy(0, 25);
@@ -82,17 +82,17 @@ model{
     beta ~ multi_normal(b0, B0);
     a ~ multi_normal(a0, sigma_re * A0);    
 
-    Y ~ neg_binomial(mu, alpha/(1.0 - alpha));  
+    Y ~ neg_binomial(exp(X * beta + a[re]), alpha/(1.0 - alpha));
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=model_data, iter=5000, chains=3, thin=10,
-                  warmup=4000, n_jobs=3)
+fit = stan(model_code=stan_code, data=model_data, iter=2000, chains=3,
+           warmup=1000, n_jobs=3)
 
 # Output
 nlines = 20                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 
 for item in output[:nlines]:
     print(item)  
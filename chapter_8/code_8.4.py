@@ -8,10 +8,17 @@
 
 import numpy as np
 import statsmodels.api as sm
-import pystan
+import os
+import sys
 
 from scipy.stats import norm, uniform
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from hierarchical import noncentered
+from posterior import stansummary
+from stan_cache import stan
+
 # Data
 np.random.seed(1656)                 # set seed to replicate example
 N = 4500                           # number of obs in model 
@@ -43,11 +50,12 @@ model_data['X'] = X
 model_data['K'] = K
 model_data['N'] = N
 model_data['NGroups'] = NGroups
-model_data['re'] = re
+model_data['re'] = re + 1                        # 1-based group index
 model_data['b0'] = np.repeat(0, K) 
 model_data['B0'] = np.diag(np.repeat(100, K))
 model_data['a0'] = np.repeat(0, Nre)
 model_data['A0'] = np.diag(np.repeat(1, Nre))
+model_data['noncentered'] = noncentered(re)       # parameterization of a
 
 
 # Fit
@@ -58,26 +66,18 @@ data{
     int<lower=0> NGroups;
     matrix[N, K] X;
     real Y[N];
-    int re[N];
+    int<lower=1, upper=NGroups> re[N];
     vector[K] b0;
     matrix[K, K] B0;
     vector[NGroups] a0;
     matrix[NGroups, NGroups] A0;
+    int<lower=0, upper=1> noncentered;
 }
 parameters{
     vector[K] beta;
-    vector[NGroups] a;
     real<lower=0> sigma_plot;
     real<lower=0> sigma_eps;
-}
-transformed parameters{
-    vector[N] eta;
-    vector[N] mu; 
- 
-    eta = X * beta;
-    for (i in 1:N){ 
-        mu[i] = eta[i] + a[re[i]+1];
-    }
+    vector<multiplier=(noncentered ? sqrt(sigma_plot) : 1.0)>[NGroups] a;
 }
 model{    
     sigma_plot ~ cauchy(0, 25);
@@ -86,16 +86,16 @@ model{
     beta ~ multi_normal(b0, B0);
     a ~ multi_normal(a0, sigma_plot * A0);
 
-    Y ~ normal(mu, sigma_eps);  
+    Y ~ normal(X * beta + a[re], sigma_eps);
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=model_data, iter=10000, chains=3, thin=10,
-                  warmup=6000, n_jobs=3)
+fit = stan(model_code=stan_code, data=model_data, iter=2000, chains=3,
+           warmup=1000, n_jobs=3)
 
 # Output
 nlines = 30                                  # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 for item in output[:nlines]:
     print(item)  
@@ -7,11 +7,17 @@
 # Code 9.4 - K and M model in Python using Stan
 
 import numpy as np
-import pystan
+import os
+import sys
 
 from scipy.linalg import toeplitz
 from scipy.stats import norm, uniform, nbinom, multivariate_normal, bernoulli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))   # or wherever you stored the file
+from posterior import stansummary
+from stan_cache import stan
+
 # Data
 np.random.seed(1056)
 
@@ -55,41 +61,41 @@ data{
     vector[N] Y;
     int Ind[K];
 }
+transformed data{
+    int shrink[sum(Ind)];           // coefficients with a shrinkage prior
+    int j = 1;
+
+    for (i in 1:K) {
+        if (Ind[i] > 0) {
+            shrink[j] = i;
+            j += 1;
+        }
+    }
+}
 parameters{
     vector[K] beta;
     real<lower=0> sigma; 
     real<lower=0> sdBeta;
 }
-transformed parameters{
-    vector[N] mu;
-    real<lower=0> tau;
-    real<lower=0> tauBeta;
-
-    mu = X * beta;
-    tau = pow(sigma, 2);
-    tauBeta = pow(sdBeta, 2);
-}
 model{
 
     sdBeta ~ gamma(0.01, 0.01);
 
-    for (i in 1:K){
-        if (Ind[i] > 0) beta[i] ~ normal(0, tauBeta);
-    }
+    beta[shrink] ~ normal(0, square(sdBeta));
  
     sigma ~  gamma(0.01, 0.01);
 
-    Y ~ normal(mu, tau);
+    Y ~ normal(X * beta, square(sigma));
 }
 '''
 
-fit = pystan.stan(model_code=stan_model, data=mydata, iter=5000, chains=3, thin=1,
-                  warmup=2500, n_jobs=3)
+fit = stan(model_code=stan_model, data=mydata, iter=5000, chains=3, thin=1,
+           warmup=2500, n_jobs=3)
 
 # Output
 nlines = 21                                 # number of lines in screen output
 
-output = str(fit).split('\n')
+output = stansummary(fit, max_rows=nlines - 5).split('\n')
 
 for item in output[:nlines]:
     print(item)  
@@ -0,0 +1,117 @@
+"""
+Smoke test of checkpointed runs (run_length.sample_until): a run which
+stops after some segments and is restarted draws the same values as a
+run which was never interrupted, also in the store and the online
+summary filled while sampling.
+
+Usage (needs pystan):
+
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pystan')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+import run_length
+from draw_store import open_store
+from posterior import draws
+from stan_cache import compile_model, sampling
+
+
+stan_code = """
+data{
+    int<lower=0> N;
+    vector[N] y;
+}
+parameters{
+    real mu;
+    real<lower=0> sigma;
+}
+model{
+    y ~ normal(mu, sigma);
+}
+generated quantities{
+    vector[N] x;
+    for (i in 1:N)
+        x[i] = normal_rng(mu, sigma);
+}
+"""
+
+options = {'iter': 700, 'warmup': 200, 'chains': 2, 'n_jobs': 1, 'seed': 3,
+           'targets': {'segment': 100, 'rhat': 0.0}}
+
+
+@pytest.fixture(scope='module')
+def problem():
+    rng = np.random.RandomState(42)
+    return compile_model(stan_code), {'N': 50, 'y': rng.normal(1, 2, size=50)}
+
+
+def test_segments(problem):
+    model, data = problem
+    fit = sampling(model, data, **options)
+
+    assert fit.sim['n_save'] == [700, 700]
+    assert all(len(params[0]) == 700 for params in fit.get_sampler_params())
+    assert run_length.report(fit).startswith(
+        'Sampling stopped after 500 post-warmup iterations (5 segments)')
+
+
+def interrupted(model, data, checkpoint, monkeypatch, **kwargs):
+    """Run killed after two appended segments, then restarted."""
+
+    calls = []
+    append = run_length._append
+
+    def crash(fit, segment, seed=None):
+        calls.append(seed)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        append(fit, segment, seed)
+
+    monkeypatch.setattr(run_length, '_append', crash)
+    with pytest.raises(KeyboardInterrupt):
+        sampling(model, data, checkpoint=checkpoint, **kwargs)
+    assert len(os.listdir(checkpoint)) == 1
+
+    monkeypatch.setattr(run_length, '_append', append)
+    fit = sampling(model, data, checkpoint=checkpoint, **kwargs)
+    assert os.listdir(checkpoint) == []
+
+    return fit
+
+
+def test_resume(problem, tmp_path, monkeypatch):
+    model, data = problem
+    reference = sampling(model, data, **options)
+    fit = interrupted(model, data, str(tmp_path / 'checkpoint'), monkeypatch,
+                      **options)
+
+    assert np.array_equal(draws(fit, ['mu', 'sigma', 'lp__'])[1],
+                          draws(reference, ['mu', 'sigma', 'lp__'])[1])
+
+
+def test_resume_store(problem, tmp_path, monkeypatch):
+    model, data = problem
+    streamed = dict(options, exclude=['x'], store_pars=['x'], online=True)
+    reference = sampling(model, data, store=str(tmp_path / 'reference'), **streamed)
+    fit = interrupted(model, data, str(tmp_path / 'checkpoint'), monkeypatch,
+                      store=str(tmp_path / 'store'), **streamed)
+
+    for path in ('reference', 'store'):
+        with open(str(tmp_path / path / 'header.json')) as f:
+            assert json.load(f)['counts'] == [500, 500]
+    assert np.array_equal(open_store(str(tmp_path / 'store')).draws('x'),
+                          open_store(str(tmp_path / 'reference')).draws('x'))
+
+    assert fit.sim['online'].n == reference.sim['online'].n == 1000
+    assert np.allclose(fit.sim['online'].summary()['mean'],
+                       reference.sim['online'].summary()['mean'])
@@ -0,0 +1,67 @@
+"""
+Smoke test of warm_start.warm_start on a small regression: the initial
+values and the inverse metric have the expected shapes and values, and
+NUTS accepts them.
+
+Usage (needs pystan and statsmodels):
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pystan')
+pytest.importorskip('statsmodels')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'auxiliar_functions'))
+from stan_cache import compile_model, sampling
+from warm_start import warm_start
+
+
+stan_code = """
+data{
+    int<lower=0> N;
+    vector[N] x;
+    vector[N] y;
+}
+parameters{
+    real alpha;
+    real beta;
+    real<lower=0> sigma;
+}
+model{
+    y ~ normal(alpha + beta * x, sigma);
+}
+"""
+
+
+@pytest.fixture(scope='module')
+def problem():
+    rng = np.random.RandomState(42)
+    x = rng.uniform(size=100)
+    data = {'N': 100, 'x': x, 'y': 1 + 2 * x + rng.normal(0, 0.5, size=100)}
+    return compile_model(stan_code), data
+
+
+def test_warm_start(problem):
+    model, data = problem
+    guess = warm_start(model, data, chains=3, seed=1)
+
+    assert len(guess['init']) == 3
+    assert all(set(init) == {'alpha', 'beta', 'sigma'} for init in guess['init'])
+    assert all(init['sigma'] > 0 for init in guess['init'])
+    assert guess['inv_metric'].shape == (3,)
+    assert np.all(np.isfinite(guess['inv_metric']) & (guess['inv_metric'] > 0))
+
+
+def test_sampling_with_warm_start(problem):
+    model, data = problem
+    fit = sampling(model, data, warm_start=True, iter=400, warmup=200,
+                   chains=2, n_jobs=1, seed=1)
+
+    assert abs(fit.extract()['beta'].mean() - 2) < 0.5